@@ -2,21 +2,28 @@
 
 import argparse
 import logging
+import re
 import sys
+import time
 from pathlib import Path
 
-from cport.modules.loader import run_prediction
+from cport.modules.batch import read_manifest, run_batch, run_entries
+from cport.modules.cache import ResultCache
+from cport.modules.detached import RUN_FILE, add_entries, load_run, save_run
+from cport.modules.engine import export_model
+from cport.modules.journal import JOURNAL_NAME, JobJournal
+from cport.modules.pipeline import process_pool
+from cport.modules.planner import Planner, minimal_predictors
 from cport.modules.predict import (
+    MODEL_OUTPUTS,
     scriber_ispred4_scannet_sppider,
     scriber_ispred4_sppider_csm_potential_scannet,
 )
-from cport.modules.threadreturn import ThreadReturnVal
+from cport.modules.registry import MODEL_DIR, get_model
+from cport.modules.rescore import find_tables, rescore_tables
 from cport.modules.utils import format_output
 from cport.version import VERSION
 
-from cport.exceptions import ServerConnectionException
-from cport.exceptions import ChainException
-
 # Setup logging
 log = logging.getLogger("cportlog")
 ch = logging.StreamHandler()
@@ -45,6 +52,20 @@ CONFIG = {
     ],
 }
 
+VALIDATED_PREDICTORS = [
+    "scriber",
+    "sppider",
+    "scannet",
+    "ispred4",
+]
+
+# The features of the ML models follow this order
+PREDICTOR_ORDER = VALIDATED_PREDICTORS + [
+    item for item in CONFIG["predictors"] if item not in VALIDATED_PREDICTORS
+]
+
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "": 1}
+
 ML_PREDICTION = {
     scriber_ispred4_scannet_sppider: {
         "needed": ["scriber", "ispred4", "scannet", "sppider"],
@@ -54,6 +75,42 @@ ML_PREDICTION = {
     },
 }
 
+MODELS = {model.__name__: model for model in ML_PREDICTION}
+
+
+def duration_type(value):
+    """
+    Parse a duration such as `90`, `20m` or `1h30m` into seconds.
+
+    Parameters
+    ----------
+    value : str
+        The duration as given in the command line.
+
+    Returns
+    -------
+    seconds : float
+        The duration in seconds.
+
+    Raises
+    ------
+    argparse.ArgumentTypeError
+        If the duration cannot be parsed or is not positive.
+
+    """
+    parts = re.findall(r"(\d+(?:\.\d+)?)([hms]?)", value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        raise argparse.ArgumentTypeError(
+            f"invalid duration {value}, expected e.g. 90, 20m or 1h30m"
+        )
+    seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError(
+            f"invalid duration {value}, expected e.g. 90, 20m or 1h30m"
+        )
+    return seconds
+
+
 # ===========================================================================================================
 # Define arguments
 argument_parser = argparse.ArgumentParser()
@@ -80,9 +137,16 @@ argument_parser.add_argument(
 argument_parser.add_argument(
     "--pred",
     nargs="+",
-    default=["validated"],
     choices=CONFIG["predictors"] + ["all"] + ["validated"],
-    help="",
+    help="predictors to run, defaults to validated or to the ones the models need",
+)
+
+argument_parser.add_argument(
+    "--model",
+    nargs="+",
+    choices=list(MODELS),
+    help="only run the predictors these ML models need, each model runs as soon "
+    "as its predictors finished",
 )
 
 
@@ -101,8 +165,286 @@ argument_parser.add_argument(
     help="results output directory",
 )
 
+argument_parser.add_argument(
+    "--journal",
+    help=f"job journal used to resume a run, defaults to output_dir/{JOURNAL_NAME}",
+)
+
+argument_parser.add_argument(
+    "--cache_dir",
+    help="directory of the result cache, defaults to $CPORT_CACHE_DIR or ~/.cache/cport",
+)
+
+cache_group = argument_parser.add_mutually_exclusive_group()
+cache_group.add_argument(
+    "--no_cache",
+    action="store_true",
+    help="do not use the result cache",
+)
+
+cache_group.add_argument(
+    "--cache_only",
+    action="store_true",
+    help="only use cached results, report the misses without contacting the servers",
+)
+
+argument_parser.add_argument(
+    "--deadline",
+    type=duration_type,
+    help="abandon the predictors still running after this long (e.g. 20m, 1h30m) "
+    "and write the results of the finished ones",
+)
+
+
+def limit_type(value):
+    """
+    Parse a `predictor=N` in-flight limit.
+
+    Parameters
+    ----------
+    value : str
+        The limit as given in the command line.
+
+    Returns
+    -------
+    limit : tuple
+        The predictor name and its limit.
+
+    Raises
+    ------
+    argparse.ArgumentTypeError
+        If the limit is not in the `predictor=N` format.
 
-def load_args(arguments):
+    """
+    predictor, _, number = value.partition("=")
+    if predictor not in CONFIG["predictors"] or not number.isdigit() or not int(number):
+        raise argparse.ArgumentTypeError(
+            f"invalid limit {value}, expected predictor=N with N > 0"
+        )
+    return predictor, int(number)
+
+
+# Batch mode arguments
+batch_argument_parser = argparse.ArgumentParser(prog="cport batch")
+batch_argument_parser.add_argument(
+    "manifest",
+    help="tab-separated file with pdb_file, chain_id and optional predictors rows",
+)
+
+batch_argument_parser.add_argument(
+    "--pred",
+    nargs="+",
+    choices=CONFIG["predictors"] + ["all"] + ["validated"],
+    help="predictors for the rows that do not list any",
+)
+
+batch_argument_parser.add_argument(
+    "--model",
+    nargs="+",
+    choices=list(MODELS),
+    help="only run the predictors these ML models need, each model runs as soon "
+    "as its predictors finished",
+)
+
+batch_argument_parser.add_argument(
+    "--limit",
+    nargs="+",
+    default=[],
+    type=limit_type,
+    help="maximum number of jobs in flight per server, e.g. scriber=4",
+)
+
+batch_argument_parser.add_argument(
+    "--num_workers",
+    type=int,
+    help="number of threads shared by all the server requests",
+)
+
+batch_argument_parser.add_argument(
+    "--num_processes",
+    type=int,
+    help="number of processes parsing the results and running the ML models, "
+    "0 to keep them in the main process, defaults to the number of cores",
+)
+
+batch_argument_parser.add_argument(
+    "-o",
+    "--output_dir",
+    default="output",
+    help="results output directory",
+)
+
+batch_argument_parser.add_argument(
+    "--journal",
+    help=f"job journal used to resume a run, defaults to output_dir/{JOURNAL_NAME}",
+)
+
+batch_argument_parser.add_argument(
+    "--cache_dir",
+    help="directory of the result cache, defaults to $CPORT_CACHE_DIR or ~/.cache/cport",
+)
+
+batch_cache_group = batch_argument_parser.add_mutually_exclusive_group()
+batch_cache_group.add_argument(
+    "--no_cache",
+    action="store_true",
+    help="do not use the result cache",
+)
+
+batch_cache_group.add_argument(
+    "--cache_only",
+    action="store_true",
+    help="only use cached results, report the misses without contacting the servers",
+)
+
+batch_argument_parser.add_argument(
+    "--deadline",
+    type=duration_type,
+    help="abandon the predictors still running after this long (e.g. 20m, 1h30m) "
+    "and write the results of the finished ones",
+)
+
+
+# Detached mode arguments
+submit_argument_parser = argparse.ArgumentParser(prog="cport submit")
+submit_argument_parser.add_argument(
+    "pdb_file",
+    nargs="?",
+    help="",
+)
+
+submit_argument_parser.add_argument(
+    "chain_id",
+    nargs="?",
+    help="",
+)
+
+submit_argument_parser.add_argument(
+    "--manifest",
+    help="tab-separated file with pdb_file, chain_id and optional predictors rows",
+)
+
+submit_argument_parser.add_argument(
+    "--pred",
+    nargs="+",
+    choices=CONFIG["predictors"] + ["all"] + ["validated"],
+    help="predictors to run, defaults to validated or to the ones the models need",
+)
+
+submit_argument_parser.add_argument(
+    "--model",
+    nargs="+",
+    choices=list(MODELS),
+    help="only run the predictors these ML models need",
+)
+
+submit_argument_parser.add_argument(
+    "--limit",
+    nargs="+",
+    default=[],
+    type=limit_type,
+    help="maximum number of jobs in flight per server, e.g. scriber=4",
+)
+
+submit_argument_parser.add_argument(
+    "--num_workers",
+    type=int,
+    help="number of threads shared by all the server requests",
+)
+
+submit_argument_parser.add_argument(
+    "-o",
+    "--output_dir",
+    default="output",
+    help=f"results output directory, the run is recorded in output_dir/{RUN_FILE}",
+)
+
+submit_argument_parser.add_argument(
+    "--journal",
+    help=f"job journal of the run, defaults to output_dir/{JOURNAL_NAME}",
+)
+
+submit_argument_parser.add_argument(
+    "--cache_dir",
+    help="directory of the result cache, defaults to $CPORT_CACHE_DIR or ~/.cache/cport",
+)
+
+collect_argument_parser = argparse.ArgumentParser(prog="cport collect")
+collect_argument_parser.add_argument(
+    "-o",
+    "--output_dir",
+    default="output",
+    help="results output directory given to cport submit",
+)
+
+collect_argument_parser.add_argument(
+    "--num_workers",
+    type=int,
+    help="number of threads shared by all the server requests",
+)
+
+collect_argument_parser.add_argument(
+    "--journal",
+    help=f"job journal of the run, defaults to output_dir/{JOURNAL_NAME}",
+)
+
+collect_argument_parser.add_argument(
+    "--cache_dir",
+    help="directory of the result cache, defaults to $CPORT_CACHE_DIR or ~/.cache/cport",
+)
+
+# Rescore mode arguments
+rescore_argument_parser = argparse.ArgumentParser(prog="cport rescore")
+rescore_argument_parser.add_argument(
+    "tables",
+    nargs="+",
+    help="predictors tables, or directories searched for predictors_*.csv",
+)
+
+rescore_argument_parser.add_argument(
+    "--model",
+    choices=list(MODELS),
+    default="scriber_ispred4_scannet_sppider",
+    help="ML model applied to the tables",
+)
+
+rescore_argument_parser.add_argument(
+    "--threshold",
+    type=float,
+    default=0.6,
+    help="probability above which a residue is predicted active",
+)
+
+rescore_argument_parser.add_argument(
+    "--batch_residues",
+    type=int,
+    help="residues given to the model in one call, defaults to "
+    "$CPORT_RESCORE_BATCH or 65536",
+)
+
+rescore_argument_parser.add_argument(
+    "-o",
+    "--output_dir",
+    help="output directory, in the layout of the tables, defaults to the "
+    "directory of each table",
+)
+
+# Export mode arguments
+export_argument_parser = argparse.ArgumentParser(prog="cport export")
+export_argument_parser.add_argument(
+    "model",
+    nargs="*",
+    help=f"ML models to export for the numpy engine ({', '.join(MODELS)}), "
+    "defaults to all of them",
+)
+
+export_argument_parser.add_argument(
+    "--model_dir",
+    help="directory of the SavedModels, defaults to $CPORT_MODEL_DIR or model",
+)
+
+
+def load_args(arguments, argv=None):
     """
     Load argument parser.
 
@@ -110,6 +452,8 @@ def load_args(arguments):
     ----------
     arguments : argparse.ArgumentParser
         Argument parser.
+    argv : list
+        Arguments to parse, defaults to the command line.
 
     Returns
     -------
@@ -117,12 +461,12 @@ def load_args(arguments):
         Parsed command-line arguments.
 
     """
-    return arguments.parse_args()
+    return arguments.parse_args(argv)
 
 
 # ====================================================================================#
 # Define CLI
-def cli(arguments, main_func):
+def cli(arguments, main_func, argv=None):
     """
     Command-line interface entry point.
 
@@ -132,20 +476,221 @@ def cli(arguments, main_func):
         Argument parser.
     main_func : function
         Main function.
+    argv : list
+        Arguments to parse, defaults to the command line.
 
     """
-    cmd = load_args(arguments)
+    cmd = load_args(arguments, argv)
     main_func(**vars(cmd))
 
 
 def maincli():
     """Execute main client."""
-    cli(argument_parser, main)
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        arguments, main_func = SUBCOMMANDS[sys.argv[1]]
+        cli(arguments, main_func, sys.argv[2:])
+    else:
+        cli(argument_parser, main)
+
+
+def expand_predictors(pred):
+    """
+    Expand the `all` and `validated` shortcuts into predictor names.
+
+    Parameters
+    ----------
+    pred : list
+        List of predictors to run.
+
+    Returns
+    -------
+    pred : list
+        List of predictor names.
+
+    """
+    if "all" in pred:
+        pred = CONFIG["predictors"]
+
+    if "validated" in pred:
+        pred = VALIDATED_PREDICTORS
+
+    return pred
+
+
+def model_plan(pred, model):
+    """
+    Find the predictors to run and the ML models of a request.
+
+    Without `model`, every ML model whose predictors returned a result runs.
+    With it, only these models run and the predictors they need are added to
+    `pred`; if no predictor was asked for, the predictors table is not a
+    requested output, and the jobs of a model that cannot run are cancelled.
+
+    Parameters
+    ----------
+    pred : list
+        List of predictors to run, None for the default ones.
+    model : list
+        Names of the ML models to apply, None for all of them.
+
+    Returns
+    -------
+    pred : list
+        List of predictor names.
+    models : dict
+        The ML models to run, each with the list of predictors it `needed`.
+    keep_predictors : bool
+        Whether the predictors table is a requested output.
+
+    """
+    if not model:
+        return expand_predictors(pred or ["validated"]), ML_PREDICTION, True
+
+    models = {MODELS[name]: ML_PREDICTION[MODELS[name]] for name in model}
+    needed = minimal_predictors(models, PREDICTOR_ORDER)
+    if pred is None:
+        return needed, models, False
+
+    pred = expand_predictors(pred)
+    return pred + [item for item in needed if item not in pred], models, True
+
+
+def plan_models(pred, model, executor=None):
+    """
+    Find the predictors to run and plan the ML models, see `model_plan`.
+
+    Parameters
+    ----------
+    pred : list
+        List of predictors to run, None for the default ones.
+    model : list
+        Names of the ML models to apply, None for all of them.
+    executor : concurrent.futures.Executor
+        Executor running the models, defaults to a thread of the planner.
+
+    Returns
+    -------
+    pred : list
+        List of predictor names.
+    planner : Planner
+        The planner of the ML models.
+
+    """
+    planned, models, keep_predictors = model_plan(pred, model)
+    if model and pred is None:
+        log.info(f"Running the predictors needed by the models: {', '.join(planned)}")
+    return planned, Planner(models, keep_predictors=keep_predictors, executor=executor)
+
+
+def open_journal(journal, output_dir):
+    """
+    Open the job journal, resuming the jobs left by a previous run.
+
+    Parameters
+    ----------
+    journal : str
+        Path to the job journal, None for the default one.
+    output_dir: str
+        Results output directory.
+
+    Returns
+    -------
+    job_journal : JobJournal
+        The opened journal.
+
+    """
+    job_journal = JobJournal(journal or Path(output_dir, JOURNAL_NAME))
+    outstanding = job_journal.outstanding()
+    if outstanding:
+        log.info(f"Found {len(outstanding)} outstanding jobs in {job_journal.path}")
+    return job_journal
+
+
+def open_cache(cache_dir, no_cache, cache_only):
+    """
+    Open the result cache.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the result cache, None for the default one.
+    no_cache : bool
+        Do not use the result cache.
+    cache_only : bool
+        Only use cached results, without contacting the servers.
+
+    Returns
+    -------
+    result_cache : ResultCache or None
+        The opened cache, None if it is disabled.
+
+    Raises
+    ------
+    ValueError
+        If the cache is both disabled and the only source of results.
+
+    """
+    if no_cache and cache_only:
+        raise ValueError("no_cache and cache_only cannot be used together")
+    if no_cache:
+        return None
+
+    return ResultCache(cache_dir, offline=cache_only)
+
+
+def output_results(result_dic, pdb_file, chain_id, output_dir):
+    """
+    Write the predictors table.
+
+    Parameters
+    ----------
+    result_dic : dict
+        The results dictionary.
+    pdb_file : str
+        Path to pdb file.
+    chain_id : str
+        Chain identifier.
+    output_dir: str
+        Results output directory
+
+    """
+    if not result_dic:
+        log.error(f"No predictor returned a result for {pdb_file} chain {chain_id}")
+        return
+
+    filename = Path(pdb_file)
+
+    output_path = Path(output_dir)
+
+    if not output_path.exists():
+        output_path.mkdir(parents=True)
+
+    save_file = output_path.joinpath("predictors_" + filename.stem + ".csv")
+
+    format_output(
+        result_dic,
+        output_fname=save_file,
+        pdb_file=pdb_file,
+        chain_id=chain_id,
+    )
 
 
 # ====================================================================================#
 # Main code
-def main(pdb_file, chain_id, pdb_id, pred, fasta_file, output_dir):
+def main(
+    pdb_file,
+    chain_id,
+    pdb_id,
+    pred,
+    fasta_file,
+    output_dir,
+    model=None,
+    journal=None,
+    cache_dir=None,
+    no_cache=False,
+    cache_only=False,
+    deadline=None,
+):
     """
     Execute main function.
 
@@ -163,9 +708,23 @@ def main(pdb_file, chain_id, pdb_id, pred, fasta_file, output_dir):
         Fasta file.
     output_dir: str
         Results output directory
+    model : list
+        Names of the ML models to apply, the predictors they need are run.
+    journal : str
+        Path to the job journal.
+    cache_dir : str
+        Directory of the result cache.
+    no_cache : bool
+        Do not use the result cache.
+    cache_only : bool
+        Only use cached results, without contacting the servers.
+    deadline : float
+        Seconds after which the predictors still running are abandoned and the
+        results of the finished ones are written.
 
     """
     # Start #=========================================================================#
+    deadline_time = time.monotonic() + deadline if deadline is not None else None
     log.setLevel("DEBUG")
     log.info("-" * 42)
     log.info(f" Welcome to CPORT v{VERSION}")
@@ -173,80 +732,430 @@ def main(pdb_file, chain_id, pdb_id, pred, fasta_file, output_dir):
 
     # Run predictors #================================================================#
 
-    data = {
-        "pdb_id": pdb_id,
-        "chain_id": chain_id,
-        "fasta_file": fasta_file,
+    pred, planner = plan_models(pred, model)
+
+    job_journal = open_journal(journal, output_dir)
+    result_cache = open_cache(cache_dir, no_cache, cache_only)
+    entry = {
         "pdb_file": pdb_file,
-        "output_dir": output_dir
+        "chain_id": chain_id,
+        "pred": pred,
+        "output_dir": output_dir,
     }
-    result_dic = {}
 
-    if "all" in pred:
-        pred = CONFIG["predictors"]
+    try:
+        ((_, result_dic),) = run_entries(
+            [entry],
+            journal=job_journal,
+            cache=result_cache,
+            deadline=deadline_time,
+            planner=planner,
+        )
+    except KeyboardInterrupt:
+        log.warning(f"Interrupted, run again to resume from {job_journal.path}")
+        raise
+    finally:
+        job_journal.close()
+        if result_cache is not None:
+            result_cache.close()
 
-    if "validated" in pred:
-        pred = [
-            "scriber",
-            "sppider",
-            "scannet",
-            "ispred4",
-        ]
+    # Ouput results #==================================================================#
+    output_results(result_dic, pdb_file, chain_id, output_dir)
 
-    threads = {}
 
-    # prepare a dict of predictor initializations.
-    for predictor in pred:
-        threads[predictor] = ThreadReturnVal(
-            target=run_prediction, args=predictor, kwargs=data, name=predictor
-        )
-    
-    for predictor in threads:
-        try:
-            # initiate threads for predictors.
-            threads[predictor].start()
-        except Exception as thrown_exception:
-            log.error(f"Error running {predictor}")
-            log.error(thrown_exception)
-            threads.pop(predictor)
-            
-
-    for predictor in threads:
-        # retrieve results from predictions with modified join
-        try:
-            result_dic[predictor] = threads[predictor].join()
-        except (ServerConnectionException, ChainException) as e:
-            print("Error:", e)
-    # Ouput results #==================================================================#
-    filename = Path(pdb_file)
+def batch_main(
+    manifest,
+    pred,
+    limit,
+    num_workers,
+    output_dir,
+    num_processes=None,
+    model=None,
+    journal=None,
+    cache_dir=None,
+    no_cache=False,
+    cache_only=False,
+    deadline=None,
+):
+    """
+    Execute the batch mode.
 
-    output_path = Path(output_dir)
+    Parameters
+    ----------
+    manifest : str
+        Path to the manifest with the PDB/chain pairs.
+    pred : list
+        Predictors for the rows that do not list any.
+    limit : list
+        List of `(predictor, limit)` in-flight limits.
+    num_workers : int
+        Number of worker threads.
+    output_dir: str
+        Results output directory, each chain gets its own sub-directory.
+    num_processes : int
+        Number of processes for the parsing, the predictors tables and the ML
+        models.
+    model : list
+        Names of the ML models to apply, the predictors they need are run.
+    journal : str
+        Path to the job journal.
+    cache_dir : str
+        Directory of the result cache.
+    no_cache : bool
+        Do not use the result cache.
+    cache_only : bool
+        Only use cached results, without contacting the servers.
+    deadline : float
+        Seconds after which the predictors still running are abandoned and the
+        results of the finished ones are written.
 
-    if not output_path.exists():
-        output_path.mkdir(parents=True) 
+    """
+    deadline_time = time.monotonic() + deadline if deadline is not None else None
+    log.setLevel("DEBUG")
+    log.info("-" * 42)
+    log.info(f" Welcome to CPORT v{VERSION} - batch mode")
+    log.info("-" * 42)
 
-    save_file = output_path.joinpath("predictors_" + filename.stem + ".csv")
-    
-    format_output(
-        result_dic,
-        output_fname=save_file,
-        pdb_file=pdb_file,
-        chain_id=chain_id,
-    )
+    processes = process_pool(num_processes)
+    _, planner = plan_models(pred, model, executor=processes)
+    entries = read_manifest(manifest, default_pred=[])
+    for entry in entries:
+        # each row is planned from its own predictors, the rows without any
+        #  get the ones of the command line
+        entry["pred"], entry["models"], entry["keep_predictors"] = model_plan(
+            entry["pred"] or pred, model
+        )
+        entry["output_dir"] = Path(
+            output_dir, f"{Path(entry['pdb_file']).stem}_{entry['chain_id']}"
+        )
 
-    # Use the ML model to make the prediction #========================================#
-    for predictor in ML_PREDICTION:
-        # Check if all the features are there
-        if all(item in result_dic for item in ML_PREDICTION[predictor]["needed"]):
-            log.info(f"Running ML predictor {predictor.__name__}")
-            predictor(save_file)
+    job_journal = open_journal(journal, output_dir)
+    result_cache = open_cache(cache_dir, no_cache, cache_only)
+    try:
+        results = run_batch(
+            entries,
+            limits=dict(limit),
+            num_workers=num_workers,
+            journal=job_journal,
+            cache=result_cache,
+            deadline=deadline_time,
+            planner=planner,
+            processes=processes,
+        )
+
+        if processes is not None:
+            # standardize and write the tables of every chain in the pool
+            tables = [
+                processes.submit(
+                    output_results,
+                    result_dic,
+                    entry["pdb_file"],
+                    entry["chain_id"],
+                    entry["output_dir"],
+                )
+                for entry, result_dic in results
+            ]
+            for (entry, _), table in zip(results, tables):
+                try:
+                    table.result()
+                except Exception as thrown_exception:
+                    log.error(f"Error writing the results of {entry['pdb_file']}")
+                    log.error(thrown_exception)
         else:
-            log.warning(
-                "Not all needed predictors returned a result, skipping ML model."
+            for entry, result_dic in results:
+                output_results(
+                    result_dic, entry["pdb_file"], entry["chain_id"], entry["output_dir"]
+                )
+    except KeyboardInterrupt:
+        log.warning(f"Interrupted, run again to resume from {job_journal.path}")
+        raise
+    finally:
+        job_journal.close()
+        if result_cache is not None:
+            result_cache.close()
+        if processes is not None:
+            processes.shutdown(wait=False, cancel_futures=True)
+
+
+def collect_run(output_dir, journal=None, cache_dir=None, limit=(), num_workers=None):
+    """
+    Collect the results of a detached run, without waiting for the servers.
+
+    The jobs still running are polled once, the finished ones are downloaded
+    and kept in the result cache, and the jobs missing from the journal are
+    submitted. The predictors table and the ML outputs of a chain are written
+    once none of its predictors is running anymore, each chain only once.
+
+    Parameters
+    ----------
+    output_dir: str
+        Results output directory of the run.
+    journal : str
+        Path to the job journal.
+    cache_dir : str
+        Directory of the result cache.
+    limit : list
+        List of `(predictor, limit)` in-flight limits.
+    num_workers : int
+        Number of worker threads.
+
+    Returns
+    -------
+    pending : int
+        Number of chains still waiting for a predictor.
+
+    """
+    run = load_run(output_dir)
+    todo = [entry for entry in run["entries"] if not entry["written"]]
+    if not todo:
+        log.info(f"All the results of {output_dir} were collected")
+        return 0
+
+    # each entry is planned from the options it was submitted with
+    planner = Planner(ML_PREDICTION)
+    entries = []
+    for entry in todo:
+        pred, models, keep_predictors = model_plan(entry["pred"], entry["model"])
+        entries.append(
+            {
+                "pdb_file": entry["pdb_file"],
+                "chain_id": entry["chain_id"],
+                "pred": pred,
+                "output_dir": entry["output_dir"],
+                "models": models,
+                "keep_predictors": keep_predictors,
+            }
+        )
+
+    job_journal = open_journal(journal, output_dir)
+    # the results finished by a run are picked up from the cache by the next
+    result_cache = open_cache(cache_dir, no_cache=False, cache_only=False)
+    try:
+        results = run_entries(
+            entries,
+            limits=dict(limit),
+            num_workers=num_workers,
+            journal=job_journal,
+            cache=result_cache,
+            planner=planner,
+            detach=True,
+        )
+    finally:
+        job_journal.close()
+        result_cache.close()
+
+    pending = 0
+    for (entry, result_dic), planned in zip(results, todo):
+        if entry["pending"]:
+            log.info(
+                f"{entry['pdb_file']} chain {entry['chain_id']} is waiting for "
+                + ", ".join(entry["pending"])
             )
-            log.warning(
-                "Missing predictors: " + ", ".join(ML_PREDICTION[predictor]["needed"])
+            pending += 1
+            continue
+        output_results(
+            result_dic, entry["pdb_file"], entry["chain_id"], entry["output_dir"]
+        )
+        planned["written"] = bool(result_dic)
+    save_run(output_dir, run)
+
+    if pending:
+        log.info(f"{pending} chains are still running, run cport collect again later")
+    else:
+        log.info(f"All the results of {output_dir} were collected")
+    return pending
+
+
+def submit_main(
+    pdb_file,
+    chain_id,
+    manifest,
+    pred,
+    model,
+    limit,
+    num_workers,
+    output_dir,
+    journal=None,
+    cache_dir=None,
+):
+    """
+    Submit the jobs of a run and exit without waiting for them.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to pdb file.
+    chain_id : str
+        Chain identifier.
+    manifest : str
+        Path to a manifest with the PDB/chain pairs, instead of `pdb_file`.
+    pred : list
+        List of predictors to run.
+    model : list
+        Names of the ML models to apply, the predictors they need are run.
+    limit : list
+        List of `(predictor, limit)` in-flight limits.
+    num_workers : int
+        Number of worker threads.
+    output_dir: str
+        Results output directory.
+    journal : str
+        Path to the job journal.
+    cache_dir : str
+        Directory of the result cache.
+
+    """
+    log.setLevel("DEBUG")
+    log.info("-" * 42)
+    log.info(f" Welcome to CPORT v{VERSION} - submit")
+    log.info("-" * 42)
+
+    # checks the models, the entries are planned when they are collected
+    model_plan(pred, model)
+    if manifest:
+        entries = read_manifest(manifest, default_pred=[])
+        for entry in entries:
+            # the rows without predictors get the ones of the command line
+            entry["pred"] = entry["pred"] or pred
+            entry["model"] = model
+            entry["output_dir"] = Path(
+                output_dir, f"{Path(entry['pdb_file']).stem}_{entry['chain_id']}"
             )
+    elif pdb_file and chain_id:
+        entries = [
+            {
+                "pdb_file": pdb_file,
+                "chain_id": chain_id,
+                "pred": pred,
+                "model": model,
+                "output_dir": output_dir,
+            }
+        ]
+    else:
+        submit_argument_parser.error("give either a pdb_file and a chain_id or a manifest")
+
+    run = load_run(output_dir)
+    add_entries(run, entries)
+    save_run(output_dir, run)
+
+    collect_run(output_dir, journal, cache_dir, limit, num_workers)
+    log.info(f"Submitted, run cport collect -o {output_dir} to fetch the results")
+
+
+def collect_main(output_dir, num_workers=None, journal=None, cache_dir=None):
+    """
+    Collect the results of the jobs submitted by `cport submit`.
+
+    Parameters
+    ----------
+    output_dir: str
+        Results output directory given to `cport submit`.
+    num_workers : int
+        Number of worker threads.
+    journal : str
+        Path to the job journal.
+    cache_dir : str
+        Directory of the result cache.
+
+    """
+    log.setLevel("DEBUG")
+    log.info("-" * 42)
+    log.info(f" Welcome to CPORT v{VERSION} - collect")
+    log.info("-" * 42)
+
+    if not Path(output_dir, RUN_FILE).exists():
+        collect_argument_parser.error(f"nothing was submitted to {output_dir}")
+
+    collect_run(output_dir, journal, cache_dir, num_workers=num_workers)
+
+
+def rescore_main(tables, model, threshold, batch_residues, output_dir):
+    """
+    Apply an ML model to existing predictors tables, without any server.
+
+    Parameters
+    ----------
+    tables : list
+        Predictors tables, or directories searched for them.
+    model : str
+        Name of the ML model to apply.
+    threshold : float
+        Probability above which a residue is predicted active.
+    batch_residues : int
+        Residues given to the model in one call.
+    output_dir: str
+        Results output directory, the directory of each table if None.
+
+    """
+    log.setLevel("DEBUG")
+    log.info("-" * 42)
+    log.info(f" Welcome to CPORT v{VERSION} - rescore")
+    log.info("-" * 42)
+
+    paths = find_tables(tables)
+    if not paths:
+        rescore_argument_parser.error("no predictors table found")
+
+    # the features of the model, in the order it was trained with
+    needed = minimal_predictors({model: ML_PREDICTION[MODELS[model]]}, PREDICTOR_ORDER)
+    # loaded before the clock starts, the rate is the one of the tables
+    get_model(MODEL_OUTPUTS[model]["model"])
+    start = time.monotonic()
+    stats = rescore_tables(
+        paths,
+        model,
+        needed,
+        threshold=threshold,
+        output_dir=output_dir,
+        batch_residues=batch_residues,
+    )
+    elapsed = time.monotonic() - start
+    log.info(
+        f"Rescored {stats['tables']} tables, {stats['residues']} residues in "
+        f"{elapsed:.2f}s ({stats['residues'] / max(elapsed, 1e-9):.0f} residues/s)"
+    )
+    if stats["skipped"]:
+        log.warning(f"Skipped {stats['skipped']} tables")
+
+
+def export_main(model, model_dir):
+    """
+    Export the SavedModels of the ML models to the `.npz` of the numpy engine.
+
+    Tensorflow is only needed to export, not to apply, the models.
+
+    Parameters
+    ----------
+    model : list
+        Names of the ML models to export, all of them if empty.
+    model_dir : str
+        Directory of the SavedModels, the exports are written next to them.
+
+    """
+    log.setLevel("DEBUG")
+    log.info("-" * 42)
+    log.info(f" Welcome to CPORT v{VERSION} - export")
+    log.info("-" * 42)
+
+    unknown = [name for name in model if name not in MODELS]
+    if unknown:
+        export_argument_parser.error(f"unknown ML models {', '.join(unknown)}")
+
+    for name in model or list(MODELS):
+        export_model(
+            Path(model_dir if model_dir is not None else MODEL_DIR)
+            / MODEL_OUTPUTS[name]["model"]
+        )
+
+
+SUBCOMMANDS = {
+    "batch": (batch_argument_parser, batch_main),
+    "submit": (submit_argument_parser, submit_main),
+    "collect": (collect_argument_parser, collect_main),
+    "rescore": (rescore_argument_parser, rescore_main),
+    "export": (export_argument_parser, export_main),
+}
+
 
 if __name__ == "__main__":
     sys.exit(maincli())
@@ -7,4 +7,21 @@ class ServerConnectionException(Exception):
 class ChainException(Exception):
     def __init__(self, message="Program exception"):
         self.message = message
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+class CircuitOpenException(ServerConnectionException):
+    def __init__(self, message="Server is down"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class DeadlineException(Exception):
+    def __init__(self, message="Deadline reached"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class JobCancelledException(Exception):
+    def __init__(self, message="Job cancelled"):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,362 @@
+"""Batch mode, run many PDB/chain pairs in a single process."""
+import copy
+import csv
+import logging
+import time
+from pathlib import Path
+
+from cport.exceptions import JobCancelledException
+from cport.modules.cache import cache_key
+from cport.modules.error import CacheMissError
+from cport.modules.loader import load_predictor
+from cport.modules.scheduler import DONE, PollScheduler, PredictionJob, job_key
+from cport.modules.session import POOL
+
+log = logging.getLogger("cportlog")
+
+MANIFEST_HEADER = ["pdb_file", "chain_id", "predictors"]
+
+
+def read_manifest(manifest, default_pred):
+    """
+    Read a batch manifest.
+
+    The manifest is a tab-separated file with one `pdb_file`, `chain_id` and
+    optional comma-separated `predictors` column per row. Empty lines, lines
+    starting with `#` and a header row are ignored. Relative PDB paths are
+    taken relative to the manifest.
+
+    Parameters
+    ----------
+    manifest : str or pathlib.Path
+        Path to the manifest file.
+    default_pred : list
+        Predictors used for the rows without a `predictors` column.
+
+    Returns
+    -------
+    entries : list
+        A list of dictionaries with the `pdb_file`, `chain_id` and `pred` keys,
+        rows repeating the same PDB/chain pair are merged.
+
+    Raises
+    ------
+    ValueError
+        If a row does not have at least a PDB file and a chain identifier.
+
+    """
+    manifest = Path(manifest)
+    entries = {}
+
+    with open(manifest, newline="") as handle:
+        for line_number, row in enumerate(csv.reader(handle, delimiter="\t"), 1):
+            row = [field.strip() for field in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if row[: len(MANIFEST_HEADER)] == MANIFEST_HEADER[: len(row)]:
+                continue
+            if len(row) < 2 or not row[1]:
+                raise ValueError(
+                    f"Line {line_number} of {manifest} needs a pdb_file and a chain_id"
+                )
+
+            pdb_file = Path(row[0])
+            if not pdb_file.is_absolute():
+                pdb_file = manifest.parent / pdb_file
+
+            if len(row) > 2 and row[2]:
+                pred = [item.strip() for item in row[2].split(",") if item.strip()]
+            else:
+                pred = list(default_pred)
+
+            entry = entries.setdefault(
+                (str(pdb_file), row[1]),
+                {"pdb_file": str(pdb_file), "chain_id": row[1], "pred": []},
+            )
+            entry["pred"] += [item for item in pred if item not in entry["pred"]]
+
+    return list(entries.values())
+
+
+def run_entries(
+    entries,
+    limits=None,
+    num_workers=None,
+    journal=None,
+    cache=None,
+    deadline=None,
+    planner=None,
+    processes=None,
+    detach=False,
+):
+    """
+    Run the predictors of every entry on a shared scheduler.
+
+    Identical chains, within a structure or across entries, are submitted only
+    once per predictor. They are grouped by their content key, the sequence for
+    the sequence-based predictors and the chain coordinates for the others, and
+    every member of a group gets its own copy of the result, its numbering is
+    remapped to its chain later by `standardize_residues`.
+
+    With a planner, the ML models of an entry run as soon as their predictors
+    finished, and the jobs no requested output depends on anymore are
+    cancelled.
+
+    With a process pool, the run is pipelined: the content keys are computed
+    and the downloaded results parsed in the pool, while the scheduler threads
+    keep submitting and polling.
+
+    Parameters
+    ----------
+    entries : list
+        Entries as returned by `read_manifest`.
+    limits : dict
+        Maximum number of jobs in flight per predictor.
+    num_workers : int
+        Number of worker threads for the blocking calls.
+    journal : JobJournal
+        Journal used to resume the jobs of a previous run.
+    cache : ResultCache
+        Cache answering the predictions it already has, the new results are
+        added to it.
+    deadline : float
+        Time, on the monotonic clock, after which the unfinished jobs are
+        abandoned and only the finished predictors are returned.
+    planner : Planner
+        Planner running the ML models of the entries.
+    processes : concurrent.futures.Executor
+        Pool running the CPU-bound stages.
+    detach : bool
+        Submit the jobs, or poll them once if the journal has them, without
+        waiting; the predictors still running are listed in the `pending` key
+        of their entry.
+
+    Returns
+    -------
+    results : list
+        One `(entry, result_dic)` tuple per entry, in the given order.
+
+    """
+    # content key of each predictor of each entry
+    plan = []
+    # results of the groups, either from the cache or from a representative job
+    cached = {}
+    jobs = {}
+    # the predictors of the entries sharing each job
+    members = {}
+
+    def cancel_unneeded(indexes):
+        for index in indexes:
+            for key in plan[index][1].values():
+                job = jobs.get(key)
+                if job is None or job.finished:
+                    continue
+                if not any(planner.needs(*member) for member in members[job]):
+                    scheduler.cancel(job, "no requested output needs it")
+
+    def finished(job):
+        result = job.result if job.state == DONE else None
+        for index, predictor in members[job]:
+            planner.update(index, predictor, copy.deepcopy(result))
+        cancel_unneeded({index for index, _ in members[job]})
+
+    scheduler = PollScheduler(
+        num_workers=num_workers,
+        limits=limits,
+        journal=journal,
+        deadline=deadline,
+        on_finish=finished if planner is not None else None,
+        parser=processes,
+        detach=detach,
+    )
+
+    # hashing the chains parses every PDB file, spread it over the pool
+    prepared = {}
+    if processes is not None:
+        for entry in entries:
+            for predictor in entry["pred"]:
+                prepared[(predictor, entry["pdb_file"], entry["chain_id"])] = (
+                    processes.submit(
+                        cache_key, predictor, entry["pdb_file"], entry["chain_id"]
+                    )
+                )
+
+    for entry in entries:
+        keys = {}
+        for predictor in entry["pred"]:
+            try:
+                if processes is not None:
+                    key = prepared[
+                        (predictor, entry["pdb_file"], entry["chain_id"])
+                    ].result()
+                else:
+                    key = cache_key(predictor, entry["pdb_file"], entry["chain_id"])
+                keys[predictor] = key
+                if key in cached or key in jobs:
+                    log.info(
+                        f"{predictor} on {entry['pdb_file']} chain "
+                        f"{entry['chain_id']} shares the job of an identical chain"
+                    )
+                    continue
+
+                if cache is not None:
+                    prediction = cache.get(key)
+                    if prediction is not None:
+                        log.info(
+                            f"Using cached result for {predictor} on {entry['pdb_file']}"
+                        )
+                        cached[key] = prediction
+                        continue
+                    if cache.offline:
+                        log.warning(
+                            CacheMissError(
+                                predictor, entry["pdb_file"], entry["chain_id"]
+                            )
+                        )
+                        del keys[predictor]
+                        continue
+
+                jobs[key] = PredictionJob(
+                    predictor,
+                    load_predictor(predictor, **entry),
+                    key=job_key(predictor, entry["pdb_file"], entry["chain_id"]),
+                )
+            except Exception as thrown_exception:
+                log.error(f"Error running {predictor} on {entry['pdb_file']}")
+                log.error(thrown_exception)
+                keys.pop(predictor, None)
+                continue
+            scheduler.add(jobs[key])
+        plan.append((entry, keys))
+
+    for index, (entry, keys) in enumerate(plan):
+        for predictor, key in keys.items():
+            if key in jobs:
+                members.setdefault(jobs[key], []).append((index, predictor))
+        if planner is None:
+            continue
+        planner.add(index, entry)
+        for predictor in entry["pred"]:
+            if predictor not in keys:
+                planner.update(index, predictor, None)
+            elif keys[predictor] in cached:
+                planner.update(index, predictor, copy.deepcopy(cached[keys[predictor]]))
+    if planner is not None:
+        cancel_unneeded(range(len(plan)))
+
+    num_members = sum(len(keys) for _, keys in plan)
+    log.info(
+        f"Running {len(scheduler.jobs)} jobs for {len(entries)} chains, "
+        f"{num_members - len(scheduler.jobs) - len(cached)} deduplicated"
+    )
+    try:
+        scheduler.run()
+    finally:
+        if planner is not None:
+            planner.finish(pending=not detach)
+
+    output = []
+    stored = set()
+    for entry, keys in plan:
+        result_dic = {}
+        if detach:
+            entry["pending"] = []
+        for predictor, key in keys.items():
+            if key in cached:
+                # each member remaps the residues of its own copy
+                result_dic[predictor] = copy.deepcopy(cached[key])
+            elif jobs[key].state == DONE:
+                result_dic[predictor] = copy.deepcopy(jobs[key].result)
+                if cache is not None and key not in stored:
+                    cache.put(key, predictor, jobs[key].result)
+                    stored.add(key)
+            elif detach and not jobs[key].finished:
+                entry["pending"].append(predictor)
+            elif isinstance(jobs[key].error, JobCancelledException):
+                log.info(f"{jobs[key].key} was cancelled")
+            else:
+                log.error(f"{jobs[key].key} failed: {jobs[key].error}")
+        output.append((entry, result_dic))
+
+    return output
+
+
+def run_batch(
+    entries,
+    limits=None,
+    num_workers=None,
+    journal=None,
+    cache=None,
+    deadline=None,
+    planner=None,
+    processes=None,
+):
+    """
+    Run a batch of entries and report its throughput.
+
+    Parameters
+    ----------
+    entries : list
+        Entries as returned by `read_manifest`.
+    limits : dict
+        Maximum number of jobs in flight per predictor.
+    num_workers : int
+        Number of worker threads for the blocking calls.
+    journal : JobJournal
+        Journal used to resume the jobs of a previous run.
+    cache : ResultCache
+        Cache answering the predictions it already has.
+    deadline : float
+        Time, on the monotonic clock, after which the unfinished jobs are
+        abandoned.
+    planner : Planner
+        Planner running the ML models of the entries.
+    processes : concurrent.futures.Executor
+        Pool running the CPU-bound stages.
+
+    Returns
+    -------
+    results : list
+        One `(entry, result_dic)` tuple per entry, in the manifest order.
+
+    """
+    start = time.monotonic()
+    results = run_entries(
+        entries,
+        limits=limits,
+        num_workers=num_workers,
+        journal=journal,
+        cache=cache,
+        deadline=deadline,
+        planner=planner,
+        processes=processes,
+    )
+    report_throughput(len(entries), time.monotonic() - start)
+    POOL.log_stats()
+
+    return results
+
+
+def report_throughput(num_chains, elapsed):
+    """
+    Log the throughput of a batch run.
+
+    Parameters
+    ----------
+    num_chains : int
+        Number of chains processed.
+    elapsed : float
+        Wall-clock duration of the batch, in seconds.
+
+    Returns
+    -------
+    chains_per_hour : float
+        The batch throughput.
+
+    """
+    chains_per_hour = num_chains / (elapsed / 3600) if elapsed > 0 else 0.0
+    log.info(
+        f"Batch finished: {num_chains} chains in {elapsed:.1f}s "
+        f"({chains_per_hour:.1f} chains/hour)"
+    )
+    return chains_per_hour
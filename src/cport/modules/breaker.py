@@ -0,0 +1,270 @@
+"""Circuit breakers failing fast on the prediction servers that are down."""
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from cport.exceptions import CircuitOpenException, ServerConnectionException
+from cport.modules.session import get_session
+from cport.url import (
+    CONS_PPISP_URL,
+    CSM_POTENTIAL_URL,
+    ISPRED4_URL,
+    META_PPISP_URL,
+    PREDICTPROTEIN_URL,
+    PREDUS2_URL,
+    PSIVER_URL,
+    SCANNET_URL,
+    SCRIBER_URL,
+    SPPIDER_URL,
+    WHISCY_URL,
+)
+
+log = logging.getLogger("cportlog")
+
+# Consecutive failed jobs after which a server is considered down
+FAILURE_THRESHOLD = os.environ.get("CPORT_BREAKER_FAILURES") if os.environ.get("CPORT_BREAKER_FAILURES") is not None else 3
+# Seconds a server stays down before it is probed again
+RESET_TIMEOUT = os.environ.get("CPORT_BREAKER_RESET") if os.environ.get("CPORT_BREAKER_RESET") is not None else 300
+# Seconds the outcome of a probe is reused by every job of the server
+PROBE_TTL = os.environ.get("CPORT_PROBE_TTL") if os.environ.get("CPORT_PROBE_TTL") is not None else 300
+PROBE_TIMEOUT = (5, 10)  # seconds
+
+# the errors blamed on the server, the others (a bad input, a missing chain, a
+#  parser error, a cancelled job) do not count against its circuit breaker
+SERVER_ERRORS = (ServerConnectionException, requests.exceptions.RequestException)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+PROBE_URLS = {
+    "scriber": SCRIBER_URL,
+    "ispred4": ISPRED4_URL,
+    "sppider": SPPIDER_URL,
+    "whiscy": WHISCY_URL,
+    "meta_ppisp": META_PPISP_URL,
+    "predus2": PREDUS2_URL,
+    "cons_ppisp": CONS_PPISP_URL,
+    "psiver": PSIVER_URL,
+    "csm_potential": CSM_POTENTIAL_URL,
+    "scannet": SCANNET_URL,
+    "predictprotein": PREDICTPROTEIN_URL,
+}
+# servers whose certificates the predictors do not verify either
+UNVERIFIED_PROBES = ("cons_ppisp", "meta_ppisp", "predus2", "scannet")
+
+
+def server_failure(error):
+    """
+    Check if an error counts as a failure of the server.
+
+    Parameters
+    ----------
+    error : Exception
+        The error raised by a job.
+
+    Returns
+    -------
+    failure : bool
+        True for the `SERVER_ERRORS`, but not for a breaker refusing the job.
+
+    """
+    return isinstance(error, SERVER_ERRORS) and not isinstance(
+        error, CircuitOpenException
+    )
+
+
+def probe_url(url, verify=True):
+    """
+    Check if a server answers.
+
+    Parameters
+    ----------
+    url : str
+        The url to be requested.
+    verify : bool
+        Verify the TLS certificate of the server.
+
+    Returns
+    -------
+    healthy : bool
+        True if the server answered without a server error.
+
+    """
+    try:
+        response = get_session().get(url, timeout=PROBE_TIMEOUT, verify=verify)
+    except Exception as thrown_exception:
+        log.debug(f"Probe of {url} failed: {thrown_exception}")
+        return False
+
+    return response.status_code < 500
+
+
+class CircuitBreaker:
+    """
+    Per-server circuit breaker.
+
+    The breaker opens after `threshold` consecutive failed jobs, new jobs then
+    fail straight away. Once `reset_timeout` seconds passed it probes the
+    server; if it answers, the breaker is half-open and lets a single trial
+    job through, refusing the others. The trial being accepted by the server,
+    or any job succeeding, closes it and the first failure opens it again. A
+    trial that never reports back stops blocking the others after
+    `reset_timeout` seconds. The outcome of a probe is shared for `probe_ttl`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        name,
+        url=None,
+        threshold=None,
+        reset_timeout=None,
+        probe_ttl=None,
+        verify=True,
+    ):
+        """
+        Initialize the breaker.
+
+        Parameters
+        ----------
+        name : str
+            Name of the predictor.
+        url : str
+            The url probed to check the server is back.
+        threshold : int
+            Consecutive failures opening the breaker.
+        reset_timeout : float
+            Seconds before an open breaker probes the server.
+        probe_ttl : float
+            Seconds the outcome of a probe is reused.
+        verify : bool
+            Verify the TLS certificate of the server when probing it.
+
+        """
+        self.name = name
+        self.url = url
+        self.threshold = int(threshold if threshold is not None else FAILURE_THRESHOLD)
+        self.reset_timeout = float(
+            reset_timeout if reset_timeout is not None else RESET_TIMEOUT
+        )
+        self.probe_ttl = float(probe_ttl if probe_ttl is not None else PROBE_TTL)
+        self.verify = verify
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self._probed = None
+        self._healthy = False
+        # when the trial job of a half-open breaker was let through
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def probe(self):
+        """
+        Probe the server, reusing a recent outcome.
+
+        Returns
+        -------
+        healthy : bool
+            True if the server answered.
+
+        """
+        now = time.monotonic()
+        if self._probed is None or now - self._probed >= self.probe_ttl:
+            self._healthy = self.url is None or probe_url(self.url, verify=self.verify)
+            self._probed = now
+            log.info(
+                f"{self.name} server is {'up' if self._healthy else 'still down'}"
+            )
+        return self._healthy
+
+    def allow(self):
+        """
+        Check if a new job may be sent to the server.
+
+        Returns
+        -------
+        allowed : bool
+            False while the server is considered down, or while the trial job
+            of a half-open breaker did not report back.
+
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                if self._trial is not None and now - self._trial < self.reset_timeout:
+                    return False
+            elif now - self.opened < self.reset_timeout or not self.probe():
+                return False
+
+            self.state = HALF_OPEN
+            self._trial = now
+            return True
+
+    def record_success(self):
+        """Record a job that finished."""
+        with self._lock:
+            self._close()
+
+    def record_submitted(self):
+        """Record a job accepted by the server, the trial of a half-open breaker."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._close()
+
+    def _close(self):
+        if self.state != CLOSED:
+            log.info(f"{self.name} server recovered")
+        self.state = CLOSED
+        self.failures = 0
+        self._trial = None
+
+    def record_failure(self):
+        """Record a job that failed or timed out."""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= self.threshold
+            ):
+                log.warning(
+                    f"{self.name} server failed {self.failures} times in a row, "
+                    f"skipping it for {self.reset_timeout:.0f}s"
+                )
+                self.state = OPEN
+                self.opened = time.monotonic()
+                self._trial = None
+                # the next probe must not reuse the outcome of the last one
+                self._probed = None
+
+
+BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(name):
+    """
+    Get the breaker of a server, shared by every job of the process.
+
+    Parameters
+    ----------
+    name : str
+        Name of the predictor.
+
+    Returns
+    -------
+    breaker : CircuitBreaker
+        The breaker of the predictor server.
+
+    """
+    with _BREAKERS_LOCK:
+        if name not in BREAKERS:
+            BREAKERS[name] = CircuitBreaker(
+                name, PROBE_URLS.get(name), verify=name not in UNVERIFIED_PROBES
+            )
+        return BREAKERS[name]
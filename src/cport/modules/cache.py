@@ -0,0 +1,257 @@
+"""Content-addressed cache of the predictor results."""
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from cport.modules.context import get_context
+from cport.modules.table import PredictionTable, as_table
+from cport.modules.utils import get_fasta_from_pdbfile
+from cport.version import VERSION
+
+log = logging.getLogger("cportlog")
+
+CACHE_DIR = os.environ.get("CPORT_CACHE_DIR") if os.environ.get("CPORT_CACHE_DIR") is not None else Path.home() / ".cache" / "cport"
+CACHE_MAX_BYTES = os.environ.get("CPORT_CACHE_MAX_BYTES") if os.environ.get("CPORT_CACHE_MAX_BYTES") is not None else 256 * 1024 * 1024
+CACHE_TTL = os.environ.get("CPORT_CACHE_TTL") if os.environ.get("CPORT_CACHE_TTL") is not None else 30 * 24 * 3600  # seconds
+
+# these only see the sequence, the structure does not change their result
+SEQUENCE_PREDICTORS = ["scriber", "predictprotein", "psiver"]
+
+# bump the version of a predictor when its results or their parsing change
+PREDICTOR_VERSIONS = {}
+
+
+@functools.lru_cache(maxsize=4096)
+def sequence_hash(pdb_file, chain_id):
+    """
+    Hash the sequence of a chain.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to PDB file.
+    chain_id : str
+        Chain identifier.
+
+    Returns
+    -------
+    digest : str
+        The SHA-256 of the sequence, memoized as every predictor of a chain and
+        the deduplication in `run_entries` need it.
+
+    """
+    sequence = get_fasta_from_pdbfile(pdb_file, chain_id)
+    return hashlib.sha256(sequence.encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=4096)
+def structure_hash(pdb_file, chain_id):
+    """
+    Hash the normalized ATOM records of a chain.
+
+    Only the atom and residue names, residue numbers and coordinates of the
+    first model are kept, so atom serials, the chain identifier, occupancies,
+    B-factors and the rest of the file do not change the hash.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to PDB file.
+    chain_id : str
+        Chain identifier.
+
+    Returns
+    -------
+    digest : str
+        The SHA-256 of the normalized records.
+
+    """
+    digest = hashlib.sha256()
+    # the context keeps the records of the chain in the first model
+    for line in get_context(pdb_file, chain_id).pdb_bytes.splitlines():
+        if line.startswith(b"ATOM"):
+            digest.update(line[12:21])
+            digest.update(line[22:27])
+            digest.update(line[30:54])
+            digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def cache_key(predictor, pdb_file, chain_id):
+    """
+    Build the content-addressed key of a prediction.
+
+    Parameters
+    ----------
+    predictor : str
+        Name of the predictor.
+    pdb_file : str
+        Path to PDB file.
+    chain_id : str
+        Chain identifier.
+
+    Returns
+    -------
+    key : str
+        The cache key.
+
+    """
+    version = f"{VERSION}.{PREDICTOR_VERSIONS.get(predictor, 1)}"
+    parts = [predictor, version, sequence_hash(pdb_file, chain_id)]
+    if predictor not in SEQUENCE_PREDICTORS:
+        parts.append(structure_hash(pdb_file, chain_id))
+    return hashlib.sha256(":".join(parts).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    SQLite-backed cache of the `{"active", "passive"}` prediction dictionaries.
+
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted once the stored results exceed `max_bytes`.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, ttl=None, offline=False):
+        """
+        Open the cache, creating it if needed.
+
+        Parameters
+        ----------
+        directory : str or pathlib.Path
+            Directory holding the cache database.
+        max_bytes : int
+            Maximum size of the stored results.
+        ttl : float
+            Time to live of an entry, in seconds.
+        offline : bool
+            Only answer from the cache, misses are not sent to the servers.
+
+        """
+        self.directory = Path(directory if directory is not None else CACHE_DIR)
+        self.max_bytes = int(max_bytes if max_bytes is not None else CACHE_MAX_BYTES)
+        self.ttl = float(ttl if ttl is not None else CACHE_TTL)
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.directory / "results.sqlite", check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, predictor TEXT, value TEXT, size INTEGER, "
+            "expires REAL, accessed REAL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+        )
+        self._connection.commit()
+
+    def get(self, key):
+        """
+        Retrieve a cached prediction.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable or None
+            The cached prediction, None on a miss.
+
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._connection.commit()
+                self.misses += 1
+                return None
+
+            self._connection.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+            self.hits += 1
+
+        if isinstance(row[0], bytes):
+            return PredictionTable.from_bytes(row[0])
+        # stored as json by the previous versions
+        return as_table(json.loads(row[0]))
+
+    def put(self, key, predictor, prediction_dict):
+        """
+        Store a prediction.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+        predictor : str
+            Name of the predictor.
+        prediction_dict : PredictionTable or dict
+            The prediction to be stored.
+
+        """
+        # the records of the table, 10 bytes per residue
+        value = as_table(prediction_dict).to_bytes()
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, predictor, value, len(value), now + self.ttl, now),
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        """Drop expired entries, then the least recently used above the size cap."""
+        self._connection.execute("DELETE FROM results WHERE expires < ?", (time.time(),))
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+
+        cursor = self._connection.execute(
+            "SELECT key, size FROM results ORDER BY accessed"
+        )
+        evicted = []
+        for key, size in cursor.fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+        log.debug(f"Evicted {len(evicted)} results from the cache")
+
+    def size(self):
+        """
+        Size of the stored results.
+
+        Returns
+        -------
+        size : int
+            Number of bytes of the stored results.
+
+        """
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+
+    def close(self):
+        """Close the cache database."""
+        with self._lock:
+            self._connection.close()
@@ -1,17 +1,16 @@
 """CONS-PPISP module."""
-import io
 import logging
 import re
 import sys
 import tempfile
-import time
 import os
 
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
 import pandas as pd
-import requests
 
+from cport.modules.polling import PollPolicy
+from cport.modules.session import download, fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.url import CONS_PPISP_URL
 
 log = logging.getLogger("cportlog")
@@ -20,6 +19,8 @@ log = logging.getLogger("cportlog")
 WAIT_INTERVAL = os.environ.get("CONS_PPISP_WAIT_INTERVAL") if os.environ.get("CONS_PPISP_WAIT_INTERVAL") is not None else 30 # seconds
 # any request should never take more than 15min so theoretical max is 90 retries
 NUM_RETRIES = os.environ.get("CONS_PPISP_NUM_RETRIES") if os.environ.get("CONS_PPISP_NUM_RETRIES") is not None else 36
+# The result page of a running job does not exist yet
+NOT_FOUND_PATTERN = re.compile(rb"404 Not Found")
 
 
 class ConsPPISP:
@@ -39,8 +40,13 @@ class ConsPPISP:
         """
         self.pdb_file = pdb_file
         self.chain_id = chain_id
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "cons_ppisp",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -54,7 +60,7 @@ class ConsPPISP:
         """
         # SSL request fails, try to find alternative solution as this
         #   would save a lot of code
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
         browser.open(CONS_PPISP_URL, verify=False)
 
         input_form = browser.select_form(nr=0)
@@ -73,54 +79,76 @@ class ConsPPISP:
 
         return processing_url
 
-    def retrieve_prediction_link(self, url=None, page_text=None):
+    @staticmethod
+    def poll(url=None, page_text=None):
         """
-        Retrieve the link to the result page.
+        Check once if the cons-PPISP result page exists.
 
         Parameters
         ----------
         url : str
-            The url to the result results.
+            The url of the cons-PPISP processing page.
         page_text : str
             The text of the page to parse - used for testing.
 
         Returns
         -------
-        url : str
-            The url to the prediction page.
+        url : str or None
+            The url of the cons-PPISP prediction page, None if the job is still
+            running.
 
         """
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # this is used in the testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
             url = page_text
         else:
-            browser.open(url, verify=False)
+            page = fetch_page(url, verify=False)  # nosec
+
+        # Check if the result page exists
+        match = NOT_FOUND_PATTERN.search(page)
+
+        if match:
+            return None
+
+        return url
+
+    def retrieve_prediction_link(self, url=None, page_text=None):
+        """
+        Retrieve the link to the result page.
+
+        Parameters
+        ----------
+        url : str
+            The url to the result results.
+        page_text : str
+            The text of the page to parse - used for testing.
+
+        Returns
+        -------
+        url : str
+            The url to the prediction page.
 
+        """
         completed = False
         while not completed:
-            # Check if the result page exists
-            match = re.search(r"404 Not Found", str(browser.page))
-            if not match:
+            prediction_url = self.poll(url=url, page_text=page_text)
+            if prediction_url:
                 completed = True
-            else:
-                # still running, wait a bit
-                log.debug(f"Waiting for cons-PPISP to finish... {self.tries}")
-                time.sleep(self.wait)
-                browser.refresh()
-                self.tries -= 1
-
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
                 log.error(f"cons-PPISP server is not responding, url was {url}")
                 raise ServerConnectionException(f"cons-PPISP server is not responding, url was {url}")
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for cons-PPISP to finish... {delay:.0f}s")
+                self.policy.wait(delay)
 
-        return url
+        return prediction_url
 
     @staticmethod
-    def download_result(download_link):
+    def download_result(download_link, token=None):
         """
         Download the results.
 
@@ -128,6 +156,8 @@ class ConsPPISP:
         ----------
         download_link : str
             The link to the results.
+        token : CancelToken
+            Token stopping the download.
 
         Returns
         -------
@@ -136,9 +166,10 @@ class ConsPPISP:
 
         """
         temp_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_file.close()
         # this verify=False is a security issue but i'm afraid there's
         #  no trivial solution and that the issue might be of the server
-        temp_file.name = requests.get(download_link, verify=False).content  # nosec
+        download(download_link, temp_file.name, token=token, verify=False)  # nosec
         return temp_file.name
 
     def parse_prediction(self, url=None, test_file=None):
@@ -154,47 +185,130 @@ class ConsPPISP:
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
             and passive sites.
 
         """
-        prediction_dict = {"active": [], "passive": []}
-
-        if test_file:
-            final_predictions = pd.read_csv(
-                test_file,
-                skiprows=13,
-                delim_whitespace=True,
-                names=["AA", "Ch", "AA_nr", "Score", "Prediction"],
-                header=0,
-                skipfooter=16,
-            )
-        else:
+        if not test_file:
             # direct reading of page with read_csv is impossible due to
             #  the same SSL error
-            file = self.download_result(url)
+            return self.parse(self.fetch(url))
+
+        final_predictions = pd.read_csv(
+            test_file,
+            skiprows=13,
+            delim_whitespace=True,
+            names=["AA", "Ch", "AA_nr", "Score", "Prediction"],
+            header=0,
+            skipfooter=16,
+        )
+        return self.prediction_table(final_predictions)
+
+    @staticmethod
+    def prediction_table(final_predictions):
+        """
+        Select the residues of the cons-PPISP results.
+
+        Parameters
+        ----------
+        final_predictions : pandas.DataFrame
+            The rows of the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        # cons_ppisp occasionally adds an A to the number, needs to be removed
+        # skips the rows that are not residues
+        final_predictions = final_predictions[
+            final_predictions["Prediction"].isin(["P", "N"])
+        ]
+        residues = (
+            final_predictions["AA_nr"]
+            .astype(str)
+            .str.replace(r"\D", "", regex=True)
+            .astype(int)
+        )
+
+        return PredictionTable.from_masks(
+            residues,
+            final_predictions["Score"],
+            # positive for interaction
+            active=final_predictions["Prediction"] == "P",
+            passive=final_predictions["Prediction"] == "N",
+            passive_scores=False,
+        )
+
+    def collect(self, prediction_url):
+        """
+        Download and parse the results of a finished job.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return self.parse(self.fetch(prediction_url))
+
+    def fetch(self, prediction_url):
+        """
+        Download the results of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        result_file : str
+            The path to the results file.
+
+        """
+        return self.download_result(prediction_url, token=self.policy.token)
+
+    @staticmethod
+    def parse(result_file):
+        """
+        Parse downloaded results and remove them, the parsing stage.
+
+        Runs in a worker process, so it only takes the path to the file.
+
+        Parameters
+        ----------
+        result_file : str
+            The path to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        try:
             final_predictions = pd.read_csv(
-                io.StringIO(file.decode("utf-8")),
+                result_file,
                 skiprows=13,
                 delim_whitespace=True,
                 names=["AA", "Ch", "AA_nr", "Score", "Prediction"],
                 header=0,
-                error_bad_lines=False,
+                on_bad_lines="skip",
             )
-
-        for row in final_predictions.itertuples():
-            if row.Prediction == "P":  # positive for interaction
-                # cons_ppisp occasionally adds an A to the number, needs to be removed
-                prediction_dict["active"].append(
-                    # trunk-ignore(flake8/W605)
-                    [int(re.sub("\D", "", row.AA_nr)), row.Score]
-                )
-            elif row.Prediction == "N":
-                # trunk-ignore(flake8/W605)
-                prediction_dict["passive"].append(int(re.sub("\D", "", row.AA_nr)))
-
-        return prediction_dict
+        finally:
+            os.remove(result_file)
+        return ConsPPISP.prediction_table(final_predictions)
 
     def run(self):
         """
@@ -202,15 +316,17 @@ class ConsPPISP:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the raw prediction.
+        prediction_dict : PredictionTable
+            A table containing the raw prediction.
 
         """
         log.info("Running cons-PPISP")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_url = self.retrieve_prediction_link(url=submitted_url)
-        prediction_dict = self.parse_prediction(url=prediction_url)
+        self.policy.finish()
+        prediction_dict = self.collect(prediction_url)
 
         return prediction_dict
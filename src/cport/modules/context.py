@@ -0,0 +1,350 @@
+"""Chains of the input structures, parsed once and shared by a run."""
+import functools
+import hashlib
+import logging
+import os
+import threading
+import warnings
+from collections import Counter
+
+import numpy as np
+from Bio import BiopythonParserWarning
+from Bio.Data.PDBData import protein_letters_3to1, protein_letters_3to1_extended
+
+from cport.exceptions import ChainException
+from cport.modules.scanner import residue_bounds, scan_chain
+
+log = logging.getLogger("cportlog")
+
+# Chains whose context is kept in memory
+CONTEXT_CACHE_SIZE = os.environ.get("CPORT_CONTEXT_CACHE_SIZE") if os.environ.get("CPORT_CONTEXT_CACHE_SIZE") is not None else 256
+
+# one letter codes of the residues, like the pdb-atom parser of Bio.SeqIO
+AMINO_ACIDS = {**protein_letters_3to1, **protein_letters_3to1_extended}
+
+# times each PDB file was parsed
+PARSES = Counter()
+_PARSES_LOCK = threading.Lock()
+_CONTEXTS_LOCK = threading.Lock()
+
+
+class ResidueIndex:
+    """
+    Map the positions of a chain sequence to its structure residues, and back.
+
+    The sequence is the one of the pdb-atom parser of `Bio.SeqIO`: the amino
+    acids of the chain, each gap in the numbering filled with as many `X`.
+    A position of this gapped sequence maps to the number and insertion code
+    of a residue, the number it would have for the `X`. The positions of the
+    ungapped sequence, the amino acids only, map to the residues themselves.
+    """
+
+    def __init__(self, numbers, icodes, present, sequence):
+        """
+        Initialize the index.
+
+        Parameters
+        ----------
+        numbers : numpy.ndarray
+            The residue number of each position of the gapped sequence.
+        icodes : numpy.ndarray
+            Their insertion codes, empty bytes for none.
+        present : numpy.ndarray
+            Mask of the positions of the gapped sequence holding a residue.
+        sequence : str
+            The gapped sequence.
+
+        """
+        self.numbers = numbers
+        self.icodes = icodes
+        self.present = present
+        self.sequence = sequence
+        self._ungapped = np.flatnonzero(present)
+
+        keys = self._keys(numbers[present], icodes[present])
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._order]
+
+    @classmethod
+    def from_residues(cls, numbers, icodes, names):
+        """
+        Build the index of the residues of a chain.
+
+        Parameters
+        ----------
+        numbers : numpy.ndarray
+            The residue numbers of the chain, in file order.
+        icodes : numpy.ndarray
+            Their insertion codes.
+        names : numpy.ndarray
+            Their three letter names, the ones that are not amino acids are
+            left out of the sequence.
+
+        Returns
+        -------
+        index : ResidueIndex
+            The index of the amino acids of the chain.
+
+        """
+        codes = np.array(
+            [AMINO_ACIDS.get(str(name), "X") for name in names], dtype="U1"
+        )
+        kept = codes != "X"
+        numbers = np.asarray(numbers, dtype=np.int64)[kept]
+        icodes = np.char.strip(np.asarray(icodes, dtype="S1")[kept])
+        codes = codes[kept]
+
+        steps = np.diff(numbers)
+        gaps = (steps != 0) & (steps != 1)
+        backwards = np.flatnonzero(gaps & (steps < 0))
+        if len(backwards):
+            warnings.warn(
+                "Ignoring out-of-order residues after a gap", BiopythonParserWarning
+            )
+            end = backwards[0] + 1
+            numbers, icodes, codes = numbers[:end], icodes[:end], codes[:end]
+            steps, gaps = steps[: end - 1], gaps[: end - 1]
+
+        # each gap shifts the residues after it by its number of X
+        filled = np.where(gaps, steps - 1, 0)
+        shifts = np.concatenate([[0], np.cumsum(filled)])[: len(numbers)]
+        positions = np.arange(len(numbers)) + shifts
+        length = int(positions[-1]) + 1 if len(positions) else 0
+
+        present = np.zeros(length, dtype=bool)
+        present[positions] = True
+        # a position of the X takes the number of the residue it stands for
+        owner = np.maximum.accumulate(np.where(present, np.arange(length), 0))
+        gapped_numbers = numbers[np.searchsorted(positions, owner)] + (
+            np.arange(length) - owner
+        )
+        gapped_icodes = np.zeros(length, dtype="S1")
+        gapped_icodes[positions] = icodes
+        sequence = np.full(length, "X", dtype="U1")
+        sequence[positions] = codes
+
+        return cls(gapped_numbers, gapped_icodes, present, "".join(sequence))
+
+    @staticmethod
+    def _keys(numbers, icodes):
+        return np.asarray(numbers, dtype=np.int64) * 256 + np.asarray(
+            icodes, dtype="S1"
+        ).view(np.uint8)
+
+    def to_structure(self, positions, gapped=True):
+        """
+        Get the residues at positions of the sequence.
+
+        Parameters
+        ----------
+        positions : numpy.ndarray
+            Positions in the sequence, starting at 1.
+        gapped : bool
+            The positions are in the gapped sequence, else in the sequence
+            without its `X`.
+
+        Returns
+        -------
+        numbers : numpy.ndarray
+            The residue numbers.
+        icodes : numpy.ndarray
+            Their insertion codes.
+        found : numpy.ndarray
+            Mask of the positions inside the sequence, the others are numbered
+            0.
+
+        """
+        positions = np.asarray(positions, dtype=np.int64) - 1
+        lookup = np.arange(len(self.numbers)) if gapped else self._ungapped
+        found = (positions >= 0) & (positions < len(lookup))
+        indices = lookup[positions[found]]
+
+        numbers = np.zeros(len(positions), dtype=np.int64)
+        numbers[found] = self.numbers[indices]
+        icodes = np.zeros(len(positions), dtype="S1")
+        icodes[found] = self.icodes[indices]
+        return numbers, icodes, found
+
+    def to_sequence(self, numbers, icodes=None, gapped=True):
+        """
+        Get the positions of residues in the sequence.
+
+        Parameters
+        ----------
+        numbers : numpy.ndarray
+            The residue numbers.
+        icodes : numpy.ndarray
+            Their insertion codes, none if not given.
+        gapped : bool
+            Give the positions in the gapped sequence, else in the sequence
+            without its `X`.
+
+        Returns
+        -------
+        positions : numpy.ndarray
+            The positions, starting at 1.
+        found : numpy.ndarray
+            Mask of the residues in the sequence, the others are at position 0.
+
+        """
+        numbers = np.asarray(numbers, dtype=np.int64)
+        if icodes is None:
+            icodes = np.zeros(len(numbers), dtype="S1")
+        keys = self._keys(numbers, np.char.strip(np.asarray(icodes, dtype="S1")))
+
+        slots = np.searchsorted(self._sorted_keys, keys)
+        found = slots < len(self._sorted_keys)
+        found[found] = self._sorted_keys[slots[found]] == keys[found]
+        ungapped = self._order[slots[found]]
+
+        positions = np.zeros(len(keys), dtype=np.int64)
+        positions[found] = (self._ungapped[ungapped] if gapped else ungapped) + 1
+        return positions, found
+
+
+class ChainContext:
+    """
+    What the predictors and the predictors table need from a chain.
+
+    The PDB file is scanned once by `from_file`, the context only keeps
+    plain values so it is cheap to keep around and to send to another process.
+    """
+
+    def __init__(
+        self, pdb_file, chain_id, index, residues, first_residue, pdb_bytes
+    ):
+        """
+        Initialize the context.
+
+        Parameters
+        ----------
+        pdb_file : str
+            Path to the PDB file.
+        chain_id : str
+            Chain identifier.
+        index : ResidueIndex
+            The index between the sequence and the residues of the chain.
+        residues : list
+            The numbers of the residues of the chain, HETATM excluded.
+        first_residue : int
+            The number of the first residue of the chain, HETATM included.
+        pdb_bytes : bytes
+            The records of the chain in the first model, as a PDB file.
+
+        """
+        self.pdb_file = pdb_file
+        self.chain_id = chain_id
+        self.index = index
+        self.residues = residues
+        self.first_residue = first_residue
+        self.pdb_bytes = pdb_bytes
+        self.digest = hashlib.sha256(pdb_bytes).hexdigest()
+
+        present = set(residues)
+        self.missing = []
+        if residues:
+            self.missing = [
+                item
+                for item in range(residues[0], residues[-1] + 1)
+                if item not in present
+            ]
+
+    @classmethod
+    def from_file(cls, pdb_file, chain_id):
+        """
+        Read a chain from a PDB file.
+
+        Parameters
+        ----------
+        pdb_file : str or pathlib.Path
+            Path to the PDB file.
+        chain_id : str
+            Chain identifier.
+
+        Returns
+        -------
+        context : ChainContext
+            The context of the chain.
+
+        Raises
+        ------
+        ChainException
+            If the chain is not in the first model of the file.
+
+        """
+        atoms, lines = scan_chain(pdb_file, chain_id, use_mmap=True)
+        with _PARSES_LOCK:
+            PARSES[str(pdb_file)] += 1
+        log.debug(f"Scanned {pdb_file} for chain {chain_id}")
+
+        if not len(atoms):
+            raise ChainException(f"Could not find chain {chain_id} in {pdb_file}")
+
+        first, _ = residue_bounds(atoms)
+        residues = atoms[first]
+        # the sequence unpacks the point mutations, like Bio.SeqIO does
+        unpacked = atoms[residue_bounds(atoms, unpacked=True)[0]]
+        index = ResidueIndex.from_residues(
+            unpacked["resseq"],
+            unpacked["icode"],
+            np.char.upper(unpacked["resname"]).astype(str),
+        )
+
+        return cls(
+            str(pdb_file),
+            chain_id,
+            index,
+            residues["resseq"][~residues["het"]].tolist(),
+            int(residues["resseq"][0]),
+            b"".join(line + b"\n" for line in lines) + b"END\n",
+        )
+
+    @property
+    def sequence(self):
+        """str or None : The gapped sequence, None if there is no amino acid."""
+        return self.index.sequence or None
+
+    @property
+    def bias(self):
+        """int : Offset of the PDB numbering, the first residue being 1."""
+        return self.first_residue - 1
+
+    def __repr__(self):
+        return (
+            f"ChainContext({self.pdb_file!r}, {self.chain_id!r}, "
+            f"{len(self.residues)} residues)"
+        )
+
+
+@functools.lru_cache(maxsize=int(CONTEXT_CACHE_SIZE))
+def _cached_context(pdb_file, chain_id, mtime, size):
+    # the modification time and size are part of the key, an edited file is
+    #  read again
+    return ChainContext.from_file(pdb_file, chain_id)
+
+
+def get_context(pdb_file, chain_id):
+    """
+    Get the context of a chain, parsing its file only the first time.
+
+    Parameters
+    ----------
+    pdb_file : str or pathlib.Path
+        Path to the PDB file.
+    chain_id : str
+        Chain identifier.
+
+    Returns
+    -------
+    context : ChainContext
+        The context shared by every caller asking for this chain.
+
+    """
+    stat = os.stat(pdb_file)
+    # one chain is parsed at a time, concurrent callers wait for the same one
+    #  rather than parsing it again
+    with _CONTEXTS_LOCK:
+        return _cached_context(
+            str(pdb_file), chain_id, stat.st_mtime_ns, stat.st_size
+        )
+
@@ -2,12 +2,13 @@
 import json
 import logging
 import sys
-import time
 import os
-import pandas as pd
-import requests
+import numpy as np
 
 from cport.exceptions import ServerConnectionException
+from cport.modules.polling import PollPolicy
+from cport.modules.session import get_session
+from cport.modules.table import PredictionTable
 from cport.url import CSM_POTENTIAL_URL
 
 log = logging.getLogger("cportlog")
@@ -35,8 +36,13 @@ class CsmPotential:
         """
         self.chain_id = chain_id
         self.pdb_file = pdb_file
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "csm_potential",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -51,7 +57,7 @@ class CsmPotential:
         """
         data = {"pdb_file": self.pdb_file}
 
-        req = requests.post(CSM_POTENTIAL_URL, data=data)
+        req = get_session().post(CSM_POTENTIAL_URL, data=data)
 
         response = req.json()
         if "job_id" in response:
@@ -62,6 +68,32 @@ class CsmPotential:
             raise ServerConnectionException("CSM-Potential submission failed")
         return job_id
 
+    @staticmethod
+    def poll(job_id=None):
+        """
+        Check once if the results are available.
+
+        Parameters
+        ----------
+        job_id : string
+            The id assigned by the csm-potential server.
+
+        Returns
+        -------
+        response : dict or None
+            A dict containing the chains and the predictions, None if the job
+            is still running.
+
+        """
+        data = {"job_id": job_id}
+        req = get_session().get(CSM_POTENTIAL_URL, data=data)
+        response = req.json()
+
+        if "status" in response:
+            return None
+
+        return response
+
     def retrieve_prediction(self, job_id=None):
         """
         Wait for the results to be available.
@@ -77,25 +109,20 @@ class CsmPotential:
             A dict containing the chains and the predictions.
 
         """
-        data = {"job_id": job_id}
         completed = False
         while not completed:
-            # Check if the result page exists
-            req = requests.get(CSM_POTENTIAL_URL, data=data)
-            response = req.json()
-            if "status" not in response:
+            response = self.poll(job_id=job_id)
+            if response:
                 completed = True
-
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
                 log.error(f"CSM-Potential server is not responding, job id was {job_id}")
                 raise ServerConnectionException(f"CSM-Potential server is not responding, job id was {job_id}")
-
             else:
                 # still running, wait a bit
-                log.debug(f"Waiting for CSM-Potential to finish... {self.tries}")
-                time.sleep(self.wait)
-                self.tries -= 1
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for CSM-Potential to finish... {delay:.0f}s")
+                self.policy.wait(delay)
 
         return response
 
@@ -112,12 +139,11 @@ class CsmPotential:
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
             and passive sites.
 
         """
-        prediction_dict = {"active": [], "passive": []}
         key = "Chain " + self.chain_id
 
         if test_file:
@@ -128,28 +154,39 @@ class CsmPotential:
         else:
             results = prediction[key]
 
-        result_dict = pd.DataFrame.from_dict(results)
+        residues = np.array([row["resnumber"] for row in results], dtype=int)
+        # a missing prediction is a nan, never above the threshold
+        scores = np.array([row["prediction"] for row in results], dtype=float)
 
-        for row in result_dict.itertuples():
-            # the webserver uses any value above 0.5 to indicate interaction
-            if row.prediction >= 0.5:
-                interaction = True
-                # adds standardized score to positive residues
-                score = row.prediction
-            else:
-                interaction = False
+        # the webserver uses any value above 0.5 to indicate interaction
+        interaction = scores >= 0.5
 
-            residue_number = row.resnumber
-            if interaction:
-                prediction_dict["active"].append([int(residue_number), float(score)])
-            elif not interaction:
-                prediction_dict["passive"].append(int(residue_number))
-            else:
-                log.warning(
-                    f"There appears that residue {row} is either empty or unprocessable"
-                )
+        # adds standardized score to positive residues
+        return PredictionTable.from_masks(
+            residues,
+            scores,
+            active=interaction,
+            passive=~interaction,
+            passive_scores=False,
+        )
 
-        return prediction_dict
+    def collect(self, prediction):
+        """
+        Parse the results of a finished job.
+
+        Parameters
+        ----------
+        prediction : dict
+            Dict containing the interaction prediction for each chain.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return self.parse_prediction(prediction=prediction)
 
     def run(self):
         """
@@ -157,15 +194,17 @@ class CsmPotential:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the raw prediction results.
+        prediction_dict : PredictionTable
+            A table containing the raw prediction results.
 
         """
         log.info("Running CSM-Potential")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
         job_id = self.submit()
+        self.policy.wait(self.policy.start())
         results = self.retrieve_prediction(job_id=job_id)
-        prediction_dict = self.parse_prediction(prediction=results)
+        self.policy.finish()
+        prediction_dict = self.collect(results)
 
         return prediction_dict
@@ -0,0 +1,88 @@
+"""Detached runs, the jobs are submitted now and collected by later runs."""
+import json
+import logging
+import os
+from pathlib import Path
+
+log = logging.getLogger("cportlog")
+
+RUN_FILE = "cport_run.json"
+
+
+def load_run(output_dir):
+    """
+    Read the plan of a detached run.
+
+    Parameters
+    ----------
+    output_dir : str or pathlib.Path
+        Results output directory of the run.
+
+    Returns
+    -------
+    run : dict
+        The `entries` of the run, an empty plan if nothing was submitted to
+        this directory.
+
+    """
+    path = Path(output_dir, RUN_FILE)
+    if not path.exists():
+        return {"entries": []}
+
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def save_run(output_dir, run):
+    """
+    Write the plan of a detached run, atomically.
+
+    Parameters
+    ----------
+    output_dir : str or pathlib.Path
+        Results output directory of the run.
+    run : dict
+        The plan, as returned by `load_run`.
+
+    """
+    path = Path(output_dir, RUN_FILE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w") as handle:
+        json.dump(run, handle, indent=2, default=str)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp_path, path)
+
+
+def add_entries(run, entries):
+    """
+    Add entries to a run, replacing the ones for the same PDB/chain pair.
+
+    The PDB paths are made absolute, so the run can be collected from another
+    working directory. Each entry keeps the `pred` and `model` options it was
+    submitted with, the entries of a run are planned apart.
+
+    Parameters
+    ----------
+    run : dict
+        The plan, as returned by `load_run`.
+    entries : list
+        Entries with their `pdb_file`, `chain_id`, `pred`, optional `model` and
+        `output_dir`; `pred` and `model` are the options of `cli.model_plan`.
+
+    """
+    planned = {
+        (entry["pdb_file"], entry["chain_id"]): entry for entry in run["entries"]
+    }
+    for entry in entries:
+        pdb_file = str(Path(entry["pdb_file"]).resolve())
+        planned[(pdb_file, entry["chain_id"])] = {
+            "pdb_file": pdb_file,
+            "chain_id": entry["chain_id"],
+            "pred": list(entry["pred"]) if entry["pred"] is not None else None,
+            "model": list(entry["model"]) if entry.get("model") else None,
+            "output_dir": str(Path(entry["output_dir"]).resolve()),
+            "written": False,
+        }
+    run["entries"] = list(planned.values())
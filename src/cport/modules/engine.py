@@ -0,0 +1,221 @@
+"""NumPy forward pass of the ML models, TensorFlow is only needed to export them."""
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+log = logging.getLogger("cportlog")
+
+# Rows of features computed at once, bounds the memory of the hidden layers
+ENGINE_BATCH = os.environ.get("CPORT_ENGINE_BATCH") if os.environ.get("CPORT_ENGINE_BATCH") is not None else 4096
+
+
+def _sigmoid(values):
+    # 1 / (1 + exp(-x)) without overflowing for the large negative values
+    return np.exp(-np.logaddexp(0, -values))
+
+
+ACTIVATIONS = {
+    "linear": lambda values: values,
+    "relu": lambda values: np.maximum(values, 0),
+    "tanh": np.tanh,
+    "sigmoid": _sigmoid,
+}
+
+# layers that do nothing at inference
+PASSTHROUGH_LAYERS = ("InputLayer", "Dropout")
+
+
+class DenseNetwork:
+    """
+    A stack of dense layers, applied with NumPy.
+
+    The arrays of the network are the ones of the Keras model it was exported
+    from, the forward pass computes in `float32` like Keras does.
+    """
+
+    def __init__(self, layers):
+        """
+        Initialize the network.
+
+        Parameters
+        ----------
+        layers : list
+            The `(kernel, bias, activation)` of each layer, in order.
+
+        Raises
+        ------
+        ValueError
+            If an activation is not in `ACTIVATIONS`.
+
+        """
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation {activation}")
+        self.layers = [
+            (
+                np.asarray(kernel, dtype=np.float32),
+                np.asarray(bias, dtype=np.float32),
+                activation,
+            )
+            for kernel, bias, activation in layers
+        ]
+
+    @classmethod
+    def from_keras(cls, model):
+        """
+        Take the weights of a Keras model.
+
+        Parameters
+        ----------
+        model : keras.Sequential
+            The model, made of Dense layers and of the `PASSTHROUGH_LAYERS`.
+
+        Returns
+        -------
+        network : DenseNetwork
+            The network of the model.
+
+        Raises
+        ------
+        ValueError
+            If the model holds another kind of layer.
+
+        """
+        layers = []
+        for layer in model.layers:
+            kind = layer.__class__.__name__
+            if kind in PASSTHROUGH_LAYERS:
+                continue
+            if kind != "Dense":
+                raise ValueError(f"Unsupported layer {layer.name} ({kind})")
+            config = layer.get_config()
+            kernel, *bias = layer.get_weights()
+            if not bias:
+                bias = [np.zeros(kernel.shape[1], dtype=np.float32)]
+            layers.append((kernel, bias[0], config["activation"]))
+        return cls(layers)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a network saved by `save`.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            Path to the `.npz` file.
+
+        Returns
+        -------
+        network : DenseNetwork
+            The network.
+
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            activations = arrays["activations"].tolist()
+            return cls(
+                [
+                    (arrays[f"kernel_{item}"], arrays[f"bias_{item}"], activation)
+                    for item, activation in enumerate(activations)
+                ]
+            )
+
+    def save(self, path):
+        """
+        Write the network to a compressed `.npz` file.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            Path to the file.
+
+        """
+        arrays = {"activations": np.array([layer[2] for layer in self.layers])}
+        for item, (kernel, bias, _) in enumerate(self.layers):
+            arrays[f"kernel_{item}"] = kernel
+            arrays[f"bias_{item}"] = bias
+        with open(path, "wb") as handle:
+            np.savez_compressed(handle, **arrays)
+
+    def predict(self, features, batch_size=None, verbose=None):
+        """
+        Apply the network, like the `predict` method of a Keras model.
+
+        Parameters
+        ----------
+        features : pandas.DataFrame or numpy.ndarray
+            The features, one row per residue.
+        batch_size : int
+            Rows computed at once, defaults to `ENGINE_BATCH`.
+        verbose : int
+            Ignored, there is no progress bar.
+
+        Returns
+        -------
+        probabilities : numpy.ndarray
+            The output of the last layer, one row per residue.
+
+        """
+        features = np.asarray(features, dtype=np.float32)
+        if features.ndim == 1:
+            features = features[np.newaxis]
+        batch_size = int(batch_size if batch_size else ENGINE_BATCH)
+
+        outputs = np.empty(
+            (len(features), self.layers[-1][0].shape[1]), dtype=np.float32
+        )
+        for start in range(0, len(features), batch_size):
+            values = features[start : start + batch_size]
+            for kernel, bias, activation in self.layers:
+                values = ACTIVATIONS[activation](values @ kernel + bias)
+            outputs[start : start + batch_size] = values
+        return outputs
+
+
+def export_model(model_dir, npz_file=None):
+    """
+    Export a Keras SavedModel to the `.npz` file read by `DenseNetwork.load`.
+
+    Parameters
+    ----------
+    model_dir : str or pathlib.Path
+        The directory of the SavedModel.
+    npz_file : str or pathlib.Path
+        Path to the exported file, defaults to the directory with a `.npz`
+        suffix.
+
+    Returns
+    -------
+    npz_file : pathlib.Path
+        Path to the exported file.
+
+    """
+    # only the export needs tensorflow
+    from tensorflow import keras
+
+    model_dir = Path(model_dir)
+    npz_file = Path(npz_file) if npz_file is not None else npz_path(model_dir)
+    DenseNetwork.from_keras(keras.models.load_model(model_dir)).save(npz_file)
+    log.info(f"Exported {model_dir} to {npz_file}")
+    return npz_file
+
+
+def npz_path(model_dir):
+    """
+    Get the path of the exported file of a model.
+
+    Parameters
+    ----------
+    model_dir : str or pathlib.Path
+        The directory of the SavedModel.
+
+    Returns
+    -------
+    npz_file : pathlib.Path
+        The `.npz` file next to the directory.
+
+    """
+    model_dir = Path(model_dir)
+    return model_dir.with_name(model_dir.name + ".npz")
@@ -22,3 +22,23 @@ class IncompleteInputError(Error):
             )
 
         return f"{self.message} {self.predictor_name}"
+
+
+class CacheMissError(Error):
+    """Raised when a prediction is not cached and the network cannot be used."""
+
+    def __init__(self, predictor_name, pdb_file=None, chain_id=None):
+        self.predictor_name = predictor_name
+        self.pdb_file = pdb_file
+        self.chain_id = chain_id
+        self.message = "No cached result for"
+        super().__init__(self.message)
+
+    def __str__(self):
+        if self.pdb_file:
+            return (
+                f"{self.message} {self.predictor_name} predictor, "
+                f"{self.pdb_file} chain {self.chain_id}"
+            )
+
+        return f"{self.message} {self.predictor_name}"
@@ -3,15 +3,14 @@ import logging
 import re
 import sys
 import tempfile
-import time
 import os
 
-from urllib import request
-
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
 import pandas as pd
 
+from cport.modules.polling import PollPolicy
+from cport.modules.session import download, fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.url import ISPRED4_URL
 
 log = logging.getLogger("cportlog")
@@ -19,6 +18,8 @@ log = logging.getLogger("cportlog")
 # Total wait (seconds) = WAIT_INTERVAL * NUM_RETRIES
 WAIT_INTERVAL = os.environ.get("ISPRED4_WAIT_INTERVAL") if os.environ.get("ISPRED4_WAIT_INTERVAL") is not None else 60 # seconds
 NUM_RETRIES = os.environ.get("ISPRED4_NUM_RETRIES") if os.environ.get("ISPRED4_NUM_RETRIES") is not None else 36
+# The completion time of a running job is a placeholder
+RUNNING_PATTERN = re.compile(rb">--<")
 
 
 class Ispred4:
@@ -38,8 +39,13 @@ class Ispred4:
         """
         self.pdb_file = pdb_file
         self.chain_id = chain_id
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "ispred4",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -51,7 +57,7 @@ class Ispred4:
             The url to the summary page.
 
         """
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
         browser.open(ISPRED4_URL)
 
         input_form = browser.select_form(nr=0)
@@ -79,9 +85,10 @@ class Ispred4:
 
         return summary_url
 
-    def retrieve_prediction_link(self, url=None, page_text=None):
+    @staticmethod
+    def poll(url=None, page_text=None):
         """
-        Retrieve the results.
+        Check once if the prediction is finished.
 
         Parameters
         ----------
@@ -92,49 +99,65 @@ class Ispred4:
 
         Returns
         -------
-        download_link : str
-            The link to the results file.
+        download_url : str or None
+            The link to the results file, None if the job is still running.
 
         """
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # this is used in the testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
             # https://regex101.com/r/ulO1lf/1
             job_id = re.findall(r"id=(.*)", str(page_text))[0]
         else:
-            browser.open(url)
+            page = fetch_page(url)
             # https://regex101.com/r/ulO1lf/1
             job_id = re.findall(r"id=(.*)", str(url))[0]
 
+        # Check if the completion time has replaced the placeholder string
+        # https://regex101.com/r/fK3U6b/1
+        match = RUNNING_PATTERN.search(page)
+
+        if match:
+            return None
+
+        return f"{ISPRED4_URL}downloadjob?jobid={job_id}"
+
+    def retrieve_prediction_link(self, url=None, page_text=None):
+        """
+        Retrieve the results.
+
+        Parameters
+        ----------
+        url : str
+            The url to the result results.
+        page_text : str
+            The text of the page to parse - used for testing.
+
+        Returns
+        -------
+        download_link : str
+            The link to the results file.
+
+        """
         completed = False
         while not completed:
-            # Check if the completion time has replaced the placeholder string
-            # https://regex101.com/r/fK3U6b/1
-            match = re.findall(r">--<", str(browser.page))
-
-            if not match:
+            download_url = self.poll(url=url, page_text=page_text)
+            if download_url:
                 completed = True
-            else:
-                # still running, wait a bit
-                log.debug(f"Waiting for ISPRED4 to finish... {self.tries}")
-                time.sleep(self.wait)
-                browser.open(url)
-                self.tries -= 1
-
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
                 log.error(f"ISPRED4 server is not responding, url was {url}")
                 raise ServerConnectionException(f"ISPRED4 server is not responding, url was {url}")
-                    
-
-        download_url = f"{ISPRED4_URL}downloadjob?jobid={job_id}"
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for ISPRED4 to finish... {delay:.0f}s")
+                self.policy.wait(delay)
 
         return download_url
 
     @staticmethod
-    def download_result(download_link):
+    def download_result(download_link, token=None):
         """
         Download the results.
 
@@ -142,6 +165,8 @@ class Ispred4:
         ----------
         download_link : str
             The link to the results file.
+        token : CancelToken
+            Token stopping the download.
 
         Returns
         -------
@@ -150,7 +175,8 @@ class Ispred4:
 
         """
         temp_file = tempfile.NamedTemporaryFile(delete=False)
-        request.urlretrieve(download_link, temp_file.name)
+        temp_file.close()
+        download(download_link, temp_file.name, token=token)
         return temp_file.name
 
     @staticmethod
@@ -165,29 +191,91 @@ class Ispred4:
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
             and passive sites.
 
         """
-        prediction_dict = {"active": [], "passive": []}
-
         # textfile with whitespaces as delimiter
-        final_predictions = pd.read_csv(result_file, skiprows=15, delim_whitespace=True)
+        final_predictions = pd.read_csv(
+            result_file,
+            skiprows=15,
+            delim_whitespace=True,
+            usecols=["ResNum", "Inter", "Probability"],
+        )
 
         # only surface residues have a yes or no in the Inter column, all skipped
         #  residues are buried
-        for row in final_predictions.itertuples():
-            if row.Inter == "yes":  # indicates high likelihood of interaction
-                prediction_dict["active"].append(
-                    [int(row.ResNum), float(row.Probability)]
-                )
-            elif row.Inter == "no":
-                prediction_dict["passive"].append(
-                    [int(row.ResNum), float(row.Probability)]
-                )
+        final_predictions = final_predictions[
+            final_predictions["Inter"].isin(["yes", "no"])
+        ]
+
+        # indicates high likelihood of interaction
+        return PredictionTable.from_masks(
+            final_predictions["ResNum"].astype(int),
+            final_predictions["Probability"].astype(float),
+            active=final_predictions["Inter"] == "yes",
+            passive=final_predictions["Inter"] == "no",
+        )
+
+    def collect(self, prediction_link):
+        """
+        Download and parse the results of a finished job.
 
-        return prediction_dict
+        Parameters
+        ----------
+        prediction_link : str
+            The link to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return self.parse(self.fetch(prediction_link))
+
+    def fetch(self, prediction_link):
+        """
+        Download the results of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_link : str
+            The link to the results file.
+
+        Returns
+        -------
+        result_file : str
+            The path to the results file.
+
+        """
+        return self.download_result(prediction_link, token=self.policy.token)
+
+    @staticmethod
+    def parse(result_file):
+        """
+        Parse downloaded results and remove them, the parsing stage.
+
+        Runs in a worker process, so it only takes the path to the file.
+
+        Parameters
+        ----------
+        result_file : str
+            The path to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        try:
+            return Ispred4.parse_prediction(result_file)
+        finally:
+            os.remove(result_file)
 
     def run(self):
         """
@@ -195,16 +283,17 @@ class Ispred4:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the raw prediction.
+        prediction_dict : PredictionTable
+            A table containing the raw prediction.
 
         """
         log.info("Running ISPRED4")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_link = self.retrieve_prediction_link(url=submitted_url)
-        result_file = self.download_result(prediction_link)
-        prediction_dict = self.parse_prediction(result_file)
+        self.policy.finish()
+        prediction_dict = self.collect(prediction_link)
 
         return prediction_dict
@@ -0,0 +1,213 @@
+"""Persistent journal of the submitted jobs."""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from cport.modules.scheduler import COLLECT, POLL
+
+log = logging.getLogger("cportlog")
+
+JOURNAL_NAME = "cport_journal.jsonl"
+
+# states in which the server already has the job, these can be resumed
+RESUMABLE_STATES = (POLL, COLLECT)
+
+
+def submitted_time(entry):
+    """
+    Find when the job of a journal entry was submitted.
+
+    Parameters
+    ----------
+    entry : dict
+        A journal entry.
+
+    Returns
+    -------
+    submitted : float or None
+        The wall-clock time of the submission, None if unknown.
+
+    """
+    if "submitted" in entry:
+        return entry["submitted"]
+    # the journals written before the submission time was kept only know it
+    #  while the job is polled, its entry is then the one of the submission
+    return entry["time"] if entry["state"] == POLL else None
+
+
+class JobJournal:
+    """
+    Append-only JSONL journal of the job transitions.
+
+    Every transition is written and synced to disk straight away, so a crash
+    only loses the step that was running. Opening a journal keeps the jobs that
+    were still on the servers and drops the finished ones.
+    """
+
+    def __init__(self, path):
+        """
+        Open the journal, creating it if needed.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            Path to the journal file.
+
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.entries = {
+            key: entry
+            for key, entry in self.load(self.path).items()
+            if entry["state"] in RESUMABLE_STATES
+        }
+        self._lock = threading.Lock()
+        self._compact()
+        self._handle = open(self.path, "a")
+
+    @staticmethod
+    def load(path):
+        """
+        Read the latest entry of each job from a journal file.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            Path to the journal file.
+
+        Returns
+        -------
+        entries : dict
+            The latest entry of each job, by job key.
+
+        """
+        entries = {}
+        if not Path(path).exists():
+            return entries
+
+        with open(path) as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a crash while writing leaves a truncated last line
+                    log.warning(f"Skipping corrupted journal line in {path}")
+                    continue
+                entries[entry["key"]] = entry
+
+        return entries
+
+    def _compact(self):
+        """Rewrite the journal with only the resumable jobs."""
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w") as handle:
+            for entry in self.entries.values():
+                handle.write(json.dumps(entry) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.path)
+
+    def record(self, job):
+        """
+        Write the current state of a job.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The job that changed state.
+
+        Raises
+        ------
+        ValueError
+            If the job handle or link is not JSON serializable.
+
+        """
+        now = time.time()
+        with self._lock:
+            previous = self.entries.get(job.key)
+        if previous is not None and previous["handle"] == job.handle:
+            submitted = submitted_time(previous)
+        else:
+            # the job enters the polling state once the server has it
+            submitted = now if job.state == POLL else None
+        entry = {
+            "key": job.key,
+            "name": job.name,
+            "state": job.state,
+            "handle": job.handle,
+            "link": job.link,
+            "time": now,
+            "submitted": submitted,
+        }
+        try:
+            line = json.dumps(entry)
+        except TypeError as thrown_exception:
+            # the job could not be collected by a later run
+            raise ValueError(
+                f"The handle of {job.key} cannot be saved in the journal"
+            ) from thrown_exception
+        with self._lock:
+            self.entries[job.key] = entry
+            if self._handle.closed:
+                return
+            self._handle.write(line + "\n")
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+
+    def resume(self, job):
+        """
+        Restore a job that was already submitted in a previous run.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            A freshly created job.
+
+        Returns
+        -------
+        resumed : bool
+            True if the job was found in the journal and restored.
+
+        """
+        entry = self.entries.get(job.key)
+        if (
+            not entry
+            or entry["name"] != job.name
+            or entry["state"] not in RESUMABLE_STATES
+        ):
+            return False
+
+        job.state = entry["state"]
+        job.handle = entry["handle"]
+        job.link = entry["link"]
+        submitted = submitted_time(entry)
+        if submitted is not None:
+            job.policy.resume(submitted)
+        return True
+
+    def outstanding(self):
+        """
+        List the jobs that are still on the servers.
+
+        Returns
+        -------
+        entries : list
+            The journal entries of the resumable jobs.
+
+        """
+        return [
+            entry
+            for entry in self.entries.values()
+            if entry["state"] in RESUMABLE_STATES
+        ]
+
+    def close(self):
+        """Flush and close the journal."""
+        with self._lock:
+            if not self._handle.closed:
+                self._handle.flush()
+                os.fsync(self._handle.fileno())
+                self._handle.close()
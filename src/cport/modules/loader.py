@@ -2,9 +2,12 @@
 import logging
 from functools import partial
 
+from cport.exceptions import CircuitOpenException
+from cport.modules.breaker import get_breaker, server_failure
+from cport.modules.cache import cache_key
 from cport.modules.cons_ppisp import ConsPPISP
 from cport.modules.csm_potential import CsmPotential
-from cport.modules.error import IncompleteInputError
+from cport.modules.error import CacheMissError, IncompleteInputError
 from cport.modules.ispred4 import Ispred4
 from cport.modules.meta_ppisp import MetaPPISP
 from cport.modules.predictprotein_api import Predictprotein
@@ -300,8 +303,58 @@ PDB_PREDICTORS = {
 
 FASTA_PREDICTORS = {"placeholder": run_placeholder}
 
+PREDICTOR_CLASSES = {
+    "cons_ppisp": ConsPPISP,
+    "ispred4": Ispred4,
+    "meta_ppisp": MetaPPISP,
+    "predictprotein": Predictprotein,
+    "predus2": Predus2,
+    "psiver": Psiver,
+    "scriber": Scriber,
+    "sppider": Sppider,
+    "whiscy": Whiscy,
+    "csm_potential": CsmPotential,
+    "scannet": ScanNet,
+}
+
 
-def run_prediction(prediction_method, **kwargs):
+def load_predictor(prediction_method, **kwargs):
+    """
+    Initialize a predictor so its submit/poll/collect steps can be scheduled.
+
+    Parameters
+    ----------
+    prediction_method : str
+        Prediction method to be loaded.
+    kwargs : dict
+        Keyword arguments.
+
+    Returns
+    -------
+    predictor : object
+        The predictor instance.
+
+    Raises
+    ------
+    IncompleteInputError
+        If the input is incomplete.
+    ValueError
+        If the prediction method cannot be scheduled.
+
+    """
+    if prediction_method not in PREDICTOR_CLASSES:
+        raise ValueError(f"Unknown prediction method: {prediction_method}")
+
+    if not kwargs["pdb_file"]:
+        raise IncompleteInputError(predictor_name=prediction_method, missing="pdb_file")
+
+    if not kwargs["chain_id"]:
+        raise IncompleteInputError(predictor_name=prediction_method, missing="chain_id")
+
+    return PREDICTOR_CLASSES[prediction_method](kwargs["pdb_file"], kwargs["chain_id"])
+
+
+def run_prediction(prediction_method, cache=None, **kwargs):
     """
     Select predictors to run.
 
@@ -309,6 +362,8 @@ def run_prediction(prediction_method, **kwargs):
     ----------
     prediction_method : str
         Prediction method to be run.
+    cache : ResultCache
+        Cache answering the predictions it already has.
     kwargs : dict
         Keyword arguments.
 
@@ -322,10 +377,15 @@ def run_prediction(prediction_method, **kwargs):
     ------
     IncompleteInputError
         If the input is incomplete.
+    CacheMissError
+        If the cache is offline and does not have the prediction.
+    CircuitOpenException
+        If the predictor server is considered down.
     ValueError
         If the prediction method is not supported.
 
     """
+    key = None
     if prediction_method in PDB_PREDICTORS:
         if not kwargs["pdb_file"]:
             raise IncompleteInputError(
@@ -343,6 +403,17 @@ def run_prediction(prediction_method, **kwargs):
             pdb_file=kwargs["pdb_file"],
         )
 
+        if cache is not None:
+            key = cache_key(prediction_method, kwargs["pdb_file"], kwargs["chain_id"])
+            result = cache.get(key)
+            if result is not None:
+                log.info(f"Using cached result for {prediction_method}")
+                return result
+            if cache.offline:
+                raise CacheMissError(
+                    prediction_method, kwargs["pdb_file"], kwargs["chain_id"]
+                )
+
     elif prediction_method in FASTA_PREDICTORS:
         if not kwargs["fasta_file"]:
             raise IncompleteInputError(
@@ -354,8 +425,21 @@ def run_prediction(prediction_method, **kwargs):
     else:
         raise ValueError(f"Unknown prediction method: {prediction_method}")
 
+    breaker = get_breaker(prediction_method)
+    if not breaker.allow():
+        raise CircuitOpenException(f"{prediction_method} server is down")
+
     log.info(f"Running method: {prediction_method}")
 
-    result = predictor_func()
+    try:
+        result = predictor_func()
+    except Exception as thrown_exception:
+        if server_failure(thrown_exception):
+            breaker.record_failure()
+        raise
+    breaker.record_success()
+
+    if key is not None:
+        cache.put(key, prediction_method, result)
 
     return result
@@ -3,19 +3,18 @@
 # so should be first to be examined if the output
 # increases accuracy of CPORT, if it does not
 # this predictor should be scrapped
-import io
 import logging
 import re
 import sys
 import tempfile
-import time
 import os
 
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
 import pandas as pd
-import requests
 
+from cport.modules.polling import PollPolicy
+from cport.modules.session import download, fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.url import META_PPISP_URL
 
 log = logging.getLogger("cportlog")
@@ -23,6 +22,8 @@ log = logging.getLogger("cportlog")
 # Total wait (seconds) = WAIT_INTERVAL * NUM_RETRIES
 WAIT_INTERVAL = os.environ.get("META_PPISP_WAIT_INTERVAL") if os.environ.get("META_PPISP_WAIT_INTERVAL") is not None else 60 # seconds
 NUM_RETRIES = os.environ.get("META_PPISP_NUM_RETRIES") if os.environ.get("META_PPISP_NUM_RETRIES") is not None else 300
+# The result page of a running job does not exist yet
+NOT_FOUND_PATTERN = re.compile(rb"404 Not Found")
 
 
 class MetaPPISP:
@@ -43,8 +44,13 @@ class MetaPPISP:
         self.pdb_file = pdb_file
         self.chain_id = chain_id
         self.prediction_dict = {}
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "meta_ppisp",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -56,7 +62,7 @@ class MetaPPISP:
             The url of the meta-PPISP processing page.
 
         """
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
         # SSL request fails, try to find alternative solution as this would save
         # a lot of code
         browser.open(META_PPISP_URL, verify=False)
@@ -77,54 +83,76 @@ class MetaPPISP:
 
         return processing_url
 
-    def retrieve_prediction_link(self, url=None, page_text=None):
+    @staticmethod
+    def poll(url=None, page_text=None):
         """
-        Retrieve the link to the meta-PPISP prediction page.
+        Check once if the meta-PPISP result page exists.
 
         Parameters
         ----------
         url : str
             The url of the meta-PPISP processing page.
         page_text : str
-            The text of the meta-PPISP processing page.
+            The text of the page to parse - used for testing.
 
         Returns
         -------
-        url : str
-            The url of the obtained meta-PPISP prediction page.
+        url : str or None
+            The url of the meta-PPISP prediction page, None if the job is still
+            running.
 
         """
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # this is used in the testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
             url = page_text
         else:
-            browser.open(url, verify=False)
+            page = fetch_page(url, verify=False)  # nosec
+
+        # Check if the result page exists
+        match = NOT_FOUND_PATTERN.search(page)
+
+        if match:
+            return None
+
+        return url
+
+    def retrieve_prediction_link(self, url=None, page_text=None):
+        """
+        Retrieve the link to the meta-PPISP prediction page.
+
+        Parameters
+        ----------
+        url : str
+            The url of the meta-PPISP processing page.
+        page_text : str
+            The text of the meta-PPISP processing page.
+
+        Returns
+        -------
+        url : str
+            The url of the obtained meta-PPISP prediction page.
 
+        """
         completed = False
         while not completed:
-            # Check if the result page exists
-            match = re.search(r"404 Not Found", str(browser.page))
-            if not match:
+            prediction_url = self.poll(url=url, page_text=page_text)
+            if prediction_url:
                 completed = True
-            else:
-                # still running, wait a bit
-                log.debug(f"Waiting for meta-PPISP to finish... {self.tries}")
-                time.sleep(self.wait)
-                browser.refresh()
-                self.tries -= 1
-
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
                 log.error(f"meta-PPISP server is not responding, url was {url}")
                 raise ServerConnectionException(f"meta-PPISP server is not responding, url was {url}")
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for meta-PPISP to finish... {delay:.0f}s")
+                self.policy.wait(delay)
 
-        return url
+        return prediction_url
 
     @staticmethod
-    def download_result(download_link):
+    def download_result(download_link, token=None):
         """
         Download the results.
 
@@ -132,17 +160,20 @@ class MetaPPISP:
         ----------
         download_link : str
             The url of the meta-PPISP result page.
+        token : CancelToken
+            Token stopping the download.
 
         Returns
         -------
         temp_file.name : str
-            The name of the temporary file containing the results.
+            The path to the results file.
 
         """
         temp_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_file.close()
         # this verify=False is a security issue but i'm afraid there's
         #  no trivial solution and that the issue might be of the server
-        temp_file.name = requests.get(download_link, verify=False).content  # nosec
+        download(download_link, temp_file.name, token=token, verify=False)  # nosec
         return temp_file.name
 
     def parse_prediction(self, url=None, test_file=None):
@@ -158,65 +189,129 @@ class MetaPPISP:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the active and passive residue predictions.
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
 
         """
-        prediction_dict = {"active": [], "passive": []}
-
         if test_file:
-            final_predictions = pd.read_csv(
-                test_file,
-                skiprows=12,
-                delim_whitespace=True,
-                names=[
-                    "AA",
-                    "Ch",
-                    "AA_nr",
-                    "cons_ppisp",
-                    "PINUP",
-                    "Promate",
-                    "meta_ppisp",
-                    "Prediction",
-                ],
-                header=0,
-                skipfooter=12,
-                index_col=False,
-            )
-        else:
-            # direct reading of page with read_csv is impossible due to the
-            #  same SSL error
-            file = self.download_result(url)
-            final_predictions = pd.read_csv(
-                io.StringIO(file.decode("utf-8")),
-                skiprows=12,
-                delim_whitespace=True,
-                names=[
-                    "AA",
-                    "Ch",
-                    "AA_nr",
-                    "cons_ppisp",
-                    "PINUP",
-                    "Promate",
-                    "meta_ppisp",
-                    "Prediction",
-                ],
-                header=0,
-                skipfooter=12,
-                index_col=False,
-            )
-
-        for row in final_predictions.itertuples():
-            if row.Prediction == "P":  # positive for interaction
-                # save confidence of prediction
-                # trunk-ignore(flake8/W605)
-                score = [int(re.sub("\D", "", row.AA_nr)), float(row.meta_ppisp)]
-                prediction_dict["active"].append(score)
-            elif row.Prediction == "N":
-                # trunk-ignore(flake8/W605)
-                prediction_dict["passive"].append(int(re.sub("\D", "", row.AA_nr)))
-
-        return prediction_dict
+            return self.read_prediction(test_file)
+
+        # direct reading of page with read_csv is impossible due to the
+        #  same SSL error
+        return self.parse(self.fetch(url))
+
+    @staticmethod
+    def read_prediction(result_file):
+        """
+        Read the meta-PPISP results file.
+
+        Parameters
+        ----------
+        result_file : str
+            The path to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
+
+        """
+        final_predictions = pd.read_csv(
+            result_file,
+            skiprows=12,
+            delim_whitespace=True,
+            names=[
+                "AA",
+                "Ch",
+                "AA_nr",
+                "cons_ppisp",
+                "PINUP",
+                "Promate",
+                "meta_ppisp",
+                "Prediction",
+            ],
+            header=0,
+            skipfooter=12,
+            index_col=False,
+        )
+
+        # skips the rows that are not residues
+        final_predictions = final_predictions[
+            final_predictions["Prediction"].isin(["P", "N"])
+        ]
+        residues = (
+            final_predictions["AA_nr"]
+            .astype(str)
+            .str.replace(r"\D", "", regex=True)
+            .astype(int)
+        )
+
+        # save confidence of prediction
+        return PredictionTable.from_masks(
+            residues,
+            final_predictions["meta_ppisp"].astype(float),
+            # positive for interaction
+            active=final_predictions["Prediction"] == "P",
+            passive=final_predictions["Prediction"] == "N",
+            passive_scores=False,
+        )
+
+    def collect(self, prediction_url):
+        """
+        Download and parse the results of a finished job.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
+
+        """
+        return self.parse(self.fetch(prediction_url))
+
+    def fetch(self, prediction_url):
+        """
+        Download the results of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        result_file : str
+            The path to the results file.
+
+        """
+        return self.download_result(prediction_url, token=self.policy.token)
+
+    @staticmethod
+    def parse(result_file):
+        """
+        Parse downloaded results and remove them, the parsing stage.
+
+        Runs in a worker process, so it only takes the path to the file.
+
+        Parameters
+        ----------
+        result_file : str
+            The path to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
+
+        """
+        try:
+            return MetaPPISP.read_prediction(result_file)
+        finally:
+            os.remove(result_file)
 
     def run(self):
         """
@@ -224,15 +319,17 @@ class MetaPPISP:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the active and passive residue predictions.
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
 
         """
         log.info("Running meta-PPISP")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_url = self.retrieve_prediction_link(url=submitted_url)
-        self.prediction_dict = self.parse_prediction(url=prediction_url)
+        self.policy.finish()
+        self.prediction_dict = self.collect(prediction_url)
 
         return self.prediction_dict
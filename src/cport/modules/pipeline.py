@@ -0,0 +1,44 @@
+"""Process pool running the CPU-bound stages of a run."""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cport.modules.registry import warm_up
+
+log = logging.getLogger("cportlog")
+
+# Processes parsing the results, standardizing the residues and running the ML
+#  models, 0 keeps this work in the main process
+NUM_PROCESSES = os.environ.get("CPORT_NUM_PROCESSES") if os.environ.get("CPORT_NUM_PROCESSES") is not None else os.cpu_count() or 1
+
+
+def process_pool(num_processes=None):
+    """
+    Create the pool of the CPU-bound stages.
+
+    The workers are spawned rather than forked, forking a process whose threads
+    hold locks, like the scheduler and TensorFlow ones, can deadlock the child.
+    Each worker loads the models of `registry.WARM_MODELS` when it starts.
+
+    Parameters
+    ----------
+    num_processes : int
+        Number of worker processes, defaults to `NUM_PROCESSES`.
+
+    Returns
+    -------
+    pool : concurrent.futures.ProcessPoolExecutor or None
+        The pool, None if the stages run in the main process.
+
+    """
+    num_processes = int(num_processes if num_processes is not None else NUM_PROCESSES)
+    if num_processes < 1:
+        return None
+
+    log.info(f"Parsing and ML models run on {num_processes} processes")
+    return ProcessPoolExecutor(
+        max_workers=num_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=warm_up,
+    )
@@ -0,0 +1,296 @@
+"""Plan the predictors the ML models need and run each model as early as possible."""
+import copy
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from cport.modules.context import get_context
+from cport.modules.registry import REGISTRY, warm_up
+from cport.modules.utils import format_output
+
+log = logging.getLogger("cportlog")
+
+
+def minimal_predictors(models, order):
+    """
+    Find the smallest set of predictors needed by the ML models.
+
+    Parameters
+    ----------
+    models : dict
+        The ML models, each with the list of predictors it `needed`.
+    order : list
+        Order of the predictors, the features of the models follow it.
+
+    Returns
+    -------
+    pred : list
+        The predictors needed by at least one model, in the given order.
+
+    """
+    needed = {item for model in models for item in models[model]["needed"]}
+    return [item for item in order if item in needed] + sorted(
+        item for item in needed if item not in order
+    )
+
+
+def run_model(model, result_dic, pdb_file, chain_id, output_dir, context=None):
+    """
+    Write the features of an ML model and apply it.
+
+    Parameters
+    ----------
+    model : function
+        The ML model, reading a predictors table.
+    result_dic : dict
+        The results of the predictors the model needs, in feature order.
+    pdb_file : str
+        Path to pdb file.
+    chain_id : str
+        Chain identifier.
+    output_dir: str
+        Results output directory.
+    context : ChainContext
+        The parsed chain, read from the file if not given.
+
+    """
+    output_path = Path(output_dir)
+    if not output_path.exists():
+        output_path.mkdir(parents=True, exist_ok=True)
+
+    handle, features_file = tempfile.mkstemp(
+        prefix=f"features_{model.__name__}_", suffix=".csv", dir=output_path
+    )
+    os.close(handle)
+    try:
+        format_output(
+            result_dic,
+            output_fname=features_file,
+            pdb_file=pdb_file,
+            chain_id=chain_id,
+            context=context,
+        )
+        log.info(f"Running ML predictor {model.__name__}")
+        model(features_file, output_dir=output_dir)
+    finally:
+        os.remove(features_file)
+
+
+def entry_context(entry):
+    """
+    Get the parsed chain of an entry, for the models running in other processes.
+
+    Parameters
+    ----------
+    entry : dict
+        The entry, with its `pdb_file` and `chain_id`.
+
+    Returns
+    -------
+    context : ChainContext or None
+        The context of the chain, None if the file cannot be read, the model
+        then reports the error.
+
+    """
+    try:
+        return get_context(entry["pdb_file"], entry["chain_id"])
+    except Exception as thrown_exception:
+        log.debug(thrown_exception)
+        return None
+
+
+class Planner:
+    """
+    Run the ML models of each entry as soon as their predictors completed.
+
+    The planner is told about every predictor result, or failure, of every
+    entry. Once all the predictors a model `needed` are there, the model runs
+    in the background, in a thread or a process pool, while the other jobs are
+    still polled. A predictor is still needed while the predictors table is a
+    requested output, or while a model that uses it can still run; the jobs
+    of the others can be cancelled.
+    """
+
+    def __init__(self, models, keep_predictors=True, executor=None):
+        """
+        Initialize the planner.
+
+        Parameters
+        ----------
+        models : dict
+            The requested ML models, each with the list of predictors it
+            `needed`.
+        keep_predictors : bool
+            The predictors table is a requested output, every predictor of an
+            entry is then needed until it finished.
+        executor : concurrent.futures.Executor
+            Executor running the models, shared with the caller; defaults to
+            a single thread of its own.
+
+        """
+        self.models = models
+        self.keep_predictors = keep_predictors
+        self._entries = {}
+        self._futures = []
+        self._own_executor = executor is None
+        # by default the models, loading their weights from disk, run one at
+        #  a time
+        self._executor = (
+            executor
+            if executor is not None
+            else ThreadPoolExecutor(max_workers=1, thread_name_prefix="cport-ml")
+        )
+        if self._own_executor:
+            # the models of `registry.WARM_MODELS` load while the servers run,
+            #  the worker processes of a shared pool load them when they start
+            self._executor.submit(warm_up)
+
+    def add(self, index, entry):
+        """
+        Plan the models of an entry.
+
+        Parameters
+        ----------
+        index : int
+            Position of the entry in the run.
+        entry : dict
+            The entry, with its `pdb_file`, `chain_id`, `pred` and optional
+            `output_dir`, `models` and `keep_predictors`; the last two replace
+            the ones of the planner for this entry.
+
+        """
+        models = entry.get("models", self.models)
+        self._entries[index] = {
+            "entry": entry,
+            "models": models,
+            "keep_predictors": entry.get("keep_predictors", self.keep_predictors),
+            "results": {},
+            "failed": set(),
+            "pending": list(models),
+            "skipped": [],
+        }
+        self._schedule(self._entries[index])
+
+    def update(self, index, predictor, result):
+        """
+        Record the outcome of a predictor and run the models it completes.
+
+        Parameters
+        ----------
+        index : int
+            Position of the entry in the run.
+        predictor : str
+            Name of the predictor.
+        result : dict or None
+            The prediction of the predictor, None if it failed.
+
+        """
+        state = self._entries[index]
+        if result is None:
+            state["failed"].add(predictor)
+        else:
+            state["results"][predictor] = result
+        self._schedule(state)
+
+    def needs(self, index, predictor):
+        """
+        Check if a requested output still depends on a predictor.
+
+        Parameters
+        ----------
+        index : int
+            Position of the entry in the run.
+        predictor : str
+            Name of the predictor.
+
+        Returns
+        -------
+        needed : bool
+            False once no requested output can use its result anymore.
+
+        """
+        state = self._entries[index]
+        if state["keep_predictors"]:
+            return True
+
+        return any(
+            predictor in state["models"][model]["needed"]
+            for model in state["pending"]
+        )
+
+    def _schedule(self, state):
+        entry = state["entry"]
+        for model in list(state["pending"]):
+            needed = state["models"][model]["needed"]
+            if any(
+                item in state["failed"] or item not in entry["pred"] for item in needed
+            ):
+                # can never run, its remaining predictors may be cancelled
+                state["pending"].remove(model)
+                state["skipped"].append(model)
+            elif all(item in state["results"] for item in needed):
+                state["pending"].remove(model)
+                features = {
+                    item: copy.deepcopy(state["results"][item])
+                    for item in entry["pred"]
+                    if item in needed
+                }
+                self._futures.append(
+                    (
+                        model,
+                        entry,
+                        self._executor.submit(
+                            run_model,
+                            model,
+                            features,
+                            entry["pdb_file"],
+                            entry["chain_id"],
+                            entry.get("output_dir", "output"),
+                            entry_context(entry),
+                        ),
+                    )
+                )
+
+    def finish(self, pending=True):
+        """
+        Wait for the models still running and report the ones skipped.
+
+        Parameters
+        ----------
+        pending : bool
+            Also report the models still waiting for predictors, that will not
+            run anymore.
+
+        """
+        try:
+            for model, entry, future in self._futures:
+                try:
+                    future.result()
+                except Exception as thrown_exception:
+                    log.error(
+                        f"Error running ML predictor {model.__name__} on "
+                        f"{entry['pdb_file']} chain {entry['chain_id']}"
+                    )
+                    log.error(thrown_exception)
+        finally:
+            if self._own_executor:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+        REGISTRY.log_stats()
+
+        for state in self._entries.values():
+            for model in state["skipped"] + (state["pending"] if pending else []):
+                log.warning(
+                    f"Not all needed predictors returned a result for "
+                    f"{state['entry']['pdb_file']} chain {state['entry']['chain_id']}, "
+                    f"skipping ML model {model.__name__}."
+                )
+                log.warning(
+                    "Missing predictors: "
+                    + ", ".join(
+                        item
+                        for item in state["models"][model]["needed"]
+                        if item not in state["results"]
+                    )
+                )
@@ -0,0 +1,367 @@
+"""Adaptive polling policy for the prediction servers."""
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+from cport.exceptions import JobCancelledException
+from cport.modules.cache import CACHE_DIR
+from cport.modules.utils import get_fasta_from_pdbfile
+
+log = logging.getLogger("cportlog")
+
+# Growth of the delay between two polls of the same job
+BACKOFF_FACTOR = 1.5
+# Random spread of each delay, so the jobs of a batch do not poll in lockstep
+JITTER = 0.2
+# The backoff starts at this fraction of the configured interval...
+MIN_INTERVAL_FRACTION = 0.25
+# ...and stops growing at this multiple of it
+MAX_INTERVAL_FACTOR = 2
+# The first poll is sent once this fraction of the expected latency passed
+FIRST_POLL_FRACTION = 0.8
+# Weight of the newest job in the running average of the latencies
+LATENCY_SMOOTHING = 0.3
+LATENCY_FILE = "latency.json"
+
+
+@functools.lru_cache(maxsize=4096)
+def chain_length(pdb_file, chain_id):
+    """
+    Count the residues of a chain.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to PDB file.
+    chain_id : str
+        Chain identifier.
+
+    Returns
+    -------
+    length : int or None
+        The length of the chain sequence, None if it cannot be read.
+
+    """
+    try:
+        return len(get_fasta_from_pdbfile(pdb_file, chain_id))
+    except Exception as thrown_exception:
+        log.debug(f"Could not read the length of {pdb_file} chain {chain_id}")
+        log.debug(thrown_exception)
+        return None
+
+
+class LatencyHistory:
+    """
+    Running average of the seconds per residue each predictor takes.
+
+    The averages are kept in a small JSON file next to the result cache, so
+    every run starts from the latencies observed by the previous ones.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the history, the file is only read when first needed.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            Path to the history file.
+
+        """
+        self.path = Path(path)
+        self._rates = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._rates is None:
+            try:
+                with open(self.path) as handle:
+                    self._rates = json.load(handle)
+            except (OSError, ValueError):
+                self._rates = {}
+        return self._rates
+
+    def estimate(self, name, length):
+        """
+        Estimate how long a job takes.
+
+        Parameters
+        ----------
+        name : str
+            Name of the predictor.
+        length : int
+            Number of residues of the chain.
+
+        Returns
+        -------
+        latency : float or None
+            The expected latency in seconds, None without history.
+
+        """
+        with self._lock:
+            entry = self._load().get(name)
+        if not entry or not length:
+            return None
+
+        return entry["rate"] * length
+
+    def record(self, name, length, latency):
+        """
+        Add the latency of a finished job to the history.
+
+        Parameters
+        ----------
+        name : str
+            Name of the predictor.
+        length : int
+            Number of residues of the chain.
+        latency : float
+            Seconds between the submission and the results being ready.
+
+        """
+        if not length:
+            return
+
+        rate = latency / length
+        with self._lock:
+            rates = self._load()
+            entry = rates.setdefault(name, {"rate": rate, "count": 0})
+            entry["rate"] += LATENCY_SMOOTHING * (rate - entry["rate"])
+            entry["count"] += 1
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = self.path.with_suffix(".tmp")
+                with open(temp_path, "w") as handle:
+                    json.dump(rates, handle)
+                os.replace(temp_path, self.path)
+            except OSError as thrown_exception:
+                log.debug(f"Could not save the latency history: {thrown_exception}")
+
+
+HISTORY = LatencyHistory(Path(CACHE_DIR, LATENCY_FILE))
+
+
+class CancelToken:
+    """
+    Cooperative cancellation of a predictor job.
+
+    Threads cannot be stopped from outside, so the polling loops wait on the
+    token instead of sleeping and check it before each request; a cancelled
+    job raises `JobCancelledException` within one poll tick.
+    """
+
+    def __init__(self):
+        """Initialize a token that is not cancelled."""
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        """Whether the job was cancelled."""
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the job, waking up its thread if it is waiting."""
+        self._event.set()
+
+    def check(self):
+        """
+        Stop here if the job was cancelled.
+
+        Raises
+        ------
+        JobCancelledException
+            If the job was cancelled.
+
+        """
+        if self._event.is_set():
+            raise JobCancelledException()
+
+    def wait(self, delay):
+        """
+        Sleep, unless the job is cancelled in the meantime.
+
+        Parameters
+        ----------
+        delay : float
+            Seconds to wait.
+
+        Raises
+        ------
+        JobCancelledException
+            If the job was cancelled before or while waiting.
+
+        """
+        if self._event.wait(max(0.0, delay)):
+            raise JobCancelledException()
+
+
+class PollPolicy:
+    """
+    When to poll a job and when to give up on it.
+
+    The first poll waits for most of the latency expected from the history of
+    the predictor and the length of the chain. The following ones back off
+    exponentially with jitter, and the job fails once `deadline` seconds passed
+    since its submission. Its `token` cancels the job.
+    """
+
+    def __init__(
+        self,
+        name,
+        interval,
+        deadline,
+        pdb_file=None,
+        chain_id=None,
+        history=None,
+        token=None,
+    ):
+        """
+        Initialize the policy.
+
+        Parameters
+        ----------
+        name : str
+            Name of the predictor.
+        interval : float
+            Typical delay between two polls, in seconds.
+        deadline : float
+            Seconds after the submission before the server is considered
+            unresponsive.
+        pdb_file : str
+            Path to PDB file, its length drives the first poll.
+        chain_id : str
+            Chain identifier.
+        history : LatencyHistory
+            Latencies of the previous jobs, defaults to the shared history.
+        token : CancelToken
+            Token cancelling the job, defaults to a new one.
+
+        """
+        self.name = name
+        self.interval = float(interval)
+        self.deadline = float(deadline)
+        self.pdb_file = pdb_file
+        self.chain_id = chain_id
+        self.history = history if history is not None else HISTORY
+        self.token = token if token is not None else CancelToken()
+        self.started = None
+        # when the server got the job, on the monotonic clock, None if unknown
+        self.submitted = None
+        self.polls = 0
+
+    @property
+    def length(self):
+        """Number of residues of the chain, None if unknown."""
+        if self.pdb_file is None:
+            return None
+        return chain_length(self.pdb_file, self.chain_id)
+
+    def _elapsed(self):
+        # jobs resumed or polled without a submission start the clock here
+        if self.started is None:
+            self.started = time.monotonic()
+        return time.monotonic() - self.started
+
+    def start(self):
+        """
+        Start the clock of a job that was just submitted.
+
+        Returns
+        -------
+        delay : float
+            Seconds to wait before the first poll.
+
+        """
+        self.started = time.monotonic()
+        self.submitted = self.started
+        self.polls = 0
+
+        estimate = self.history.estimate(self.name, self.length)
+        if estimate is None:
+            return 0.0
+
+        return min(estimate * FIRST_POLL_FRACTION, self.deadline)
+
+    def resume(self, submitted):
+        """
+        Restore when a job submitted by a previous run was submitted.
+
+        The deadline of the job still runs from its first poll in this run,
+        only the latency recorded by `finish` goes back to the submission.
+
+        Parameters
+        ----------
+        submitted : float
+            Time of the submission, on the wall clock (`time.time`).
+
+        """
+        ago = max(0.0, time.time() - submitted)
+        self.submitted = time.monotonic() - ago
+
+    def next_delay(self):
+        """
+        Compute the delay before the next poll of a job still running.
+
+        Returns
+        -------
+        delay : float
+            Seconds to wait, never past the deadline.
+
+        """
+        remaining = self.deadline - self._elapsed()
+        delay = min(
+            self.interval
+            * MIN_INTERVAL_FRACTION
+            * BACKOFF_FACTOR ** min(self.polls, 32),
+            self.interval * MAX_INTERVAL_FACTOR,
+        )
+        self.polls += 1
+        delay *= random.uniform(1 - JITTER, 1 + JITTER)  # nosec
+
+        return max(0.0, min(delay, remaining))
+
+    def wait(self, delay):
+        """
+        Wait before the next request of a job.
+
+        Parameters
+        ----------
+        delay : float
+            Seconds to wait.
+
+        Raises
+        ------
+        JobCancelledException
+            If the job was cancelled before or while waiting.
+
+        """
+        self.token.wait(delay)
+
+    def expired(self):
+        """
+        Check if the deadline passed.
+
+        Returns
+        -------
+        expired : bool
+            True once the server is considered unresponsive.
+
+        """
+        return self._elapsed() >= self.deadline
+
+    def finish(self):
+        """
+        Record the latency of a job whose results are ready.
+
+        Nothing is recorded when the submission time is unknown, the time
+        since the first poll of a resumed job is not its latency.
+        """
+        if self.submitted is not None:
+            self.history.record(
+                self.name, self.length, time.monotonic() - self.submitted
+            )
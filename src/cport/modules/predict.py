@@ -4,7 +4,16 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from tensorflow import keras
+
+from cport.modules.registry import REGISTRY
+
+# directories of the models, under `registry.MODEL_DIR`
+SCRIBER_ISPRED4_SPPIDER_CSM_POTENTIAL_SCANNET_MODEL = (
+    "keras_classifier_scriber_ispred4_sppider_csm_potential_scannet"
+)
+SCRIBER_ISPRED4_SCANNET_SPPIDER_MODEL = (
+    "keras_classifier_scriber_ispred4_scannet_sppider1692711989_668405arch2X16"
+)
 
 
 def mean_calculator(
@@ -12,14 +21,9 @@ def mean_calculator(
     target_predictors: list[str],
 ) -> list[float]:
     """Calculate the mean of the values provided for predictors."""
-    mean_preds = []
-    for _, row in df.iterrows():
-        value = 0.0
-        for predictor in target_predictors:
-            value += row[predictor]
-        value = value / len(target_predictors)
-        mean_preds.append(value)
-    return mean_preds
+    # summed in the order of the predictors, one row at a time
+    values = df[target_predictors].to_numpy(dtype=np.float64)
+    return (values.sum(axis=1) / len(target_predictors)).tolist()
 
 
 def read_pred(path: str) -> dict[str, list[str]]:
@@ -67,77 +71,147 @@ def format_predictions(pred_int_dict):
     return pred_int_dict
 
 
-def scriber_ispred4_sppider_csm_potential_scannet(prediction_csv: str, threshold=0.6):
-    """Apply the `scriber_ispred4_sppider_csm_potential_scannet` model."""
-
-    pred_res = read_pred(path=prediction_csv)
-    model_path = "model/keras_classifier_scriber_ispred4_sppider_csm_potential_scannet"
-    pred_dict = format_predictions(pred_res)
-    predictor = pred_dict.pop("predictor")
-    pred = pd.DataFrame(pred_dict)
-    model = keras.models.load_model(model_path)
-    # FIX THE LAYOUT OF THE PREDICTION DICT
-    probabilities = model.predict(pred)  # type: ignore
-    prediction = [1 if prob > threshold else 0 for prob in np.ravel(probabilities)]
+def scriber_ispred4_sppider_csm_potential_scannet_output(
+    residues, features: pd.DataFrame, probabilities, threshold: float = 0.6
+) -> pd.DataFrame:
+    """
+    Build the output table of the `scriber_ispred4_sppider_csm_potential_scannet` model.
 
-    output_dic = {}
+    Parameters
+    ----------
+    residues : list
+        The residue numbers.
+    features : pandas.DataFrame
+        The features given to the model, one column per predictor.
+    probabilities : numpy.ndarray
+        The output of the model.
+    threshold : float
+        Probability above which a residue is predicted active.
+
+    Returns
+    -------
+    out_csv : pandas.DataFrame
+        The `threshold_pred`, `probabilities` and `residue` of each residue.
 
-    probabilities_edit = []
-    residue_edit = []
-    for item in probabilities.tolist():
-        probabilities_edit.append(item[0])
+    """
+    probabilities = np.ravel(probabilities)
+    return pd.DataFrame(
+        {
+            "threshold_pred": (probabilities > threshold).astype(int),
+            "probabilities": probabilities.astype(np.float64),
+            "residue": np.asarray(residues, dtype=int),
+        }
+    )
 
-    for item in predictor:
-        residue_edit.append(int(item))
 
-    output_dic["threshold_pred"] = prediction
-    output_dic["probabilities"] = probabilities_edit
-    output_dic["residue"] = residue_edit
+def scriber_ispred4_scannet_sppider_output(
+    residues, features: pd.DataFrame, probabilities, threshold: float = 0.6
+) -> pd.DataFrame:
+    """
+    Build the output table of the `scriber_ispred4_scannet_sppider` model.
 
-    if not Path("output").exists():
-        Path("output").mkdir()
+    Parameters
+    ----------
+    residues : list
+        The residue numbers.
+    features : pandas.DataFrame
+        The features given to the model, one column per predictor.
+    probabilities : numpy.ndarray
+        The output of the model.
+    threshold : float
+        Probability above which a residue is predicted active.
+
+    Returns
+    -------
+    out_csv : pandas.DataFrame
+        The `residue`, `cport_scores`, `threshold_pred` and `mean_scores` of
+        each residue.
 
-    save_file = "output/cport_ML_scriber_ispred4_sppider_csm_potential_scannet.csv"
-    out_csv = pd.DataFrame(output_dic)
-    out_csv.to_csv(save_file)
+    """
+    probabilities = np.ravel(probabilities)
+    return pd.DataFrame(
+        {
+            "residue": np.asarray(residues, dtype=int),
+            "cport_scores": probabilities.astype(np.float64),
+            "threshold_pred": (probabilities > threshold).astype(int),
+            "mean_scores": mean_calculator(
+                df=features,
+                target_predictors=["scriber", "ispred4", "scannet", "sppider"],
+            ),
+        }
+    )
 
 
-def scriber_ispred4_scannet_sppider(
-    prediction_csv: str, threshold: float = 0.6
+# the directory of each model, the builder of its output table and the file
+#  the table is saved to
+MODEL_OUTPUTS = {
+    "scriber_ispred4_sppider_csm_potential_scannet": {
+        "model": SCRIBER_ISPRED4_SPPIDER_CSM_POTENTIAL_SCANNET_MODEL,
+        "output": scriber_ispred4_sppider_csm_potential_scannet_output,
+        "file_name": "cport_ML_scriber_ispred4_sppider_csm_potential_scannet.csv",
+    },
+    "scriber_ispred4_scannet_sppider": {
+        "model": SCRIBER_ISPRED4_SCANNET_SPPIDER_MODEL,
+        "output": scriber_ispred4_scannet_sppider_output,
+        "file_name": "cport_ML_scriber_ispred4_scannet_sppider.csv",
+    },
+}
+
+
+def apply_model(
+    name: str, prediction_csv: str, threshold: float = 0.6, output_dir: str = "output"
 ) -> None:
-    """Apply the `scriber_ispred4_scannet_sppider` model."""
+    """
+    Apply a model to a predictors table and save its output table.
+
+    Parameters
+    ----------
+    name : str
+        The name of the model, a key of `MODEL_OUTPUTS`.
+    prediction_csv : str
+        Path to the predictors table.
+    threshold : float
+        Probability above which a residue is predicted active.
+    output_dir : str
+        Directory the output table is saved to.
+
+    """
+    spec = MODEL_OUTPUTS[name]
     pred_res = read_pred(path=prediction_csv)
-    model_path = (
-        "model/keras_classifier_scriber"
-        + "_ispred4_scannet_sppider1692711989_668405arch2X16"
-    )
     pred_dict = format_predictions(pred_res)
     predict_residue = pred_dict.pop("predictor")
     pred = pd.DataFrame(pred_dict)
-    model = keras.models.load_model(model_path)
-    probabilities = model.predict(pred)  # type: ignore
-    mean_scores = mean_calculator(
-        df=pred, target_predictors=["scriber", "ispred4", "scannet", "sppider"]
+    probabilities = REGISTRY.predict(spec["model"], pred)
+    out_csv = spec["output"](
+        [int(item) for item in predict_residue], pred, probabilities, threshold
     )
-    prediction = [1 if prob > threshold else 0 for prob in np.ravel(probabilities)]
-    output_dic = {}
 
-    cport_scores = []
-    residue_edit = []
-    for item in probabilities.tolist():
-        cport_scores.append(item[0])
+    if not Path(output_dir).exists():
+        Path(output_dir).mkdir(parents=True)
 
-    for item in predict_residue:
-        residue_edit.append(int(item))
+    save_file = Path(output_dir, spec["file_name"])
+    out_csv.to_csv(save_file)
 
-    output_dic["residue"] = residue_edit
-    output_dic["cport_scores"] = cport_scores
-    output_dic["threshold_pred"] = prediction
-    output_dic["mean_scores"] = mean_scores
 
-    if not Path("output").exists():
-        Path("output").mkdir()
+def scriber_ispred4_sppider_csm_potential_scannet(
+    prediction_csv: str, threshold=0.6, output_dir="output"
+):
+    """Apply the `scriber_ispred4_sppider_csm_potential_scannet` model."""
+    apply_model(
+        "scriber_ispred4_sppider_csm_potential_scannet",
+        prediction_csv,
+        threshold=threshold,
+        output_dir=output_dir,
+    )
 
-    save_file = "output/cport_ML_scriber_ispred4_scannet_sppider.csv"
-    out_csv = pd.DataFrame(output_dic)
-    out_csv.to_csv(save_file)
+
+def scriber_ispred4_scannet_sppider(
+    prediction_csv: str, threshold: float = 0.6, output_dir: str = "output"
+) -> None:
+    """Apply the `scriber_ispred4_scannet_sppider` model."""
+    apply_model(
+        "scriber_ispred4_scannet_sppider",
+        prediction_csv,
+        threshold=threshold,
+        output_dir=output_dir,
+    )
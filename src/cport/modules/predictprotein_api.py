@@ -3,15 +3,16 @@ import json
 import logging
 import re
 import sys
-import time
 import os
 
 from io import StringIO
 
 import pandas as pd
-import requests
 
 from cport.exceptions import ServerConnectionException
+from cport.modules.polling import PollPolicy
+from cport.modules.session import get_session
+from cport.modules.table import PredictionTable
 from cport.modules.utils import get_fasta_from_pdbfile
 from cport.url import PREDICTPROTEIN_API
 
@@ -40,18 +41,25 @@ class Predictprotein:
         """
         self.pdb_file = pdb_file
         self.chain_id = chain_id
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "predictprotein",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
-        Submit request for results, waits if not yet processed.
+        Submit request for results.
+
+        The PredictProtein API is keyed on the sequence itself, so the
+        sequence doubles as the job handle.
 
         Returns
         -------
-        results.text : string
-            A string containing protein interaction
-            prediction results.
+        sequence : string
+            The submitted sequence.
 
         """
         sequence = get_fasta_from_pdbfile(self.pdb_file, self.chain_id)
@@ -61,29 +69,73 @@ class Predictprotein:
 
         data = {"action": "get", "sequence": sequence, "file": "query.prona"}
 
-        results = requests.post(PREDICTPROTEIN_API, data=json.dumps(data))
+        self.policy.token.check()
+        get_session().post(PREDICTPROTEIN_API, data=json.dumps(data))
+
+        return sequence
+
+    @staticmethod
+    def poll(sequence=None):
+        """
+        Check once if the results are available.
+
+        Parameters
+        ----------
+        sequence : string
+            The submitted sequence.
 
+        Returns
+        -------
+        results.text : string or None
+            A string containing protein interaction prediction results, None if
+            the job is still running.
+
+        """
+        data = {"action": "get", "sequence": sequence, "file": "query.prona"}
+
+        results = get_session().post(PREDICTPROTEIN_API, data=json.dumps(data))
+
+        # Check if the result page exists
+        match = re.search(r"No results found|error", str(results.text))
+        if match:
+            return None
+
+        return results.text
+
+    def retrieve_prediction(self, sequence=None):
+        """
+        Wait for the results to be available.
+
+        Parameters
+        ----------
+        sequence : string
+            The submitted sequence.
+
+        Returns
+        -------
+        results.text : string
+            A string containing protein interaction
+            prediction results.
+
+        """
         completed = False
         while not completed:
-            # Check if the result page exists
-            match = re.search(r"No results found|error", str(results.text))
-            if not match:
+            prediction = self.poll(sequence=sequence)
+            if prediction:
                 completed = True
-            else:
-                # still running, wait a bit
-                log.debug(f"Waiting for predictprotein to finish... {self.tries}")
-                time.sleep(self.wait)
-                results = requests.post(PREDICTPROTEIN_API, data=json.dumps(data))
-                self.tries -= 1
-
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
                 log.error(
                     f"predictprotein server is not responding, sequence was {sequence}"
                 )
                 raise ServerConnectionException(f"predictprotein server is not responding, sequence was {sequence}")
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for predictprotein to finish... {delay:.0f}s")
+                self.policy.wait(delay)
 
-        return results.text
+        return prediction
 
     @staticmethod
     def parse_prediction(prediction=None, test_file=None):
@@ -99,13 +151,11 @@ class Predictprotein:
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
             and passive sites.
 
         """
-        prediction_dict = {"active": [], "passive": []}
-
         if test_file:
             # for testing purposes
             result_file = test_file
@@ -120,26 +170,79 @@ class Predictprotein:
             delim_whitespace=True,
         )
 
-        for row in final_predictions.itertuples():
-            # 1 indicates interaction
-            if row.Protein_Pred == 1:
-                interaction = True
-                # adds standardized score to positive residues
-                score = row.Protein_RI / 100
-            else:
-                interaction = False
+        residues = (
+            final_predictions["Residue_Number"].str.split("_").str[-1].astype(int)
+        )
+        # 1 indicates interaction
+        interaction = final_predictions["Protein_Pred"] == 1
+
+        # adds standardized score to positive residues
+        return PredictionTable.from_masks(
+            residues,
+            (final_predictions["Protein_RI"] / 100).astype(float),
+            active=interaction,
+            passive=~interaction,
+            passive_scores=False,
+        )
 
-            residue_number = int(row.Residue_Number.split("_")[-1])
-            if interaction:
-                prediction_dict["active"].append([int(residue_number), float(score)])
-            elif not interaction:
-                prediction_dict["passive"].append(int(residue_number))
-            else:
-                log.warning(
-                    f"There appears that residue {row} is either empty or unprocessable"
-                )
+    def collect(self, prediction):
+        """
+        Parse the results of a finished job.
 
-        return prediction_dict
+        Parameters
+        ----------
+        prediction : string
+            String containing the interaction prediction.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return self.parse(self.fetch(prediction))
+
+    @staticmethod
+    def fetch(prediction):
+        """
+        Hand over the results of a finished job, the download stage.
+
+        The results came with the answer of `poll`, nothing is downloaded.
+
+        Parameters
+        ----------
+        prediction : string
+            String containing the interaction prediction.
+
+        Returns
+        -------
+        prediction : string
+            String containing the interaction prediction.
+
+        """
+        return prediction
+
+    @staticmethod
+    def parse(prediction):
+        """
+        Parse the results of a finished job, the parsing stage.
+
+        Runs in a worker process, so it only takes the text of the results.
+
+        Parameters
+        ----------
+        prediction : string
+            String containing the interaction prediction.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return Predictprotein.parse_prediction(prediction=prediction)
 
     def run(self):
         """
@@ -147,14 +250,17 @@ class Predictprotein:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the raw prediction results.
+        prediction_dict : PredictionTable
+            A table containing the raw prediction results.
 
         """
         log.info("Running PredictProtein")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
-        prediction = self.submit()
-        prediction_dict = self.parse_prediction(prediction=prediction)
+        sequence = self.submit()
+        self.policy.wait(self.policy.start())
+        prediction = self.retrieve_prediction(sequence=sequence)
+        self.policy.finish()
+        prediction_dict = self.collect(prediction)
 
         return prediction_dict
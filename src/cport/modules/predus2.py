@@ -1,19 +1,18 @@
 """PREDUS2 module."""
-import io
 import logging
 import os
 import re
 import sys
 import tempfile
-import time
 
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
 import pandas as pd
-import requests
 from pdbtools.pdb_delhetatm import remove_hetatm
 from pdbtools.pdb_selchain import select_chain
 
+from cport.modules.polling import PollPolicy
+from cport.modules.session import download, fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.url import PREDUS2_URL
 
 log = logging.getLogger("cportlog")
@@ -21,6 +20,8 @@ log = logging.getLogger("cportlog")
 # Total wait (seconds) = WAIT_INTERVAL * NUM_RETRIES
 WAIT_INTERVAL = os.environ.get("PREDUS2_WAIT_INTERVAL") if os.environ.get("PREDUS2_WAIT_INTERVAL") is not None else 10 # seconds
 NUM_RETRIES = os.environ.get("PREDUS2_NUM_RETRIES") if os.environ.get("PREDUS2_NUM_RETRIES") is not None else 24
+# The page of a finished job links the result file
+FINISHED_PATTERN = re.compile(rb"PredUs2.0 result file:")
 # first run of a protein takes longer, repeat runs use stored data
 
 
@@ -42,8 +43,13 @@ class Predus2:
         self.pdb_file = pdb_file
         self.chain_id = chain_id
         self.prediction_dict = {}
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "predus2",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -65,7 +71,7 @@ class Predus2:
             for line in select_chain(open("temp.pdb"), self.chain_id):
                 handle.write(line)
 
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
         browser.open(PREDUS2_URL, verify=False)
 
         input_form = browser.select_form(nr=0)
@@ -86,9 +92,9 @@ class Predus2:
 
         return submission_url
 
-    def retrieve_prediction_link(self, url=None, page_text=None):
+    def poll(self, url=None, page_text=None):
         """
-        Retrieve the results.
+        Check once if the PredUs2 result page exists.
 
         Parameters
         ----------
@@ -99,35 +105,21 @@ class Predus2:
 
         Returns
         -------
-        final_url : str
-            The link to the results file.
+        final_url : str or None
+            The link to the results file, None if the job is still running.
 
         """
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # used for testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
         else:
-            browser.open(url, verify=False)
+            page = fetch_page(url, verify=False)  # nosec
 
-        completed = False
-        while not completed:
-            # Check if the result page exists
-            match = re.search(r"PredUs2.0 result file:", str(browser.page))
-            if match:
-                completed = True
-            else:
-                # still running, wait a bit
-                log.debug(f"Waiting for PredUs2 to finish... {self.tries}")
-                time.sleep(self.wait)
-                browser.refresh()
-                self.tries -= 1
+        # Check if the result page exists
+        match = FINISHED_PATTERN.search(page)
 
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
-                log.error(f"PredUs2 server is not responding, url was {url}")
-                raise ServerConnectionException(f"PredUs2 server is not responding, url was {url}")
+        if not match:
+            return None
 
         # once the server is running again, check if this is the correct url format!
         pdb_name = str(self.pdb_file)[-8:-4]
@@ -137,12 +129,44 @@ class Predus2:
             f"{pdb_name}_{capital_chain_id}.pd2.txt"
         )
 
-        browser.close()
+        return final_url
+
+    def retrieve_prediction_link(self, url=None, page_text=None):
+        """
+        Retrieve the results.
+
+        Parameters
+        ----------
+        url : str
+            The url to the result results.
+        page_text : str
+            The text of the page to parse - used for testing.
+
+        Returns
+        -------
+        final_url : str
+            The link to the results file.
+
+        """
+        completed = False
+        while not completed:
+            final_url = self.poll(url=url, page_text=page_text)
+            if final_url:
+                completed = True
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
+                log.error(f"PredUs2 server is not responding, url was {url}")
+                raise ServerConnectionException(f"PredUs2 server is not responding, url was {url}")
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for PredUs2 to finish... {delay:.0f}s")
+                self.policy.wait(delay)
 
         return final_url
 
     @staticmethod
-    def download_result(download_link):
+    def download_result(download_link, token=None):
         """
         Download the results.
 
@@ -150,6 +174,8 @@ class Predus2:
         ----------
         download_link : str
             The link to the results file.
+        token : CancelToken
+            Token stopping the download.
 
         Returns
         -------
@@ -158,10 +184,10 @@ class Predus2:
 
         """
         temp_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_file.close()
         # this verify=False is a security issue but i'm afraid there's
         #  no trivial solution and that the issue might be of the server
-        temp_file.name = requests.get(download_link, verify=False).content  # nosec
-
+        download(download_link, temp_file.name, token=token, verify=False)  # nosec
         return temp_file.name
 
     def parse_prediction(self, url=None, test_file=None):
@@ -177,37 +203,108 @@ class Predus2:
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
             and passive sites.
 
         """
-        prediction_dict = {"active": [], "passive": []}
-
         if test_file:
             # for testing purposes
-            final_predictions = pd.read_csv(
-                test_file,
-                delim_whitespace=True,
-                header=0,
-                names=["Residue", "Score"],
-            )
-        else:
-            file = self.download_result(url)
-            final_predictions = pd.read_csv(
-                io.StringIO(file.decode("utf-8")),
-                delim_whitespace=True,
-                header=0,
-                names=["Residue", "Score"],
-            )
-
-        for row in final_predictions.itertuples():
-            if row.Score >= 0:  # positive score indicates potential for interaction
-                prediction_dict["active"].append([row.Residue, row.Score])
-            elif row.Score < 0:
-                prediction_dict["passive"].append(row.Residue)
-
-        return prediction_dict
+            return self.read_prediction(test_file)
+
+        return self.parse(self.fetch(url))
+
+    @staticmethod
+    def read_prediction(result_file):
+        """
+        Read the PredUs2 results file.
+
+        Parameters
+        ----------
+        result_file : str
+            The path to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        final_predictions = pd.read_csv(
+            result_file,
+            delim_whitespace=True,
+            header=0,
+            names=["Residue", "Score"],
+        )
+
+        return PredictionTable.from_masks(
+            final_predictions["Residue"],
+            final_predictions["Score"],
+            # positive score indicates potential for interaction
+            active=final_predictions["Score"] >= 0,
+            passive=final_predictions["Score"] < 0,
+            passive_scores=False,
+        )
+
+    def collect(self, prediction_url):
+        """
+        Download and parse the results of a finished job.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return self.parse(self.fetch(prediction_url))
+
+    def fetch(self, prediction_url):
+        """
+        Download the results of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        result_file : str
+            The path to the results file.
+
+        """
+        return self.download_result(prediction_url, token=self.policy.token)
+
+    @staticmethod
+    def parse(result_file):
+        """
+        Parse downloaded results and remove them, the parsing stage.
+
+        Runs in a worker process, so it only takes the path to the file.
+
+        Parameters
+        ----------
+        result_file : str
+            The path to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        try:
+            return Predus2.read_prediction(result_file)
+        finally:
+            os.remove(result_file)
 
     def run(self):
         """
@@ -215,15 +312,17 @@ class Predus2:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the raw prediction results.
+        prediction_dict : PredictionTable
+            A table containing the raw prediction results.
 
         """
         log.info("Running PredUs2")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_url = self.retrieve_prediction_link(url=submitted_url)
-        self.prediction_dict = self.parse_prediction(url=prediction_url)
+        self.policy.finish()
+        self.prediction_dict = self.collect(prediction_url)
 
         return self.prediction_dict
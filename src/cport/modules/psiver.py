@@ -7,16 +7,14 @@ import logging
 import re
 import sys
 import tempfile
-import time
 import os
 
-from io import StringIO
-
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
 import pandas as pd
-import requests
 
+from cport.modules.polling import PollPolicy
+from cport.modules.session import download, fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.modules.utils import get_fasta_from_pdbfile
 from cport.url import PSIVER_URL
 
@@ -25,6 +23,8 @@ log = logging.getLogger("cportlog")
 # Total wait (seconds) = WAIT_INTERVAL * NUM_RETRIES
 WAIT_INTERVAL = os.environ.get("PSIVER_WAIT_INTERVAL") if os.environ.get("PSIVER_WAIT_INTERVAL") is not None else 60 # seconds
 NUM_RETRIES = os.environ.get("PSIVER_NUM_RETRIES") if os.environ.get("PSIVER_NUM_RETRIES") is not None else 300
+# The page of a finished job links the results
+FINISHED_PATTERN = re.compile(rb"All the results are available now.")
 
 
 class Psiver:
@@ -44,8 +44,13 @@ class Psiver:
         """
         self.pdb_file = pdb_file
         self.chain_id = chain_id
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "psiver",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -59,7 +64,7 @@ class Psiver:
         """
         sequence = get_fasta_from_pdbfile(self.pdb_file, self.chain_id)
 
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
         browser.open(PSIVER_URL)
 
         input_form = browser.select_form(nr=0)
@@ -72,9 +77,10 @@ class Psiver:
 
         return wait_link
 
-    def retrieve_prediction_link(self, url=None, page_text=None):
+    @staticmethod
+    def poll(url=None, page_text=None):
         """
-        Retrieve the link to the PSIVER prediction page.
+        Check once if the PSIVER prediction is finished.
 
         Parameters
         ----------
@@ -85,40 +91,30 @@ class Psiver:
 
         Returns
         -------
-        url : str
-            The url of the obtained PSIVER prediction page.
+        final_url : str or None
+            The url of the PSIVER prediction page, None if the job is still
+            running.
 
         """
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # this is used in the testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
             url = page_text
         else:
-            browser.open(url)
+            page = fetch_page(url)
 
-        completed = False
-        while not completed:
-            # Check if the result page exists
-            match = re.search(r"All the results are available now.", str(browser.page))
-            if match:
-                completed = True
-            else:
-                # still running, wait a bit
-                log.debug(f"Waiting for PSIVER to finish... {self.tries}")
-                time.sleep(self.wait)
-                browser.refresh()
-                self.tries -= 1
+        # Check if the result page exists
+        match = FINISHED_PATTERN.search(page)
 
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
-                log.error(f"PSIVER server is not responding, url was {url}")
-                raise ServerConnectionException(f"PSIVER server is not responding, url was {url}")
+        if not match:
+            return None
 
+        browser = get_browser()
         if page_text:
             final_url = url
         else:
+            # the page is only parsed once the job finished
+            browser.open_fake_page(page_text=page, url=url)
             result_link = browser.links()[4]
             browser.follow_link(result_link)
 
@@ -126,10 +122,46 @@ class Psiver:
             browser.follow_link(download_link)
             final_url = browser.url
 
+        browser.close()
+
+        return final_url
+
+    def retrieve_prediction_link(self, url=None, page_text=None):
+        """
+        Retrieve the link to the PSIVER prediction page.
+
+        Parameters
+        ----------
+        url : str
+            The url of the PSIVER processing page.
+        page_text : str
+            The text of the PSIVER processing page.
+
+        Returns
+        -------
+        url : str
+            The url of the obtained PSIVER prediction page.
+
+        """
+        completed = False
+        while not completed:
+            final_url = self.poll(url=url, page_text=page_text)
+            if final_url:
+                completed = True
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
+                log.error(f"PSIVER server is not responding, url was {url}")
+                raise ServerConnectionException(f"PSIVER server is not responding, url was {url}")
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for PSIVER to finish... {delay:.0f}s")
+                self.policy.wait(delay)
+
         return final_url
 
     @staticmethod
-    def download_result(download_link):
+    def download_result(download_link, token=None):
         """
         Download the results.
 
@@ -137,6 +169,8 @@ class Psiver:
         ----------
         download_link : str
             The url of the PSIVER result page.
+        token : CancelToken
+            Token stopping the download.
 
         Returns
         -------
@@ -145,7 +179,8 @@ class Psiver:
 
         """
         temp_file = tempfile.NamedTemporaryFile(delete=False)
-        temp_file.write(requests.get(download_link).content)
+        temp_file.close()
+        download(download_link, temp_file.name, token=token)
         return temp_file.name
 
     def parse_prediction(self, pred_url=None, test_file=None):
@@ -161,21 +196,32 @@ class Psiver:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the active and passive residue predictions.
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
 
         """
-        prediction_dict = {"active": [], "passive": []}
-
         if test_file:
             # for testing purposes
-            result_file = test_file
-        else:
-            download_file = self.download_result(pred_url)
-            with gzip.open(download_file, "rt") as unzip_file:
-                file_content = unzip_file.read()
-            result_file = StringIO(file_content)
+            return self.read_prediction(test_file)
+
+        return self.parse(self.fetch(pred_url))
+
+    @staticmethod
+    def read_prediction(result_file):
+        """
+        Read the PSIVER results.
+
+        Parameters
+        ----------
+        result_file : str or file object
+            The path to the results file, or the file opened as text.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
 
+        """
         final_predictions = pd.read_csv(
             result_file,
             engine="python",
@@ -186,28 +232,75 @@ class Psiver:
             delim_whitespace=True,
         )
 
-        for row in final_predictions.itertuples():
-            # skips bottom rows as this number can vary between results
-            if row.check != "PRED":
-                continue
-            if row.prediction == "-":
-                interaction = False
-            else:
-                interaction = True
-            
-            score = row.score
-
-            residue_number = row.residue
-            if interaction:
-                prediction_dict["active"].append([int(residue_number), float(score)])
-            elif not interaction:
-                prediction_dict["passive"].append([int(residue_number), float(score)])
-            else:
-                log.warning(
-                    f"There appears that residue {row} is either empty or unprocessable"
-                )
+        # skips bottom rows as this number can vary between results
+        final_predictions = final_predictions[final_predictions["check"] == "PRED"]
+        interaction = final_predictions["prediction"] != "-"
 
-        return prediction_dict
+        return PredictionTable.from_masks(
+            final_predictions["residue"].astype(int),
+            final_predictions["score"].astype(float),
+            active=interaction,
+            passive=~interaction,
+        )
+
+    def collect(self, prediction_url):
+        """
+        Download and parse the results of a finished job.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url of the PSIVER result page.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
+
+        """
+        return self.parse(self.fetch(prediction_url))
+
+    def fetch(self, prediction_url):
+        """
+        Download the results of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url of the PSIVER result page.
+
+        Returns
+        -------
+        result_file : str
+            The path to the compressed results file.
+
+        """
+        return self.download_result(prediction_url, token=self.policy.token)
+
+    @staticmethod
+    def parse(result_file):
+        """
+        Parse downloaded results and remove them, the parsing stage.
+
+        Runs in a worker process, so it only takes the path to the file.
+
+        Parameters
+        ----------
+        result_file : str
+            The path to the compressed results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
+
+        """
+        try:
+            # decompressed while it is parsed, never whole in memory
+            with gzip.open(result_file, "rt") as handle:
+                return Psiver.read_prediction(handle)
+        finally:
+            os.remove(result_file)
 
     def run(self):
         """
@@ -215,15 +308,17 @@ class Psiver:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the active and passive residue predictions.
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
 
         """
         log.info("Running PSIVER")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_url = self.retrieve_prediction_link(url=submitted_url)
-        prediction_dict = self.parse_prediction(pred_url=prediction_url)
+        self.policy.finish()
+        prediction_dict = self.collect(prediction_url)
 
         return prediction_dict
@@ -0,0 +1,264 @@
+"""Process-wide registry of the trained ML models, loaded once and kept warm."""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from cport.modules.engine import DenseNetwork, npz_path
+
+log = logging.getLogger("cportlog")
+
+# Directory holding one SavedModel directory per ML model, and their export
+MODEL_DIR = os.environ.get("CPORT_MODEL_DIR") if os.environ.get("CPORT_MODEL_DIR") is not None else "model"
+# `numpy` applies the exported models without tensorflow, `keras` the SavedModels
+MODEL_ENGINE = os.environ.get("CPORT_MODEL_ENGINE") if os.environ.get("CPORT_MODEL_ENGINE") is not None else "numpy"
+# Models loaded when a process starts, comma separated, `all` for every one
+WARM_MODELS = os.environ.get("CPORT_WARM_MODELS") if os.environ.get("CPORT_WARM_MODELS") is not None else ""
+
+
+def load_keras_model(path):
+    """
+    Load a Keras SavedModel.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The directory of the model.
+
+    Returns
+    -------
+    model : keras.Model
+        The model.
+
+    """
+    # tensorflow takes seconds to import, only the processes running a model
+    #  pay for it
+    from tensorflow import keras
+
+    return keras.models.load_model(path)
+
+
+def load_model(path):
+    """
+    Load a model with the engine of `MODEL_ENGINE`.
+
+    The `numpy` engine reads the `.npz` export of the model, the SavedModel is
+    only loaded with Keras when the model was not exported.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The directory of the model.
+
+    Returns
+    -------
+    model : DenseNetwork or keras.Model
+        The model.
+
+    """
+    if MODEL_ENGINE == "numpy" and npz_path(path).is_file():
+        return DenseNetwork.load(npz_path(path))
+    if MODEL_ENGINE == "numpy":
+        log.warning(f"{path} was not exported, loading it with Keras")
+    return load_keras_model(path)
+
+
+class ModelRegistry:
+    """
+    The ML models of a process, each loaded the first time it is used.
+
+    A model is identified by the name of its directory under `model_dir`, or
+    of its `.npz` export.
+    Loading a model holds a lock of its own, so threads asking for the same
+    model wait for a single load while other models load or predict.
+    """
+
+    def __init__(self, model_dir=None, loader=None):
+        """
+        Initialize the registry.
+
+        Parameters
+        ----------
+        model_dir : str or pathlib.Path
+            Directory of the models, defaults to `MODEL_DIR`.
+        loader : function
+            Function loading a model from its directory, defaults to
+            `load_model`.
+
+        """
+        self.model_dir = Path(model_dir if model_dir is not None else MODEL_DIR)
+        self._loader = loader if loader is not None else load_model
+        self._models = {}
+        self._locks = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, name):
+        with self._lock:
+            if name not in self._locks:
+                self._locks[name] = threading.Lock()
+                self._stats[name] = {"loads": 0, "load_seconds": 0.0, "calls": 0}
+            return self._locks[name], self._stats[name]
+
+    def get(self, name):
+        """
+        Get a model, loading it if it is not loaded yet.
+
+        Parameters
+        ----------
+        name : str
+            The name of the model directory.
+
+        Returns
+        -------
+        model : DenseNetwork or keras.Model
+            The model, shared by every caller of the process.
+
+        """
+        lock, stats = self._entry(name)
+        with lock:
+            if name not in self._models:
+                path = self.model_dir / name
+                start = time.monotonic()
+                self._models[name] = self._loader(path)
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    stats["loads"] += 1
+                    stats["load_seconds"] += elapsed
+                log.info(f"Loaded ML model {name} in {elapsed:.2f}s")
+            return self._models[name]
+
+    def predict(self, name, features, **kwargs):
+        """
+        Apply a model.
+
+        Parameters
+        ----------
+        name : str
+            The name of the model directory.
+        features : pandas.DataFrame or numpy.ndarray
+            The features, one row per residue.
+        **kwargs
+            Passed to the `predict` method of the model, e.g. `batch_size`.
+
+        Returns
+        -------
+        probabilities : numpy.ndarray
+            The output of the model.
+
+        """
+        model = self.get(name)
+        _, stats = self._entry(name)
+        with self._lock:
+            stats["calls"] += 1
+        return model.predict(features, **kwargs)
+
+    def available(self):
+        """
+        List the models of the model directory.
+
+        Returns
+        -------
+        names : list
+            The names of the model directories and of the exported models.
+
+        """
+        if not self.model_dir.is_dir():
+            return []
+        return sorted(
+            {
+                path.name[: -len(".npz")] if path.suffix == ".npz" else path.name
+                for path in self.model_dir.iterdir()
+                if path.is_dir() or path.suffix == ".npz"
+            }
+        )
+
+    def warm_up(self, names=None):
+        """
+        Load models before they are needed.
+
+        Parameters
+        ----------
+        names : list
+            The names of the models, every available one if None.
+
+        """
+        for name in names if names is not None else self.available():
+            try:
+                self.get(name)
+            except Exception as thrown_exception:
+                # the prediction that needs it reports the error
+                log.warning(f"Could not load ML model {name}")
+                log.debug(thrown_exception)
+
+    def stats(self):
+        """
+        Count the loads and the calls of each model.
+
+        Returns
+        -------
+        stats : dict
+            The `loads`, `load_seconds` and `calls` of each model, by name.
+
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def log_stats(self):
+        """Log the load time and the calls of each model."""
+        for name, stats in sorted(self.stats().items()):
+            log.info(
+                f"{name}: loaded in {stats['load_seconds']:.2f}s, "
+                f"{stats['calls']} predictions"
+            )
+
+    def clear(self):
+        """Forget the loaded models, the next use loads them again."""
+        with self._lock:
+            self._models.clear()
+
+
+REGISTRY = ModelRegistry()
+
+
+def get_model(name):
+    """
+    Get a model from the registry of the process.
+
+    Parameters
+    ----------
+    name : str
+        The name of the model directory.
+
+    Returns
+    -------
+    model : DenseNetwork or keras.Model
+        The model.
+
+    """
+    return REGISTRY.get(name)
+
+
+def warm_up(names=None):
+    """
+    Load the models configured by `WARM_MODELS` in the registry of the process.
+
+    Used as the initializer of the worker processes, and run in the background
+    by the runs applying models in the main process.
+
+    Parameters
+    ----------
+    names : list
+        The names of the models, defaults to the ones of `WARM_MODELS`.
+
+    """
+    if names is None:
+        if not WARM_MODELS:
+            return
+        names = (
+            None
+            if WARM_MODELS == "all"
+            else [name.strip() for name in WARM_MODELS.split(",") if name.strip()]
+        )
+    REGISTRY.warm_up(names)
@@ -0,0 +1,269 @@
+"""Apply an ML model again to existing predictors tables, without any server."""
+import csv
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cport.modules.predict import MODEL_OUTPUTS
+from cport.modules.registry import REGISTRY
+
+log = logging.getLogger("cportlog")
+
+# Residues given to the model in one call, the tables are concatenated up to it
+RESCORE_BATCH = os.environ.get("CPORT_RESCORE_BATCH") if os.environ.get("CPORT_RESCORE_BATCH") is not None else 65536
+
+# the values of the labels of a predictors table, the other cells are scores
+CELL_VALUES = {"P": 0.0, "-": 0.0, "A": 1.0, "AP": 0.5}
+TABLE_PATTERN = "predictors_*.csv"
+
+
+def find_tables(paths):
+    """
+    Find the predictors tables to rescore.
+
+    Parameters
+    ----------
+    paths : list
+        Predictors tables, or directories searched for `predictors_*.csv`.
+
+    Returns
+    -------
+    tables : list
+        The paths of the tables, each directory sorted.
+
+    """
+    tables = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            tables.extend(sorted(path.rglob(TABLE_PATTERN)))
+        else:
+            tables.append(path)
+    return tables
+
+
+def read_features(path, predictors):
+    """
+    Read the features of a predictors table, like `predict.format_predictions`.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to the predictors table.
+    predictors : list
+        The rows to read, in the order of the features of the model.
+
+    Returns
+    -------
+    residues : numpy.ndarray
+        The residue numbers.
+    features : numpy.ndarray
+        One row per residue, one column per predictor.
+
+    Raises
+    ------
+    KeyError
+        If the table has no row for one of the predictors.
+
+    """
+    with open(path, "r") as handle:
+        rows = {row[0]: row[1:] for row in csv.reader(handle) if row}
+
+    residues = np.array(rows["predictor"], dtype=np.int64)
+    cells = np.array([rows[predictor] for predictor in predictors], dtype=str)
+
+    features = np.zeros(cells.shape, dtype=np.float64)
+    scores = np.ones(cells.shape, dtype=bool)
+    for label, value in CELL_VALUES.items():
+        labelled = cells == label
+        features[labelled] = value
+        scores &= ~labelled
+    features[scores] = cells[scores].astype(np.float64)
+    return residues, features.T
+
+
+def split_csv(out_csv, counts):
+    """
+    Write the tables of consecutive proteins held in one table.
+
+    Formatting one table is much faster than formatting each protein apart.
+
+    Parameters
+    ----------
+    out_csv : pandas.DataFrame
+        The rows of the proteins, one after the other.
+    counts : list
+        The number of rows of each protein.
+
+    Returns
+    -------
+    texts : list
+        The CSV of each protein, as written by `to_csv` of its own table.
+
+    """
+    out_csv = out_csv.set_axis(
+        np.concatenate([np.arange(count) for count in counts]), axis=0
+    )
+    header = "," + ",".join(map(str, out_csv.columns)) + "\n"
+    lines = out_csv.to_csv(header=False).splitlines(keepends=True)
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    return [
+        header + "".join(lines[start:stop])
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+class Rescorer:
+    """
+    Apply a model to many predictors tables, with one call for many tables.
+
+    The features of the tables are concatenated until `batch_residues`, the
+    output table of the batch is then split back per table.
+    """
+
+    def __init__(self, name, predictors, threshold=0.6, batch_residues=None):
+        """
+        Initialize the rescorer.
+
+        Parameters
+        ----------
+        name : str
+            The name of the model, a key of `predict.MODEL_OUTPUTS`.
+        predictors : list
+            The predictors the model needs, in the order of its features.
+        threshold : float
+            Probability above which a residue is predicted active.
+        batch_residues : int
+            Residues per call to the model, defaults to `RESCORE_BATCH`.
+
+        """
+        self.name = name
+        self.spec = MODEL_OUTPUTS[name]
+        self.predictors = list(predictors)
+        self.threshold = threshold
+        self.batch_residues = int(
+            batch_residues if batch_residues is not None else RESCORE_BATCH
+        )
+        self.stats = {"tables": 0, "skipped": 0, "residues": 0, "batches": 0}
+
+    def _predict(self, pending):
+        residues = np.concatenate([item[1] for item in pending])
+        features = np.concatenate([item[2] for item in pending])
+        probabilities = REGISTRY.predict(
+            self.spec["model"], features, batch_size=self.batch_residues, verbose=0
+        )
+        self.stats["batches"] += 1
+        self.stats["residues"] += len(features)
+
+        out_csv = self.spec["output"](
+            residues,
+            pd.DataFrame(features, columns=self.predictors),
+            probabilities,
+            self.threshold,
+        )
+        paths = [item[0] for item in pending]
+        return paths, out_csv, [len(item[1]) for item in pending]
+
+    def rescore(self, tables):
+        """
+        Apply the model to predictors tables.
+
+        Parameters
+        ----------
+        tables : iterable
+            Paths to the predictors tables, read as they are needed.
+
+        Yields
+        ------
+        paths : list
+            Paths to the predictors tables of a batch, in the order of `tables`.
+        out_csv : pandas.DataFrame
+            The output table of the model for the batch, the rows of each
+            table one after the other.
+        counts : list
+            The number of rows of each table.
+
+        """
+        pending = []
+        size = 0
+        for path in tables:
+            try:
+                residues, features = read_features(path, self.predictors)
+            except (OSError, KeyError, ValueError) as thrown_exception:
+                log.warning(f"Skipping {path}, it is not a predictors table")
+                log.debug(thrown_exception)
+                self.stats["skipped"] += 1
+                continue
+            if not len(residues):
+                self.stats["skipped"] += 1
+                continue
+
+            self.stats["tables"] += 1
+            pending.append((Path(path), residues, features))
+            size += len(residues)
+            if size >= self.batch_residues:
+                yield self._predict(pending)
+                pending = []
+                size = 0
+
+        if pending:
+            yield self._predict(pending)
+
+
+def rescore_tables(
+    tables,
+    name,
+    predictors,
+    threshold=0.6,
+    output_dir=None,
+    batch_residues=None,
+):
+    """
+    Apply a model to predictors tables and save its output tables.
+
+    Parameters
+    ----------
+    tables : list
+        Paths to the predictors tables.
+    name : str
+        The name of the model, a key of `predict.MODEL_OUTPUTS`.
+    predictors : list
+        The predictors the model needs, in the order of its features.
+    threshold : float
+        Probability above which a residue is predicted active.
+    output_dir : str
+        Directory of the output tables, in the layout of the tables under
+        their common directory. Each output is saved next to its table if
+        None.
+    batch_residues : int
+        Residues per call to the model, defaults to `RESCORE_BATCH`.
+
+    Returns
+    -------
+    stats : dict
+        The numbers of `tables`, `skipped` tables, `residues` and `batches`.
+
+    """
+    tables = [Path(path) for path in tables]
+    root = (
+        Path(os.path.commonpath([path.resolve().parent for path in tables]))
+        if tables
+        else None
+    )
+
+    rescorer = Rescorer(
+        name, predictors, threshold=threshold, batch_residues=batch_residues
+    )
+    for paths, out_csv, counts in rescorer.rescore(tables):
+        for path, text in zip(paths, split_csv(out_csv, counts)):
+            if output_dir is None:
+                save_dir = path.parent
+            else:
+                save_dir = Path(output_dir, path.resolve().parent.relative_to(root))
+            save_dir.mkdir(parents=True, exist_ok=True)
+            with open(save_dir / rescorer.spec["file_name"], "w") as handle:
+                handle.write(text)
+
+    return rescorer.stats
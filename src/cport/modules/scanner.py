@@ -0,0 +1,222 @@
+"""Fixed-column scanner of the coordinate records of PDB files."""
+import mmap
+import re
+from contextlib import contextmanager
+
+import numpy as np
+
+# records kept when a chain is written to its own PDB file
+CHAIN_RECORDS = (b"ATOM  ", b"HETATM", b"ANISOU", b"TER   ")
+ATOM_RECORDS = (b"ATOM  ", b"HETATM")
+
+# the fields read from the ATOM and HETATM records
+ATOM_DTYPE = np.dtype(
+    [
+        ("het", "?"),
+        ("name", "S4"),
+        ("altloc", "S1"),
+        ("resname", "S3"),
+        ("resseq", "<i4"),
+        ("icode", "S1"),
+        ("bfactor", "<f8"),
+    ]
+)
+
+# the end of the first model, the other ones are not scanned
+ENDMDL_PATTERN = re.compile(rb"^ENDMDL", re.MULTILINE)
+
+
+@contextmanager
+def open_buffer(source, use_mmap=False):
+    """
+    Open the content of a PDB file.
+
+    Parameters
+    ----------
+    source : str, pathlib.Path or bytes
+        Path to the PDB file, or its content.
+    use_mmap : bool
+        Map the file in memory rather than reading it, its pages are then only
+        loaded as they are scanned.
+
+    Yields
+    ------
+    buffer : bytes or mmap.mmap
+        The content of the file.
+
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+        return
+
+    with open(source, "rb") as handle:
+        if not use_mmap:
+            yield handle.read()
+            return
+
+        try:
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            yield b""
+            return
+        try:
+            yield buffer
+        finally:
+            buffer.close()
+
+
+def chain_records(buffer, chain_id, records=CHAIN_RECORDS):
+    """
+    Find the records of a chain in the first model.
+
+    The lines of the other chains are matched against the pattern of the
+    chain but never copied out of the buffer.
+
+    Parameters
+    ----------
+    buffer : bytes or mmap.mmap
+        The content of the PDB file.
+    chain_id : str
+        Chain identifier.
+    records : tuple
+        The record names, padded to six characters.
+
+    Returns
+    -------
+    lines : list
+        The records of the chain, without their line ending.
+
+    """
+    end = ENDMDL_PATTERN.search(buffer)
+    pattern = re.compile(
+        rb"^(?:"
+        + b"|".join(re.escape(record) for record in records)
+        + rb").{15}"
+        + re.escape(chain_id.encode())
+        + rb"[^\r\n]*",
+        re.MULTILINE,
+    )
+    return [
+        match.group()
+        for match in pattern.finditer(
+            buffer, 0, end.start() if end is not None else len(buffer)
+        )
+    ]
+
+
+def _column(matrix, start, stop):
+    # the fixed columns of every line, as one bytes array
+    return np.ascontiguousarray(matrix[:, start:stop]).view(f"S{stop - start}")[:, 0]
+
+
+def _numbers(column, dtype):
+    column = np.char.strip(column)
+    # blank fields read as 0, like Bio.PDB does for the B-factors
+    return np.where(column == b"", b"0", column).astype(dtype)
+
+
+def parse_atoms(lines):
+    """
+    Read the fields of ATOM and HETATM records.
+
+    Parameters
+    ----------
+    lines : list
+        The records, without their line ending.
+
+    Returns
+    -------
+    atoms : numpy.ndarray
+        One row of dtype `ATOM_DTYPE` per record.
+
+    """
+    atoms = np.zeros(len(lines), dtype=ATOM_DTYPE)
+    if not lines:
+        return atoms
+
+    # shorter lines are padded with NUL bytes, read as blank fields
+    matrix = np.array(lines, dtype="S80").view("S1").reshape(len(lines), 80)
+    atoms["het"] = _column(matrix, 0, 6) == b"HETATM"
+    atoms["name"] = _column(matrix, 12, 16)
+    atoms["altloc"] = _column(matrix, 16, 17)
+    atoms["resname"] = _column(matrix, 17, 20)
+    atoms["resseq"] = _numbers(_column(matrix, 22, 26), np.int32)
+    atoms["icode"] = np.char.strip(_column(matrix, 26, 27))
+    atoms["bfactor"] = _numbers(_column(matrix, 60, 66), np.float64)
+    return atoms
+
+
+def residue_bounds(atoms, unpacked=False):
+    """
+    Group the atoms into residues, like Bio.PDB does.
+
+    A residue is identified by its number, insertion code and, for HETATM
+    records, its name; its atoms need not be consecutive. The residues come
+    in the order of their first atom.
+
+    Parameters
+    ----------
+    atoms : numpy.ndarray
+        The atoms, as returned by `parse_atoms`.
+    unpacked : bool
+        Also tell apart the residues with the same identifier and different
+        names, the point mutations, like `get_unpacked_list`.
+
+    Returns
+    -------
+    first : numpy.ndarray
+        Index of the first atom of each residue.
+    last : numpy.ndarray
+        Index of the last atom of each residue.
+
+    """
+    keys = np.zeros(
+        len(atoms),
+        dtype=[("het", "?"), ("resname", "S3"), ("resseq", "<i4"), ("icode", "S1")],
+    )
+    keys["het"] = atoms["het"]
+    keys["resname"] = np.where(
+        atoms["het"] | unpacked, atoms["resname"], np.zeros(1, dtype="S3")
+    )
+    keys["resseq"] = atoms["resseq"]
+    keys["icode"] = atoms["icode"]
+
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    groups = inverse.max() + 1 if len(inverse) else 0
+    first = np.full(groups, len(atoms), dtype=np.int64)
+    np.minimum.at(first, inverse, np.arange(len(atoms)))
+    last = np.zeros(groups, dtype=np.int64)
+    np.maximum.at(last, inverse, np.arange(len(atoms)))
+
+    order = np.argsort(first, kind="stable")
+    return first[order], last[order]
+
+
+def scan_chain(source, chain_id, use_mmap=False):
+    """
+    Scan the records of a chain in the first model of a PDB file.
+
+    Parameters
+    ----------
+    source : str, pathlib.Path or bytes
+        Path to the PDB file, or its content.
+    chain_id : str
+        Chain identifier.
+    use_mmap : bool
+        Map the file in memory rather than reading it.
+
+    Returns
+    -------
+    atoms : numpy.ndarray
+        The ATOM and HETATM records of the chain, of dtype `ATOM_DTYPE`.
+    lines : list
+        Every record of the chain in `CHAIN_RECORDS`, without line ending.
+
+    """
+    with open_buffer(source, use_mmap=use_mmap) as buffer:
+        lines = chain_records(buffer, chain_id)
+
+    atoms = parse_atoms([line for line in lines if line.startswith(ATOM_RECORDS)])
+    return atoms, lines
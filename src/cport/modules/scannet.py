@@ -1,19 +1,20 @@
 """ScanNet module."""
-import io
 import logging
 import re
 import sys
-import time
 import warnings
 import os
 
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
-from Bio import PDB, BiopythonWarning
+from Bio import BiopythonWarning
 
 with warnings.catch_warnings():
     warnings.simplefilter("ignore", BiopythonWarning)
 
+from cport.modules.polling import PollPolicy
+from cport.modules.scanner import residue_bounds, scan_chain
+from cport.modules.session import fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.url import SCANNET_URL
 
 log = logging.getLogger("cportlog")
@@ -21,6 +22,10 @@ log = logging.getLogger("cportlog")
 # Total wait (seconds) = WAIT_INTERVAL * NUM_RETRIES
 WAIT_INTERVAL = os.environ.get("SCANNET_WAIT_INTERVAL") if os.environ.get("SCANNET_WAIT_INTERVAL") is not None else 30 # seconds
 NUM_RETRIES = os.environ.get("SCANNET_NUM_RETRIES") if os.environ.get("SCANNET_NUM_RETRIES") is not None else 36
+# The page of a finished job holds the results in a variable
+FINISHED_PATTERN = re.compile(rb"stringContainingTheWholePdbFile")
+# ... as a PDB file with the scores in the B-factor column
+PDB_PATTERN = re.compile(rb"stringContainingTheWholePdbFile = `(.*?)`", re.DOTALL)
 
 
 class ScanNet:
@@ -40,8 +45,13 @@ class ScanNet:
         """
         self.pdb_file = pdb_file
         self.chain_id = chain_id
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "scannet",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -53,7 +63,7 @@ class ScanNet:
             The url to the processing page.
 
         """
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
         browser.open(SCANNET_URL, verify=False)
 
         input_form = browser.select_form(nr=0)
@@ -68,9 +78,10 @@ class ScanNet:
         log.debug(f"The url being looked at: {processing_url}")
         return processing_url
 
-    def retrieve_prediction_link(self, url=None, page_text=None):
+    @staticmethod
+    def poll(url=None, page_text=None):
         """
-        Retrieve the link to the result page.
+        Check once if the prediction is finished.
 
         Parameters
         ----------
@@ -81,38 +92,58 @@ class ScanNet:
 
         Returns
         -------
-        url : str
-            The url to the prediction page.
+        url : str or None
+            The url to the prediction page, None if the job is still running.
 
         """
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # this is used in the testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
             url = page_text
         else:
-            browser.open(url, verify=False)
+            page = fetch_page(url, verify=False)  # nosec
+
+        # Check if the variable with the results is present
+        match = FINISHED_PATTERN.search(page)
+
+        if match:
+            return url
+
+        return None
+
+    def retrieve_prediction_link(self, url=None, page_text=None):
+        """
+        Retrieve the link to the result page.
+
+        Parameters
+        ----------
+        url : str
+            The url to the result results.
+        page_text : str
+            The text of the page to parse - used for testing.
 
+        Returns
+        -------
+        url : str
+            The url to the prediction page.
+
+        """
         completed = False
         while not completed:
-            # Check if the variable with the results is present
-            match = re.search(r"stringContainingTheWholePdbFile", str(browser.page))
-            if match:
+            prediction_url = self.poll(url=url, page_text=page_text)
+            if prediction_url:
                 completed = True
-            else:
-                # still running, wait a bit
-                log.debug(f"Waiting for ScanNet to finish... {self.tries}")
-                time.sleep(self.wait)
-                browser.refresh()
-                self.tries -= 1
-
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
                 log.error(f"ScanNet server is not responding, url was {url}")
                 raise ServerConnectionException(f"ScanNet server is not responding, url was {url}")
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for ScanNet to finish... {delay:.0f}s")
+                self.policy.wait(delay)
 
-        return url
+        return prediction_url
 
     def parse_prediction(self, url=None, test_file=None):
         """
@@ -127,43 +158,101 @@ class ScanNet:
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
             and passive sites.
 
         """
-        parser = PDB.PDBParser()
         if not test_file:
-            browser = ms.StatefulBrowser()
+            return self.parse(self.fetch(url))
 
-            browser.open(url)
-            # page contains PDB file as a string with results in b_factor column
-            pdb_string = re.findall(
-                r"stringContainingTheWholePdbFile = `(.*?)`",
-                str(browser.page),
-                re.DOTALL,
-            )
-            structure = parser.get_structure("pdb", io.StringIO(pdb_string[0]))
+        atoms, _ = scan_chain(test_file, self.chain_id)
+        return self.scores_table(atoms)
 
-        else:
-            structure = parser.get_structure("pdb", test_file)
+    @staticmethod
+    def scores_table(atoms):
+        """
+        Read the scores of the residues from the B-factors of their atoms.
+
+        Parameters
+        ----------
+        atoms : numpy.ndarray
+            The atoms of the chain, as read by `scanner.scan_chain`.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
 
-        model = structure[0]
-        chain = model[self.chain_id]
+        """
+        # the score of a residue is the B-factor of its last atom
+        first, last = residue_bounds(atoms)
+        scores = atoms["bfactor"][last]
 
-        prediction_dict = {"active": [], "passive": []}
+        # arbitrary value for active
+        return PredictionTable.from_masks(
+            atoms["resseq"][first], scores, active=scores >= 0.5, passive=scores < 0.5
+        )
 
-        for res in chain:
-            for atom in res:
-                b_fact = atom.get_bfactor()
+    def collect(self, prediction_url):
+        """
+        Download and parse the results of a finished job.
 
-            # arbitrary value for active
-            if b_fact >= 0.5:
-                prediction_dict["active"].append([res.id[1], b_fact])
-            else:
-                prediction_dict["passive"].append([res.id[1], b_fact])
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
 
-        return prediction_dict
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return self.parse(self.fetch(prediction_url))
+
+    def fetch(self, prediction_url):
+        """
+        Download the results page of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        result : tuple
+            The chain and the content of the results page.
+
+        """
+        return self.chain_id, fetch_page(prediction_url)
+
+    @staticmethod
+    def parse(result):
+        """
+        Parse a downloaded results page, the parsing stage.
+
+        Runs in a worker process, so it only takes the chain and the content
+        of the page.
+
+        Parameters
+        ----------
+        result : tuple
+            The chain and the content of the results page.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        chain_id, page = result
+        atoms, _ = scan_chain(PDB_PATTERN.search(page)[1], chain_id)
+        return ScanNet.scores_table(atoms)
 
     def run(self):
         """
@@ -171,15 +260,17 @@ class ScanNet:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the raw prediction.
+        prediction_dict : PredictionTable
+            A table containing the raw prediction.
 
         """
         log.info("Running ScanNet")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_url = self.retrieve_prediction_link(url=submitted_url)
-        prediction_dict = self.parse_prediction(url=prediction_url)
+        self.policy.finish()
+        prediction_dict = self.collect(prediction_url)
 
         return prediction_dict
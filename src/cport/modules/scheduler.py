@@ -0,0 +1,684 @@
+"""Shared poll scheduler for predictor jobs."""
+import asyncio
+import collections
+import heapq
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cport.exceptions import (
+    CircuitOpenException,
+    DeadlineException,
+    JobCancelledException,
+    ServerConnectionException,
+)
+from cport.modules.breaker import get_breaker, server_failure
+
+log = logging.getLogger("cportlog")
+
+# Threads shared by every blocking submit/poll/collect call, regardless of
+#  how many jobs are waiting on the servers
+NUM_WORKERS = os.environ.get("CPORT_NUM_WORKERS") if os.environ.get("CPORT_NUM_WORKERS") is not None else 8
+# Default number of jobs a single server may have in flight at the same time
+MAX_INFLIGHT = os.environ.get("CPORT_MAX_INFLIGHT") if os.environ.get("CPORT_MAX_INFLIGHT") is not None else 20
+# Seconds a job may take on top of its polling deadline, for the submission and
+#  the collection, before the watchdog abandons it
+JOB_GRACE = os.environ.get("CPORT_JOB_GRACE") if os.environ.get("CPORT_JOB_GRACE") is not None else 900
+# Downloaded results waiting for, or being, parsed before the downloads pause
+PARSE_BACKLOG = os.environ.get("CPORT_PARSE_BACKLOG") if os.environ.get("CPORT_PARSE_BACKLOG") is not None else 16
+
+SUBMIT = "submit"
+POLL = "poll"
+COLLECT = "collect"
+PARSE = "parse"
+DONE = "done"
+FAILED = "failed"
+
+
+def job_key(name, pdb_file, chain_id):
+    """
+    Build the key identifying a predictor job across runs.
+
+    Parameters
+    ----------
+    name : str
+        Name of the predictor.
+    pdb_file : str
+        Path to PDB file.
+    chain_id : str
+        Chain identifier.
+
+    Returns
+    -------
+    key : str
+        The job key.
+
+    """
+    return f"{pdb_file}:{chain_id}:{name}"
+
+
+class PredictionJob:
+    """A predictor job handled by the scheduler."""
+
+    def __init__(self, name, predictor, key=None, budget=None, breaker=None):
+        """
+        Initialize the job.
+
+        Parameters
+        ----------
+        name : str
+            Name of the predictor.
+        predictor : object
+            Predictor instance exposing `submit`, `poll`, `collect` and its
+            `policy`.
+        key : str
+            Unique identifier of the job, defaults to the predictor name.
+        budget : float
+            Wall-clock seconds the job may take once started, defaults to the
+            polling deadline plus `JOB_GRACE`.
+        breaker : CircuitBreaker
+            Breaker of the predictor server, defaults to the one shared by the
+            process.
+
+        """
+        self.name = name
+        self.predictor = predictor
+        self.key = key if key is not None else name
+        self.state = SUBMIT
+        self.handle = None
+        self.link = None
+        self.result = None
+        self.error = None
+        self.policy = predictor.policy
+        self.budget = (
+            budget if budget is not None else self.policy.deadline + float(JOB_GRACE)
+        )
+        self.started = None
+        self.breaker = breaker if breaker is not None else get_breaker(name)
+        self.inflight = False
+        # downloaded by `fetch` and parsed apart, see `PollScheduler`
+        self.staged = False
+        self.payload = None
+
+    @property
+    def finished(self):
+        """Whether the job reached a final state."""
+        return self.state in (DONE, FAILED)
+
+    @property
+    def expires(self):
+        """Time, on the monotonic clock, at which the watchdog abandons the job."""
+        if self.started is None:
+            return float("inf")
+        return self.started + self.budget
+
+    def step(self):
+        """
+        Execute the blocking call of the current state, runs in a worker thread.
+
+        Returns
+        -------
+        value : object
+            The job handle, the prediction link (None while still running), the
+            downloaded results of a staged job or the prediction dictionary,
+            depending on the state.
+
+        Raises
+        ------
+        CircuitOpenException
+            If the server is considered down, the job is not submitted.
+        JobCancelledException
+            If the job was cancelled.
+
+        """
+        self.policy.token.check()
+        if self.state == SUBMIT:
+            # may probe the server, so it runs in the worker thread too
+            if not self.breaker.allow():
+                raise CircuitOpenException(
+                    f"{self.name} server is down, not submitting {self.key}"
+                )
+            return self.predictor.submit()
+        if self.state == POLL:
+            return self.predictor.poll(self.handle)
+        if self.staged:
+            return self.predictor.fetch(self.link)
+        return self.predictor.collect(self.link)
+
+    def fail(self, error):
+        """
+        Mark the job as failed.
+
+        Parameters
+        ----------
+        error : Exception
+            The reason of the failure.
+
+        """
+        self.state = FAILED
+        self.error = error
+
+
+class PollScheduler:
+    """
+    Timer heap that owns every pending job and polls it only when it is due.
+
+    The blocking network calls are handed to a small thread pool, so the number
+    of threads does not grow with the number of outstanding jobs. Submissions
+    are held back while a server already has its maximum of jobs in flight, and
+    a watchdog fails the jobs that run past their wall-clock budget.
+
+    With a `parser` executor, the predictors exposing `fetch` and a picklable
+    `parse` are collected in two stages: the download runs in a worker thread
+    and the parsing in the executor, usually a process pool, so it does not
+    hold the GIL the threads waiting on the network need. At most
+    `max_parsing` results are downloaded ahead of the parser, the downloads
+    wait for it beyond that.
+    """
+
+    def __init__(
+        self,
+        num_workers=None,
+        limits=None,
+        max_inflight=None,
+        journal=None,
+        deadline=None,
+        on_finish=None,
+        parser=None,
+        max_parsing=None,
+        detach=False,
+    ):
+        """
+        Initialize the scheduler.
+
+        Parameters
+        ----------
+        num_workers : int
+            Number of worker threads for the blocking calls.
+        limits : dict
+            Maximum number of jobs in flight per predictor name.
+        max_inflight : int
+            Maximum number of jobs in flight for predictors not in `limits`.
+        journal : JobJournal
+            Journal recording every transition, jobs found in it are resumed
+            instead of being submitted again.
+        deadline : float
+            Time, on the monotonic clock, at which the jobs still running are
+            abandoned.
+        on_finish : callable
+            Called with each job once it is done or failed, from the scheduler
+            thread, it may `cancel` other jobs.
+        parser : concurrent.futures.Executor
+            Executor parsing the downloaded results, None to parse them in the
+            worker threads.
+        max_parsing : int
+            Maximum number of results downloaded but not parsed yet.
+        detach : bool
+            Do not wait for the servers: the jobs are submitted, or polled once
+            if they are already running, and the ones still running are left
+            in the journal for a later run.
+
+        """
+        self.num_workers = int(num_workers if num_workers is not None else NUM_WORKERS)
+        self.max_inflight = int(
+            max_inflight if max_inflight is not None else MAX_INFLIGHT
+        )
+        self.limits = limits if limits is not None else {}
+        self.journal = journal
+        self.deadline = deadline
+        self.on_finish = on_finish
+        self.parser = parser
+        self.detach = detach
+        self.max_parsing = int(
+            max_parsing if max_parsing is not None else PARSE_BACKLOG
+        )
+        self.inflight = collections.Counter()
+        self.jobs = []
+        self._heap = []
+        self._waiting = collections.defaultdict(collections.deque)
+        self._counter = itertools.count()
+        # staged jobs downloading or parsing, and the ones waiting to download
+        self._staging = set()
+        self._backlog = collections.deque()
+
+    def add(self, job, delay=0.0):
+        """
+        Add a job to the scheduler.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The job to be scheduled.
+        delay : float
+            Seconds to wait before its first step.
+
+        """
+        if self.journal is not None and self.journal.resume(job):
+            # the server already has this job, it counts as in flight
+            log.info(f"Resuming {job.key} from the journal")
+            self.inflight[job.name] += 1
+            job.inflight = True
+
+        job.staged = (
+            self.parser is not None
+            and callable(getattr(job.predictor, "fetch", None))
+            and callable(getattr(job.predictor, "parse", None))
+        )
+        self.jobs.append(job)
+        self._push(job, time.monotonic() + delay)
+
+    def cancel(self, job, reason="not needed anymore"):
+        """
+        Cancel a job that is not finished yet.
+
+        A step already running in a worker thread stops at its next check of
+        the job token, its result is ignored and the job is not stepped again.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The job to be cancelled.
+        reason : str
+            Why the job is cancelled.
+
+        """
+        if job.finished:
+            return
+
+        log.info(f"Cancelling {job.key}, {reason}")
+        job.policy.token.cancel()
+        job.fail(JobCancelledException(f"{job.key} cancelled, {reason}"))
+        self._record(job)
+        self._release(job)
+        self._unstage(job)
+        # it may have been woken up in place of a job still parked
+        self._wake(job.name)
+
+    def _finish(self, job):
+        """
+        Record and release a job that reached a final state.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The finished job.
+
+        """
+        self._record(job)
+        self._release(job)
+        self._unstage(job)
+        if self.on_finish is not None:
+            self.on_finish(job)
+
+    def _record(self, job):
+        if self.journal is None:
+            return
+        try:
+            self.journal.record(job)
+        except ValueError as thrown_exception:
+            # the job goes on, a later run submits it again
+            log.error(thrown_exception)
+
+    def _push(self, job, due):
+        # the counter breaks ties so jobs themselves are never compared
+        heapq.heappush(self._heap, (due, next(self._counter), job))
+
+    def _acquire(self, job):
+        """
+        Reserve an in-flight slot on the server of a job about to be submitted.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The job to be submitted.
+
+        Returns
+        -------
+        acquired : bool
+            False if the server is at its limit, the job is then parked until
+            another job of the same server finishes.
+
+        """
+        if self.inflight[job.name] >= self.limits.get(job.name, self.max_inflight):
+            self._waiting[job.name].append(job)
+            return False
+
+        self.inflight[job.name] += 1
+        job.inflight = True
+        return True
+
+    def _unstage(self, job):
+        """
+        Free the parsing slot of a staged job and let a download through.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The job that was parsed, or failed.
+
+        """
+        if job not in self._staging:
+            return
+
+        self._staging.discard(job)
+        while self._backlog and len(self._staging) < self.max_parsing:
+            waiting = self._backlog.popleft()
+            if not waiting.finished:
+                self._push(waiting, time.monotonic())
+
+    def _release(self, job):
+        """
+        Free the in-flight slot of a finished job and wake up a parked one.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The finished job.
+
+        """
+        if not job.inflight:
+            return
+
+        job.inflight = False
+        self.inflight[job.name] -= 1
+        self._wake(job.name)
+
+    def _wake(self, name):
+        """
+        Wake up the next job parked on a server that has a free slot.
+
+        Parameters
+        ----------
+        name : str
+            Name of the predictor.
+
+        """
+        if self.inflight[name] >= self.limits.get(name, self.max_inflight):
+            return
+
+        waiting = self._waiting[name]
+        while waiting and waiting[0].finished:
+            # cancelled while parked
+            waiting.popleft()
+        if waiting:
+            self._push(waiting.popleft(), time.monotonic())
+
+    def run(self):
+        """
+        Run every job until it is either done or failed, or the deadline passed.
+
+        Returns
+        -------
+        jobs : list
+            The scheduled jobs, in the order they were added.
+
+        """
+        asyncio.run(self._run())
+        return self.jobs
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        running = {}
+        parsing = {}
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.num_workers, thread_name_prefix="cport"
+        )
+        try:
+            while self._heap or running or parsing:
+                now = time.monotonic()
+                if self.deadline is not None and now >= self.deadline:
+                    running.update(parsing)
+                    self._abandon(running)
+                    break
+
+                while (
+                    self._heap
+                    and self._heap[0][0] <= now
+                    and len(running) < self.num_workers
+                ):
+                    _, _, job = heapq.heappop(self._heap)
+                    if job.finished:
+                        # abandoned by the watchdog while waiting
+                        continue
+                    if now >= job.expires:
+                        self._expire(job)
+                        continue
+                    if job.state == SUBMIT and not self._acquire(job):
+                        continue
+                    if job.state == COLLECT and job.staged:
+                        if len(self._staging) >= self.max_parsing:
+                            # backpressure, the parser is behind
+                            self._backlog.append(job)
+                            continue
+                        self._staging.add(job)
+                    if job.started is None:
+                        job.started = now
+                    running[loop.run_in_executor(executor, job.step)] = job
+
+                timeout = float("inf")
+                if self._heap and len(running) < self.num_workers:
+                    timeout = max(0.0, self._heap[0][0] - now)
+                if running:
+                    # wake up for the watchdog of the steps still running
+                    expires = min(job.expires for job in running.values())
+                    timeout = max(0.0, min(expires - now, timeout))
+                if self.deadline is not None:
+                    timeout = max(0.0, min(self.deadline - now, timeout))
+                if timeout == float("inf"):
+                    timeout = None
+
+                if not running and not parsing:
+                    if timeout is None:
+                        # only finished jobs were left in the heap
+                        break
+                    await asyncio.sleep(timeout)
+                    continue
+
+                done, _ = await asyncio.wait(
+                    set(running) | set(parsing),
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for future in done:
+                    if future in parsing:
+                        self._parsed(parsing.pop(future), future)
+                        continue
+
+                    job = running.pop(future)
+                    self._advance(job, future)
+                    if job.state == PARSE:
+                        parsing[
+                            loop.run_in_executor(
+                                self.parser, job.predictor.parse, job.payload
+                            )
+                        ] = job
+                self._watchdog(running)
+        finally:
+            # stop the steps abandoned, or still running when interrupted, at
+            # their next check of the token rather than waiting for them
+            for job in self.jobs:
+                if job.state != DONE:
+                    job.policy.token.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _watchdog(self, running):
+        """
+        Abandon the running steps of the jobs past their budget or cancelled.
+
+        Parameters
+        ----------
+        running : dict
+            The jobs whose step is running, by future.
+
+        """
+        now = time.monotonic()
+        for future, job in list(running.items()):
+            if job.finished:
+                # cancelled, its worker is not waited for
+                del running[future]
+                future.cancel()
+            elif now >= job.expires:
+                # the thread cannot be stopped, its result is ignored
+                del running[future]
+                future.cancel()
+                self._expire(job)
+
+    def _abandon(self, running):
+        """
+        Give up on every unfinished job once the deadline passed.
+
+        The jobs are not marked as failed in the journal, so the next run can
+        still resume the ones already submitted.
+
+        Parameters
+        ----------
+        running : dict
+            The jobs whose step is running, by future.
+
+        """
+        for future in running:
+            future.cancel()
+        running.clear()
+
+        unfinished = [job for job in self.jobs if not job.finished]
+        log.warning(f"Deadline reached, abandoning {len(unfinished)} jobs")
+        for job in unfinished:
+            job.fail(DeadlineException(f"{job.key} did not finish before the deadline"))
+        self._heap.clear()
+        self._waiting.clear()
+
+    def _expire(self, job):
+        """
+        Fail a job that ran past its budget.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The job to be abandoned.
+
+        """
+        log.error(f"{job.key} did not finish within {job.budget:.0f}s, abandoning it")
+        job.breaker.record_failure()
+        job.policy.token.cancel()
+        job.fail(
+            ServerConnectionException(
+                f"{job.name} did not finish within {job.budget:.0f}s"
+            )
+        )
+        self._finish(job)
+
+    def _advance(self, job, future):
+        """
+        Move a job to its next state once its step returned.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The job whose step finished.
+        future : asyncio.Future
+            The future holding the outcome of the step.
+
+        """
+        if job.finished:
+            # cancelled while the step was running
+            return
+
+        try:
+            value = future.result()
+        except Exception as thrown_exception:
+            log.error(f"Error running {job.name}")
+            log.error(thrown_exception)
+            if server_failure(thrown_exception):
+                job.breaker.record_failure()
+            job.fail(thrown_exception)
+            self._finish(job)
+            return
+
+        now = time.monotonic()
+        if job.state == SUBMIT:
+            log.info(f"Submitted {job.key}")
+            job.breaker.record_submitted()
+            job.handle = value
+            job.state = POLL
+            self._record(job)
+            if self.detach:
+                # collected by a later run
+                return
+            self._push(job, now + job.policy.start())
+
+        elif job.state == POLL:
+            if value:
+                job.policy.finish()
+                job.link = value
+                job.state = COLLECT
+                self._record(job)
+                self._push(job, now)
+                return
+
+            if self.detach:
+                log.info(f"{job.key} is still running")
+                return
+
+            if job.policy.expired():
+                # the deadline passed, the server is not responding
+                log.error(f"{job.name} server is not responding, handle was {job.handle}")
+                job.breaker.record_failure()
+                job.fail(
+                    ServerConnectionException(
+                        f"{job.name} server is not responding, handle was {job.handle}"
+                    )
+                )
+                self._finish(job)
+                return
+
+            # still running, check again later
+            delay = job.policy.next_delay()
+            log.debug(f"Waiting for {job.key} to finish... {delay:.0f}s")
+            self._push(job, now + delay)
+
+        elif job.staged:
+            # downloaded, the parser takes it from here
+            job.breaker.record_success()
+            job.payload = value
+            job.state = PARSE
+
+        else:
+            job.breaker.record_success()
+            job.result = value
+            job.state = DONE
+            self._finish(job)
+            log.info(f"Finished {job.key}")
+
+    def _parsed(self, job, future):
+        """
+        Finish a staged job once its results were parsed.
+
+        Parameters
+        ----------
+        job : PredictionJob
+            The job whose results were parsed.
+        future : asyncio.Future
+            The future holding the outcome of the parsing.
+
+        """
+        if job.finished:
+            # cancelled while it was parsed
+            return
+
+        try:
+            value = future.result()
+        except Exception as thrown_exception:
+            log.error(f"Error parsing the results of {job.key}")
+            log.error(thrown_exception)
+            job.fail(thrown_exception)
+            self._finish(job)
+            return
+
+        job.result = value
+        job.payload = None
+        job.state = DONE
+        self._finish(job)
+        log.info(f"Finished {job.key}")
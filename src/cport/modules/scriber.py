@@ -3,15 +3,14 @@ import logging
 import re
 import sys
 import tempfile
-import time
 import os
 
-from urllib import request
-
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
 import pandas as pd
 
+from cport.modules.polling import PollPolicy
+from cport.modules.session import download, fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.modules.utils import get_fasta_from_pdbfile
 from cport.url import SCRIBER_URL
 
@@ -20,6 +19,8 @@ log = logging.getLogger("cportlog")
 # Total wait (seconds) = WAIT_INTERVAL * NUM_RETRIES
 WAIT_INTERVAL = os.environ.get("SCRIBER_WAIT_INTERVAL") if os.environ.get("SCRIBER_WAIT_INTERVAL") is not None else 30 # seconds
 NUM_RETRIES = os.environ.get("SCRIBER_NUM_RETRIES") if os.environ.get("SCRIBER_NUM_RETRIES") is not None else 36
+# The page of a finished job links a .csv file
+RESULT_PATTERN = re.compile(rb"(http:.*csv)")
 
 
 class Scriber:
@@ -40,8 +41,13 @@ class Scriber:
         self.chain_id = chain_id
         self.pdb_file = pdb_file
         self.prediction_dict = {}
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "scriber",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -60,7 +66,7 @@ class Scriber:
 
         submission_string = ">Chain " + self.chain_id + "\n" + fasta_string
 
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
 
         browser.open(SCRIBER_URL)
 
@@ -79,9 +85,10 @@ class Scriber:
 
         return submitted_url
 
-    def retrieve_prediction_link(self, url=None, page_text=None):
+    @staticmethod
+    def poll(url=None, page_text=None):
         """
-        Retrieve the results.
+        Check once if the results are available.
 
         Parameters
         ----------
@@ -92,44 +99,60 @@ class Scriber:
 
         Returns
         -------
-        result_csv_link : str
-            The link to the results file.
+        result_csv_link : str or None
+            The link to the results file, None if the job is still running.
 
         """
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # this is used in the testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
         else:
-            browser.open(url)
+            page = fetch_page(url)
+
+        # Check if there's a .csv file in the page
+        match = RESULT_PATTERN.search(page)
+
+        if match:
+            return match[0].decode()
 
+        return None
+
+    def retrieve_prediction_link(self, url=None, page_text=None):
+        """
+        Retrieve the results.
+
+        Parameters
+        ----------
+        url : str
+            The url to the result results.
+        page_text : str
+            The text of the page to parse - used for testing.
+
+        Returns
+        -------
+        result_csv_link : str
+            The link to the results file.
+
+        """
         completed = False
         while not completed:
-            # Check if there's a .csv file in the page
-            match = re.search(r"(http:.*csv)", str(browser.page))
-            if match:
+            result_csv_link = self.poll(url=url, page_text=page_text)
+            if result_csv_link:
                 completed = True
-            else:
-                # still running, wait a bit
-                log.debug(f"Waiting for SCRIBER to finish... {self.tries}")
-                time.sleep(self.wait)
-                browser.refresh()
-                self.tries -= 1
-
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
                 log.error(f"SCRIBER server is not responding, url was {url}")
                 raise ServerConnectionException(f"SCRIBER server is not responding, url was {url}")
-
-        result_csv_link = re.search(r"(http:.*csv)", str(browser.page))[0]
-
-        browser.close()
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug(f"Waiting for SCRIBER to finish... {delay:.0f}s")
+                self.policy.wait(delay)
 
         return result_csv_link
 
     @staticmethod
-    def download_result(download_link):
+    def download_result(download_link, token=None):
         """
         Download the results.
 
@@ -137,6 +160,8 @@ class Scriber:
         ----------
         download_link : str
             The link to the results file.
+        token : CancelToken
+            Token stopping the download.
 
         Returns
         -------
@@ -145,7 +170,8 @@ class Scriber:
 
         """
         temp_file = tempfile.NamedTemporaryFile(delete=False)
-        request.urlretrieve(download_link, temp_file.name)
+        temp_file.close()
+        download(download_link, temp_file.name, token=token)
         return temp_file.name
 
     @staticmethod
@@ -160,13 +186,11 @@ class Scriber:
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
             and passive sites.
 
         """
-        prediction_dict = {"active": [], "passive": []}
-
         # Read back the .csv file and store it in a pandas dataframe
         #  due to the structuring of the .csv file the header for these
         #  columns had to be skipped
@@ -187,35 +211,97 @@ class Scriber:
             "ResidueScore",
         ]
 
-        for row in final_predictions.itertuples():
-            if str.isupper(
-                row.ResidueType
-            ):  # uppercase denotes a predicted interaction
-                prediction_dict["active"].append([row.ResidueNumber, row.ResidueScore])
-            elif str.islower(row.ResidueType):
-                prediction_dict["passive"].append([row.ResidueNumber, row.ResidueScore])
-            else:
-                log.warning(
-                    f"There appears that residue {row} is either empty or unprocessable"
-                )
+        residue_types = final_predictions["ResidueType"].astype(str)
+        # uppercase denotes a predicted interaction
+        active = residue_types.str.isupper()
+        passive = residue_types.str.islower()
+        for row in final_predictions[~(active | passive)].itertuples():
+            log.warning(
+                f"There appears that residue {row} is either empty or unprocessable"
+            )
+
+        return PredictionTable.from_masks(
+            final_predictions["ResidueNumber"],
+            final_predictions["ResidueScore"],
+            active=active,
+            passive=passive,
+        )
 
-        return prediction_dict
+    def collect(self, prediction_link):
+        """
+        Download and parse the results of a finished job.
+
+        Parameters
+        ----------
+        prediction_link : str
+            The link to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return self.parse(self.fetch(prediction_link))
+
+    def fetch(self, prediction_link):
+        """
+        Download the results of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_link : str
+            The link to the results file.
+
+        Returns
+        -------
+        result_file : str
+            The path to the results file.
+
+        """
+        return self.download_result(prediction_link, token=self.policy.token)
+
+    @staticmethod
+    def parse(result_file):
+        """
+        Parse downloaded results and remove them, the parsing stage.
+
+        Runs in a worker process, so it only takes the path to the file.
+
+        Parameters
+        ----------
+        result_file : str
+            The path to the results file.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        try:
+            return Scriber.parse_prediction(result_file)
+        finally:
+            os.remove(result_file)
 
     def run(self):
         """Execute the Scriber prediction.
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the raw prediction results.
+        prediction_dict : PredictionTable
+            A table containing the raw prediction results.
 
         """
         log.info("Running SCRIBER")
-        log.info(f"Will try {self.tries} times waiting {self.wait}s between tries")
+        log.info(f"Will wait up to {self.policy.deadline:.0f}s for the results")
 
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_link = self.retrieve_prediction_link(url=submitted_url)
-        result_file = self.download_result(prediction_link)
-        self.prediction_dict = self.parse_prediction(result_file)
+        self.policy.finish()
+        self.prediction_dict = self.collect(prediction_link)
 
         return self.prediction_dict
@@ -0,0 +1,463 @@
+"""Pooled HTTP sessions shared by the predictors."""
+import base64
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import mechanicalsoup as ms
+import requests
+from requests.adapters import HTTPAdapter
+
+from cport.exceptions import ServerConnectionException
+
+log = logging.getLogger("cportlog")
+
+# Connections kept alive per host, one per scheduler worker thread
+POOL_MAXSIZE = os.environ.get("CPORT_POOL_MAXSIZE") if os.environ.get("CPORT_POOL_MAXSIZE") is not None else 8
+# Number of hosts whose connections are kept alive
+POOL_HOSTS = os.environ.get("CPORT_POOL_HOSTS") if os.environ.get("CPORT_POOL_HOSTS") is not None else 32
+
+# Seconds to establish a connection and between two bytes of a response
+CONNECT_TIMEOUT = os.environ.get("CPORT_CONNECT_TIMEOUT") if os.environ.get("CPORT_CONNECT_TIMEOUT") is not None else 10
+READ_TIMEOUT = os.environ.get("CPORT_READ_TIMEOUT") if os.environ.get("CPORT_READ_TIMEOUT") is not None else 120
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Polled pages whose validators and content are kept for conditional requests
+PAGE_CACHE_SIZE = os.environ.get("CPORT_PAGE_CACHE_SIZE") if os.environ.get("CPORT_PAGE_CACHE_SIZE") is not None else 64
+# Times an interrupted download is resumed before giving up
+DOWNLOAD_RETRIES = os.environ.get("CPORT_DOWNLOAD_RETRIES") if os.environ.get("CPORT_DOWNLOAD_RETRIES") is not None else 3
+
+
+class TimeoutSession(requests.Session):
+    """
+    Session applying the default timeouts to every request.
+
+    A request that times out raises a `ServerConnectionException`, like any
+    other server that does not answer.
+    """
+
+    def __init__(self, timeout=None):
+        """
+        Initialize the session.
+
+        Parameters
+        ----------
+        timeout : tuple
+            The `(connect, read)` timeouts in seconds, defaults to
+            `CONNECT_TIMEOUT` and `READ_TIMEOUT`.
+
+        """
+        super().__init__()
+        self.timeout = (
+            timeout
+            if timeout is not None
+            else (float(CONNECT_TIMEOUT), float(READ_TIMEOUT))
+        )
+
+    def request(self, method, url, *args, **kwargs):
+        """
+        Send a request, with the default timeouts unless given.
+
+        Parameters
+        ----------
+        method : str
+            The HTTP method.
+        url : str
+            The url of the request.
+        args : list
+            Positional arguments of `requests.Session.request`.
+        kwargs : dict
+            Keyword arguments of `requests.Session.request`.
+
+        Returns
+        -------
+        response : requests.Response
+            The response of the server.
+
+        Raises
+        ------
+        ServerConnectionException
+            If the server did not answer in time.
+
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            return super().request(method, url, *args, **kwargs)
+        except requests.exceptions.Timeout as thrown_exception:
+            log.error(f"{method} {url} timed out")
+            raise ServerConnectionException(
+                f"{method} {url} timed out after {kwargs['timeout']}s"
+            ) from thrown_exception
+
+
+class PooledAdapter(HTTPAdapter):
+    """Transport adapter whose connections outlive the sessions mounting it."""
+
+    def close(self):
+        """Keep the connections alive, sessions and browsers close it when done."""
+
+    def shutdown(self):
+        """Close every pooled connection."""
+        super().close()
+
+
+class SessionPool:
+    """
+    Keep-alive connection pools, one per host, shared by every predictor.
+
+    The connections live in a single thread-safe transport adapter. Each call
+    to `session` or `browser` gets its own `requests.Session` mounting it, so
+    cookies and browser state are never shared between jobs while the TCP and
+    TLS connections are.
+    """
+
+    def __init__(self, pool_maxsize=None, pool_hosts=None):
+        """
+        Initialize the pool.
+
+        Parameters
+        ----------
+        pool_maxsize : int
+            Maximum number of connections kept alive per host.
+        pool_hosts : int
+            Maximum number of hosts whose connections are kept alive.
+
+        """
+        self._adapter = PooledAdapter(
+            pool_connections=int(pool_hosts if pool_hosts is not None else POOL_HOSTS),
+            pool_maxsize=int(
+                pool_maxsize if pool_maxsize is not None else POOL_MAXSIZE
+            ),
+        )
+
+    def session(self):
+        """
+        Create a session using the pooled connections.
+
+        Returns
+        -------
+        session : TimeoutSession
+            A new session, closing it keeps the connections in the pool.
+
+        """
+        session = TimeoutSession()
+        session.mount("https://", self._adapter)
+        session.mount("http://", self._adapter)
+        return session
+
+    def browser(self, **kwargs):
+        """
+        Create a browser using the pooled connections.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Keyword arguments of `mechanicalsoup.StatefulBrowser`.
+
+        Returns
+        -------
+        browser : mechanicalsoup.StatefulBrowser
+            A new browser, closing it keeps the connections in the pool.
+
+        """
+        return ms.StatefulBrowser(session=self.session(), **kwargs)
+
+    def stats(self):
+        """
+        Count the requests and the connections opened for each host.
+
+        Returns
+        -------
+        stats : dict
+            The `requests`, `connections` and `reused` counts, by host.
+
+        """
+        stats = {}
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = stats.setdefault(pool.host, {"requests": 0, "connections": 0})
+            host["requests"] += pool.num_requests
+            host["connections"] += pool.num_connections
+
+        for host in stats.values():
+            host["reused"] = host["requests"] - host["connections"]
+
+        return stats
+
+    def log_stats(self):
+        """Log the connection reuse of each host."""
+        for host, count in sorted(self.stats().items()):
+            log.info(
+                f"{host}: {count['requests']} requests over "
+                f"{count['connections']} connections ({count['reused']} reused)"
+            )
+
+    def close(self):
+        """Close every pooled connection."""
+        self._adapter.shutdown()
+
+
+POOL = SessionPool()
+
+
+def get_session():
+    """
+    Create a session using the shared connection pool.
+
+    Returns
+    -------
+    session : TimeoutSession
+        A new session.
+
+    """
+    return POOL.session()
+
+
+def get_browser(**kwargs):
+    """
+    Create a browser using the shared connection pool.
+
+    Parameters
+    ----------
+    kwargs : dict
+        Keyword arguments of `mechanicalsoup.StatefulBrowser`.
+
+    Returns
+    -------
+    browser : mechanicalsoup.StatefulBrowser
+        A new browser.
+
+    """
+    return POOL.browser(**kwargs)
+
+
+PAGES = OrderedDict()
+_PAGES_LOCK = threading.Lock()
+
+
+def fetch_page(url, **kwargs):
+    """
+    Fetch the raw content of a page polled for the status of a job.
+
+    The page is not parsed into a soup, the predictors only look for a few
+    byte patterns in it. The `ETag` and `Last-Modified` validators of the last
+    response are sent back with the next request, a server honouring them
+    answers 304 Not Modified and the content kept from the last poll is used.
+
+    Parameters
+    ----------
+    url : str
+        The url of the page.
+    kwargs : dict
+        Keyword arguments of `requests.Session.get`.
+
+    Returns
+    -------
+    content : bytes
+        The content of the page, whatever its status code.
+
+    """
+    headers = dict(kwargs.pop("headers", None) or {})
+    with _PAGES_LOCK:
+        cached = PAGES.get(url)
+    if cached is not None:
+        if cached["etag"] is not None:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["modified"] is not None:
+            headers["If-Modified-Since"] = cached["modified"]
+
+    response = get_session().get(url, headers=headers, **kwargs)
+
+    if response.status_code == 304 and cached is not None:
+        log.debug(f"{url} not modified")
+    else:
+        cached = {
+            "etag": response.headers.get("ETag"),
+            "modified": response.headers.get("Last-Modified"),
+            "content": response.content,
+        }
+        if cached["etag"] is None and cached["modified"] is None:
+            # the server does not support conditional requests
+            return cached["content"]
+
+    with _PAGES_LOCK:
+        PAGES[url] = cached
+        PAGES.move_to_end(url)
+        while len(PAGES) > int(PAGE_CACHE_SIZE):
+            PAGES.popitem(last=False)
+
+    return cached["content"]
+
+
+def expected_digests(response):
+    """
+    Read the checksums a server announces for a response body.
+
+    Parameters
+    ----------
+    response : requests.Response
+        A response with the whole body, not a range of it.
+
+    Returns
+    -------
+    digests : dict
+        The expected `sha256` and `md5` digests, as bytes, by algorithm.
+
+    """
+    digests = {}
+    for item in response.headers.get("Digest", "").split(","):
+        algorithm, _, value = item.strip().partition("=")
+        if algorithm.lower() == "sha-256" and value:
+            digests["sha256"] = base64.b64decode(value)
+    if response.headers.get("Content-MD5"):
+        digests["md5"] = base64.b64decode(response.headers["Content-MD5"])
+    return digests
+
+
+def download(url, file_name, token=None, checksum=None, **kwargs):
+    """
+    Download a file over the shared connection pool.
+
+    The body is streamed in chunks to a `.part` file, renamed once complete,
+    so the memory used does not depend on the size of the file. A transfer
+    interrupted by the server is resumed with a `Range` request, or started
+    over if the server does not support them. The length and the checksums
+    announced by the server (`Digest` or `Content-MD5`) are verified.
+
+    The file is asked for without any `Content-Encoding`: the offsets of a
+    range and the announced checksums count the encoded bytes, not the ones
+    written. A server encoding it anyway gets no range, an interrupted
+    transfer starts over, and only `checksum` is verified.
+
+    Parameters
+    ----------
+    url : str
+        The url of the file.
+    file_name : str
+        Path the file is written to.
+    token : CancelToken
+        Token stopping the download between two chunks.
+    checksum : str
+        Expected SHA-256 hex digest of the file.
+    kwargs : dict
+        Keyword arguments of `requests.Session.get`.
+
+    Returns
+    -------
+    sha256 : str
+        The SHA-256 hex digest of the file.
+
+    Raises
+    ------
+    ServerConnectionException
+        If the server stalls while sending the file more than
+        `DOWNLOAD_RETRIES` times, or the file does not match its checksum.
+    JobCancelledException
+        If the token was cancelled, the partial file is removed.
+
+    """
+    part_name = f"{file_name}.part"
+    headers = dict(kwargs.pop("headers", None) or {})
+    headers.setdefault("Accept-Encoding", "identity")
+    session = get_session()
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()  # nosec
+    expected = {}
+    received = 0
+    encoded = False
+    attempts = 0
+
+    try:
+        while True:
+            if received and encoded:
+                # the decoded bytes received do not tell the offset to resume at
+                log.debug(f"{url} is encoded, downloading it again")
+                received = 0
+                sha256 = hashlib.sha256()
+                md5 = hashlib.md5()  # nosec
+            if received:
+                headers["Range"] = f"bytes={received}-"
+            else:
+                headers.pop("Range", None)
+            try:
+                with session.get(
+                    url, stream=True, headers=headers, **kwargs
+                ) as response:
+                    response.raise_for_status()
+                    if received and response.status_code != 206:
+                        # ranges are not supported, start over
+                        log.debug(f"{url} ignored the range, downloading it again")
+                        received = 0
+                        sha256 = hashlib.sha256()
+                        md5 = hashlib.md5()  # nosec
+                    encoded = (
+                        response.headers.get("Content-Encoding", "identity").lower()
+                        != "identity"
+                    )
+                    if not received:
+                        # the digests of an encoded body are not the ones of the file
+                        expected = {} if encoded else expected_digests(response)
+                    # nor is its length
+                    length = response.headers.get("Content-Length")
+                    total = (
+                        received + int(length)
+                        if length is not None and not encoded
+                        else None
+                    )
+
+                    with open(part_name, "ab" if received else "wb") as handle:
+                        for chunk in response.iter_content(
+                            chunk_size=DOWNLOAD_CHUNK_SIZE
+                        ):
+                            if token is not None:
+                                token.check()
+                            handle.write(chunk)
+                            sha256.update(chunk)
+                            md5.update(chunk)
+                            received += len(chunk)
+
+                if total is not None and received < total:
+                    raise requests.exceptions.ChunkedEncodingError(
+                        f"{received} of {total} bytes received"
+                    )
+                break
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+                ServerConnectionException,
+            ) as thrown_exception:
+                # a read timeout while streaming surfaces as a connection error
+                attempts += 1
+                if attempts > int(DOWNLOAD_RETRIES):
+                    log.error(f"Download of {url} stalled")
+                    raise ServerConnectionException(
+                        f"Download of {url} stalled: {thrown_exception}"
+                    ) from thrown_exception
+                log.warning(
+                    f"Download of {url} interrupted after {received} bytes, resuming"
+                )
+
+        for algorithm, digest in (("sha256", sha256), ("md5", md5)):
+            if algorithm in expected and digest.digest() != expected[algorithm]:
+                raise ServerConnectionException(
+                    f"Download of {url} is corrupted, its {algorithm} does not match"
+                )
+        if checksum is not None and sha256.hexdigest() != checksum:
+            raise ServerConnectionException(
+                f"Download of {url} is corrupted, its sha256 does not match"
+            )
+
+        os.replace(part_name, file_name)
+    except BaseException:
+        # failed, cancelled or interrupted, do not leave a partial file behind
+        if os.path.exists(part_name):
+            os.remove(part_name)
+        raise
+
+    log.debug(f"Downloaded {received} bytes from {url}")
+    return sha256.hexdigest()
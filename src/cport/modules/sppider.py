@@ -1,13 +1,15 @@
 """SPPIDER module."""
+import html
 import logging
 import re
 import sys
-import time
 import os
 
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
 
+from cport.modules.polling import PollPolicy
+from cport.modules.session import fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.url import SPPIDER_URL
 
 log = logging.getLogger("cportlog")
@@ -16,6 +18,12 @@ log = logging.getLogger("cportlog")
 WAIT_INTERVAL = os.environ.get("SPPIDER_WAIT_INTERVAL") if os.environ.get("SPPIDER_WAIT_INTERVAL") is not None else 45 # seconds
 # results take up to 5 minutes for 1ppe E, but are usually ready within 2 minutes
 NUM_RETRIES = os.environ.get("SPPIDER_NUM_RETRIES") if os.environ.get("SPPIDER_NUM_RETRIES") is not None else 36
+# The page of a running job reloads itself, the page of a finished one
+#  redirects to the results
+RUNNING_PATTERN = re.compile(
+    rb"(Refresh page manually or it will be reloaded automatically in 5 minutes)"
+)
+REFRESH_PATTERN = re.compile(rb"URL=(.*?=int)")
 
 
 class Sppider:
@@ -34,8 +42,13 @@ class Sppider:
         """
         self.pdb_file = pdb_file
         self.chain_id = chain_id
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "sppider",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -47,7 +60,7 @@ class Sppider:
             The url to the submitted page.
 
         """
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
         browser.open(SPPIDER_URL)
 
         sppider_form = browser.select_form()
@@ -68,9 +81,10 @@ class Sppider:
 
         return submitted_url
 
-    def retrieve_prediction_link(self, url=None, page_text=None):
+    @staticmethod
+    def poll(url=None, page_text=None):
         """
-        Retrieve the link to the SPIDER prediction page.
+        Check once if the SPPIDER prediction is finished.
 
         Parameters
         ----------
@@ -81,47 +95,64 @@ class Sppider:
 
         Returns
         -------
-        new_url : str
-            The url of the prediction obtained SPIDER prediction page.
+        new_url : str or None
+            The url of the SPIDER prediction page, None if the job is still
+            running.
 
         """
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # this is used in the testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
         else:
-            browser.open(url)
+            page = fetch_page(url)
 
-        completed = False
-        while not completed:
-            # if match is True, the results are not yet ready
-            match = re.search(
-                r"(Refresh page manually or it will be reloaded "
-                r"automatically in 5 minutes)",
-                str(browser.page),
-            )
-            if not match:
-                completed = True
-            else:
-                # still running, wait a bit
-                log.debug("Waiting for SPPIDER to finish... %s", self.tries)
-                time.sleep(self.wait)
-                browser.refresh()
-                self.tries -= 1
+        # if match is True, the results are not yet ready
+        match = RUNNING_PATTERN.search(page)
 
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
-                log.error("SPPIDER server is not responding, url was %s", url)
-                raise ServerConnectionException("SPPIDER server is not responding, url was %s", url)
+        if match:
+            return None
 
         # the page contains the correct link, which automatically opens in a browser
         #  soup browser is an exception so url needs to be extracted and opened
         #  to function
         # https://regex101.com/r/Izy7PR/1
-        new_url = re.findall(r"URL=(.*?=int)", str(browser.page))[0]
+        new_url = REFRESH_PATTERN.findall(page)[0].decode()
+        # escaped like the attribute of a parsed page
+        new_url = html.escape(html.unescape(new_url), quote=False)
 
-        browser.close()
+        return new_url
+
+    def retrieve_prediction_link(self, url=None, page_text=None):
+        """
+        Retrieve the link to the SPIDER prediction page.
+
+        Parameters
+        ----------
+        url : str
+            The url of the SPIDER processing page.
+        page_text : str
+            The text of the SPIDER processing page.
+
+        Returns
+        -------
+        new_url : str
+            The url of the prediction obtained SPIDER prediction page.
+
+        """
+        completed = False
+        while not completed:
+            new_url = self.poll(url=url, page_text=page_text)
+            if new_url:
+                completed = True
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
+                log.error("SPPIDER server is not responding, url was %s", url)
+                raise ServerConnectionException("SPPIDER server is not responding, url was %s", url)
+            else:
+                # still running, wait a bit
+                delay = self.policy.next_delay()
+                log.debug("Waiting for SPPIDER to finish... %.0fs", delay)
+                self.policy.wait(delay)
 
         return new_url
 
@@ -134,23 +165,23 @@ class Sppider:
         ----------
         url : str
             The url to the results.
-        page_text : str
-            The file to parse.
+        page_text : str or bytes
+            The page to parse instead of opening `url`.
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
             and passive sites.
 
         """
         # sppider only provides a list of active residues
         prediction_dict = {"active": [], "passive": []}
         prediction = {"active": []}
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
 
         if page_text:
-            # this is used in the testing
+            # a page downloaded by `fetch`, or a test page
             browser.open_fake_page(page_text=page_text)
         else:
             browser.open(url)
@@ -177,7 +208,62 @@ class Sppider:
             for item in prediction["active"]:
                 prediction_dict["active"].append(int(item))
 
-        return prediction_dict
+        return PredictionTable.from_dict(prediction_dict)
+
+    def collect(self, prediction_url):
+        """
+        Download and parse the results of a finished job.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
+
+        """
+        return self.parse(self.fetch(prediction_url))
+
+    @staticmethod
+    def fetch(prediction_url):
+        """
+        Download the results page of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        page : bytes
+            The content of the results page.
+
+        """
+        return fetch_page(prediction_url)
+
+    @staticmethod
+    def parse(page):
+        """
+        Parse a downloaded results page, the parsing stage.
+
+        Runs in a worker process, so it only takes the content of the page.
+
+        Parameters
+        ----------
+        page : bytes
+            The content of the results page.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
+
+        """
+        return Sppider.parse_prediction(page_text=page)
 
     def run(self):
         """
@@ -185,19 +271,17 @@ class Sppider:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the active and passive residue predictions.
+        prediction_dict : PredictionTable
+            A table containing the active and passive residue predictions.
 
         """
         log.info("Running SPPIDER")
-        log.info(
-            "Will try %s times waiting %ss between tries",
-            self.tries,
-            self.wait,
-        )
+        log.info("Will wait up to %.0fs for the results", self.policy.deadline)
 
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_url = self.retrieve_prediction_link(url=submitted_url)
-        prediction_dict = self.parse_prediction(url=prediction_url)
+        self.policy.finish()
+        prediction_dict = self.collect(prediction_url)
 
         return prediction_dict
@@ -0,0 +1,395 @@
+"""Columnar tables of the residues predicted by a predictor."""
+import numpy as np
+
+# labels of the residues
+NONE = 0
+PASSIVE = 1
+ACTIVE = 2
+
+# one packed record per residue, 10 bytes
+DTYPE = np.dtype(
+    [("residue", "<i4"), ("icode", "S1"), ("label", "i1"), ("score", "<f4")]
+)
+
+KEYS = ("active", "passive")
+
+
+def _column(items):
+    # the legacy lists hold either residue numbers or [residue, score] pairs
+    if len(items) and isinstance(items[0], (list, tuple)):
+        residues = [item[0] for item in items]
+        scores = np.array([item[1] for item in items], dtype=float)
+    else:
+        residues = list(items)
+        scores = np.full(len(items), np.nan)
+    return np.asarray(residues, dtype=int), scores
+
+
+def python_scores(scores):
+    """
+    Convert float32 scores to python floats.
+
+    The shortest repr of a float32 gives back the decimal the server wrote,
+    0.05 and not 0.05000000074505806.
+
+    Parameters
+    ----------
+    scores : numpy.ndarray
+        The float32 scores.
+
+    Returns
+    -------
+    scores : list
+        The scores, as python floats.
+
+    """
+    return scores.astype(str).astype(float).tolist()
+
+
+class PredictionTable:
+    """
+    The residues of a prediction, as contiguous arrays.
+
+    Every residue has a number, an insertion code, a label (`ACTIVE`,
+    `PASSIVE` or `NONE`) and a float32 score, nan for the predictors that do
+    not score their residues. A residue both active and passive has a row for
+    each label. The rows are kept in a single record array, so the tables are
+    cheap to copy, merge, pickle and send to another process.
+
+    Indexing a table with `"active"` or `"passive"` gives the lists of the
+    former prediction dictionaries, `[residue, score]` pairs or residue
+    numbers when they have no score, and tables compare equal to those
+    dictionaries.
+    """
+
+    def __init__(self, data=None):
+        """
+        Initialize the table.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The records of the residues, of dtype `DTYPE`; an empty table if
+            None.
+
+        """
+        self.data = np.zeros(0, dtype=DTYPE) if data is None else data
+
+    @classmethod
+    def from_masks(
+        cls, residues, scores, active, passive, passive_scores=True, icodes=None
+    ):
+        """
+        Build a table from the columns of a parsed result.
+
+        Parameters
+        ----------
+        residues : pandas.Series or numpy.ndarray
+            The residue numbers.
+        scores : pandas.Series or numpy.ndarray
+            The scores of the residues, nan where there is none.
+        active : pandas.Series or numpy.ndarray
+            Mask of the residues predicted to interact.
+        passive : pandas.Series or numpy.ndarray
+            Mask of the residues predicted not to interact.
+        passive_scores : bool
+            Keep the scores of the passive residues.
+        icodes : pandas.Series or numpy.ndarray
+            The insertion codes of the residues, none if not given.
+
+        Returns
+        -------
+        table : PredictionTable
+            The active and passive residues, in the given order.
+
+        """
+        active = np.asarray(active, dtype=bool)
+        passive = np.asarray(passive, dtype=bool)
+        labels = np.where(active, ACTIVE, np.where(passive, PASSIVE, NONE))
+        keep = active | passive
+
+        data = np.zeros(int(keep.sum()), dtype=DTYPE)
+        data["residue"] = np.asarray(residues)[keep]
+        data["label"] = labels[keep]
+        scores = np.asarray(scores, dtype=float)
+        if not passive_scores:
+            scores = np.where(active, scores, np.nan)
+        data["score"] = scores[keep]
+        if icodes is not None:
+            data["icode"] = np.asarray(icodes)[keep]
+        return cls(data)
+
+    @classmethod
+    def from_dict(cls, prediction_dict):
+        """
+        Build a table from a prediction dictionary.
+
+        Parameters
+        ----------
+        prediction_dict : dict
+            The `active` and `passive` residues, as lists of residue numbers
+            or of `[residue, score]` pairs.
+
+        Returns
+        -------
+        table : PredictionTable
+            The active residues, then the passive ones.
+
+        """
+        parts = []
+        for label, key in ((ACTIVE, "active"), (PASSIVE, "passive")):
+            residues, scores = _column(prediction_dict.get(key, []))
+            part = np.zeros(len(residues), dtype=DTYPE)
+            part["residue"] = residues
+            part["label"] = label
+            part["score"] = scores
+            parts.append(part)
+        return cls(np.concatenate(parts))
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        """
+        Read a table written by `to_bytes`.
+
+        Parameters
+        ----------
+        buffer : bytes
+            The records of the table.
+
+        Returns
+        -------
+        table : PredictionTable
+            The table.
+
+        """
+        return cls(np.frombuffer(buffer, dtype=DTYPE).copy())
+
+    @classmethod
+    def merge(cls, tables):
+        """
+        Concatenate the rows of several tables.
+
+        Parameters
+        ----------
+        tables : list
+            The tables to merge.
+
+        Returns
+        -------
+        table : PredictionTable
+            The rows of every table, in the given order.
+
+        """
+        return cls(np.concatenate([table.data for table in tables] or [cls().data]))
+
+    @property
+    def residues(self):
+        """numpy.ndarray : The residue numbers."""
+        return self.data["residue"]
+
+    @property
+    def icodes(self):
+        """numpy.ndarray : The insertion codes, empty bytes for none."""
+        return self.data["icode"]
+
+    @property
+    def labels(self):
+        """numpy.ndarray : The labels of the residues."""
+        return self.data["label"]
+
+    @property
+    def scores(self):
+        """numpy.ndarray : The float32 scores, nan for none."""
+        return self.data["score"]
+
+    @property
+    def size(self):
+        """int : The number of rows."""
+        return len(self.data)
+
+    def select(self, label):
+        """
+        Get the rows of a label.
+
+        Parameters
+        ----------
+        label : int
+            `ACTIVE`, `PASSIVE` or `NONE`.
+
+        Returns
+        -------
+        table : PredictionTable
+            The rows with the label.
+
+        """
+        return PredictionTable(self.data[self.data["label"] == label])
+
+    def shift(self, offset):
+        """
+        Add an offset to every residue number.
+
+        Parameters
+        ----------
+        offset : int
+            The offset.
+
+        Returns
+        -------
+        table : PredictionTable
+            The shifted table.
+
+        """
+        data = self.data.copy()
+        data["residue"] += offset
+        return PredictionTable(data)
+
+    def remap(self, old, new, label=None):
+        """
+        Renumber the residues.
+
+        Parameters
+        ----------
+        old : numpy.ndarray
+            The residue numbers to renumber, without duplicates.
+        new : numpy.ndarray
+            Their new numbers.
+        label : int
+            Only renumber the rows with this label.
+
+        Returns
+        -------
+        table : PredictionTable
+            The renumbered table, the residues missing from `old` keep their
+            number.
+
+        """
+        old = np.asarray(old, dtype=int)
+        new = np.asarray(new, dtype=int)
+        data = self.data.copy()
+        if not len(old):
+            return PredictionTable(data)
+
+        order = np.argsort(old)
+        sorted_old = old[order]
+        positions = np.searchsorted(sorted_old, data["residue"])
+        positions = np.minimum(positions, len(sorted_old) - 1)
+        found = sorted_old[positions] == data["residue"]
+        if label is not None:
+            found &= data["label"] == label
+        data["residue"][found] = new[order][positions[found]]
+        return PredictionTable(data)
+
+    def renumber(self, residues, icodes=None, keep=None):
+        """
+        Give new numbers to every row.
+
+        Parameters
+        ----------
+        residues : numpy.ndarray
+            The new residue number of each row.
+        icodes : numpy.ndarray
+            The new insertion code of each row, unchanged if not given.
+        keep : numpy.ndarray
+            Mask of the rows to keep, all of them if not given.
+
+        Returns
+        -------
+        table : PredictionTable
+            The renumbered table.
+
+        """
+        data = self.data.copy()
+        data["residue"] = residues
+        if icodes is not None:
+            data["icode"] = icodes
+        return PredictionTable(data if keep is None else data[keep])
+
+    def to_bytes(self):
+        """
+        Serialize the table.
+
+        Returns
+        -------
+        buffer : bytes
+            The records of the table, `DTYPE.itemsize` bytes per row.
+
+        """
+        return self.data.tobytes()
+
+    def to_dict(self):
+        """
+        Convert the table to a prediction dictionary.
+
+        Returns
+        -------
+        prediction_dict : dict
+            The `active` and `passive` residues, as `[residue, score]` pairs
+            when they have scores and as residue numbers otherwise.
+
+        """
+        return {key: self[key] for key in KEYS}
+
+    def keys(self):
+        """
+        Get the keys of the prediction dictionary.
+
+        Returns
+        -------
+        keys : tuple
+            `"active"` and `"passive"`.
+
+        """
+        return KEYS
+
+    def __iter__(self):
+        return iter(KEYS)
+
+    def __contains__(self, key):
+        return key in KEYS
+
+    def __getitem__(self, key):
+        if key not in KEYS:
+            raise KeyError(key)
+
+        rows = self.data[self.data["label"] == (ACTIVE if key == "active" else PASSIVE)]
+        residues = rows["residue"].tolist()
+        if not np.isfinite(rows["score"]).any():
+            return residues
+        return list(map(list, zip(residues, python_scores(rows["score"]))))
+
+    def __eq__(self, other):
+        if isinstance(other, PredictionTable):
+            return (
+                np.array_equal(self.residues, other.residues)
+                and np.array_equal(self.icodes, other.icodes)
+                and np.array_equal(self.labels, other.labels)
+                and np.array_equal(self.scores, other.scores, equal_nan=True)
+            )
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        active = int((self.labels == ACTIVE).sum())
+        passive = int((self.labels == PASSIVE).sum())
+        return f"PredictionTable({active} active, {passive} passive)"
+
+
+def as_table(prediction):
+    """
+    Get the table of a prediction.
+
+    Parameters
+    ----------
+    prediction : PredictionTable or dict
+        A table, or a prediction dictionary.
+
+    Returns
+    -------
+    table : PredictionTable
+        The table of the prediction.
+
+    """
+    if isinstance(prediction, PredictionTable):
+        return prediction
+    return PredictionTable.from_dict(prediction)
@@ -5,31 +5,37 @@ import re
 import sys
 import tempfile
 import warnings
-from urllib import request
 
+import numpy as np
 import pandas as pd
-import requests
-from Bio import PDB, BiopythonWarning, SeqIO
+from Bio import BiopythonWarning
 
 with warnings.catch_warnings():
     warnings.simplefilter("ignore", BiopythonWarning)
 
 from cport.exceptions import ChainException
+from cport.modules.context import get_context
+from cport.modules.session import download, get_session
+from cport.modules.table import (
+    ACTIVE,
+    NONE,
+    PASSIVE,
+    PredictionTable,
+    as_table,
+    python_scores,
+)
 from cport.url import PDB_FASTA_URL, PDB_URL
 
 log = logging.getLogger("cportlog")
 
-scored_predictors = [
-    "cons_ppisp",
-    "meta_ppisp",
-    "ispred4",
-    "predictprotein",
-    "predus2",
-    "psiver",
-    "scriber",
-    "csm_potential",
-    "scannet",
-]
+# bit of each label in the cells of the predictions matrix
+LABEL_FLAGS = {PASSIVE: 1, ACTIVE: 2}
+LABEL_CELLS = np.array(["-", "P", "A", "AP"], dtype=object)
+
+# numbered along the sequence of the chain, gaps filled with X
+sequence_predictors = ["psiver"]
+# numbered along the sequence of the chain without its X
+ungapped_predictors = ["predictprotein", "scriber"]
 
 pdb_predictors = [
     "whiscy",
@@ -66,7 +72,7 @@ def get_fasta_from_pdbid(pdb_id, chain_id):
     chain_regex = r"Chain\s(\S)|Chains\s(\S)|auth\s(\S)"
 
     target_url = f"{PDB_FASTA_URL}{pdb_id}#{chain_id}/download"
-    fasta_seqs = requests.get(target_url).text
+    fasta_seqs = get_session().get(target_url).text
 
     seq_dic = {}
     for line in fasta_seqs.split(os.linesep):
@@ -106,7 +112,7 @@ def get_pdb_from_pdbid(pdb_id):
     """
     target_url = f"{PDB_URL}{pdb_id}.pdb"
     temp_file = tempfile.NamedTemporaryFile(delete=False)
-    request.urlretrieve(target_url, temp_file.name)
+    download(target_url, temp_file.name)
 
     pdb_fname = temp_file.name
 
@@ -129,82 +135,94 @@ def get_fasta_from_pdbfile(pdb_file, chain_id):
     sequence : str
         String of the FASTA sequence.
 
+    Raises
+    ------
+    ChainException
+        If the chain has no amino acid.
+
     """
-    with open(pdb_file) as handle:
-        for record in SeqIO.PdbIO.PdbAtomIterator(handle):
-            # checks for matching chain id
-            if record.id[-1] == chain_id:
-                sequence = str(record.seq)
+    sequence = get_context(pdb_file, chain_id).sequence
+    if sequence is None:
+        raise ChainException(f"Chain {chain_id} of {pdb_file} has no amino acid")
 
     return sequence
 
 
-def format_output(result_dic, output_fname, pdb_file, chain_id):
+def prediction_matrix(result_dic, pdb_file, chain_id, context=None):
+    """
+    Build the residue by predictor matrix of the predictions.
+
+    The residues of every predictor are placed into preallocated label and
+    score matrices with one indexed assignment per label, the cells are then
+    filled from them at once.
+
+    Parameters
+    ----------
+    result_dic : dict
+        The prediction tables, or dictionaries, of the predictors.
+    pdb_file : str
+        Path to pdb file.
+    chain_id : str
+        Chain identifier.
+    context : ChainContext
+        The parsed chain, read from the file if not given.
+
+    Returns
+    -------
+    output_df : pandas.DataFrame
+        One row per predictor, its name then a column per residue of the
+        range. A cell holds the score of the residue, the active one if it has
+        both; its `A`, `P` or `AP` label when it has no score; `-` if it was
+        not predicted.
+
+    """
+    standardized_dic = standardize_residues(
+        result_dic, chain_id, pdb_file, context=context
+    )
+    reslist = get_residue_range(standardized_dic)
+    tables = list(standardized_dic.values())
+    merged = PredictionTable.merge(tables)
+    rows = np.repeat(np.arange(len(tables)), [table.size for table in tables])
+    columns = merged.residues.astype(int) - reslist[0]
+
+    shape = (len(tables), len(reslist))
+    flags = np.zeros(shape, dtype=np.uint8)
+    scores = np.full(shape, np.nan, dtype=np.float32)
+    # the active scores are written over the passive ones
+    for label in (PASSIVE, ACTIVE):
+        # reversed, the first row of a residue is the one written last
+        selected = np.flatnonzero(merged.labels == label)[::-1]
+        flags[rows[selected], columns[selected]] |= LABEL_FLAGS[label]
+        scores[rows[selected], columns[selected]] = merged.scores[selected]
+
+    cells = LABEL_CELLS[flags]
+    scored = np.isfinite(scores)
+    cells[scored] = list(map(str, python_scores(scores[scored])))
+
+    output_df = pd.DataFrame(cells, columns=reslist)
+    output_df.insert(0, "predictor", list(standardized_dic))
+    return output_df
+
+
+def format_output(result_dic, output_fname, pdb_file, chain_id, context=None):
     """
     Format the results into a human-readable format.
 
     Parameters
     ----------
     result_dic : dict
-        The results dictionary.
+        The prediction tables, or dictionaries, of the predictors.
     output_fname : str or pathlib.PosixPath
         The output file name.
+    pdb_file : str
+        Path to pdb file.
+    chain_id : str
+        Chain identifier.
+    context : ChainContext
+        The parsed chain, read from the file if not given.
 
     """
-    standardized_dic = standardize_residues(result_dic, chain_id, pdb_file)
-    reslist = get_residue_range(standardized_dic)
-    data = []
-    for pred in result_dic:
-        row = [pred]
-
-        if pred in scored_predictors:
-            active_list = [x[0] for x in result_dic[pred]["active"]]
-            passive_list = [x[0] for x in result_dic[pred]["passive"]]
-
-            for res in reslist:
-                is_passive = None
-                is_active = None
-
-                if res in passive_list:
-                    is_passive = True
-                    score = result_dic[pred]["passive"][passive_list.index(res)][1]
-
-                if res in active_list:
-                    is_active = True
-                    score = result_dic[pred]["active"][active_list.index(res)][1]
-
-                if is_active and is_passive:
-                    row.append(str(score))
-                elif is_active:
-                    row.append(str(score))
-                elif is_passive:
-                    row.append(str(score))
-                else:
-                    row.append("-")
-            data.append(row)
-
-        else:
-            for res in reslist:
-                is_passive = None
-                is_active = None
-
-                if res in result_dic[pred]["passive"]:
-                    is_passive = True
-
-                if res in result_dic[pred]["active"]:
-                    is_active = True
-
-                if is_active and is_passive:
-                    row.append("AP")
-                elif is_active:
-                    row.append("A")
-                elif is_passive:
-                    row.append("P")
-                else:
-                    row.append("-")
-            data.append(row)
-
-    output_df = pd.DataFrame(data, columns=["predictor"] + reslist)
+    output_df = prediction_matrix(result_dic, pdb_file, chain_id, context=context)
     output_df.to_csv(output_fname, index=False)
 
 
@@ -215,7 +233,7 @@ def get_residue_range(result_dic):
     Parameters
     ----------
     result_dic : dict
-        The results dictionary.
+        The prediction tables, or dictionaries, of the predictors.
 
     Returns
     -------
@@ -223,100 +241,61 @@ def get_residue_range(result_dic):
         The list of residues.
 
     """
-
-    # due to the scored predictors using tuples, the extraction is different
-    active_reslist = []
-    passive_reslist = []
-    for pred in result_dic:
-        if pred in scored_predictors:
-            active_reslist += [x[0] for x in result_dic[pred]["active"]]
-            passive_reslist += [x[0] for x in result_dic[pred]["passive"]]
-        else:
-            active_reslist += [x for x in result_dic[pred]["active"]]
-            passive_reslist += [x for x in result_dic[pred]["passive"]]
-
-    reslist = passive_reslist + active_reslist
-    absolute_range = list(range(min(reslist), max(reslist) + 1))
+    tables = [as_table(result_dic[pred]) for pred in result_dic]
+    reslist = np.concatenate(
+        [table.residues[table.labels != NONE] for table in tables] or [[]]
+    )
+    absolute_range = list(range(int(reslist.min()), int(reslist.max()) + 1))
     return absolute_range
 
 
-def standardize_residues(result_dic, chain_id, pdb_file):
+def standardize_residues(result_dic, chain_id, pdb_file, context=None):
     """
     Standardize the residues from different predictors
-    into a uniform numbering system starting at 1 and
-    prevents any shifts due to gaps in the PDB file.
+    into the numbering system of the PDB file.
+
+    The predictors given the sequence of the chain are mapped to its residues
+    through the index of the chain, so gaps and insertion codes do not shift
+    them. The other predictors not using the PDB numbering are only shifted
+    by the number of its first residue.
 
     Parameters
     ----------
     result_dic: dict
-        The results dictionary
+        The prediction tables, or dictionaries, of the predictors.
+    chain_id : str
+        Chain identifier.
+    pdb_file : str
+        Path to pdb file.
+    context : ChainContext
+        The parsed chain, read from the file if not given.
 
     Returns
     -------
     result_dic : dict
-        The standardized results dict
+        The standardized prediction tables, the given ones are not modified.
 
     """
-    reslist = get_residue_list(pdb_file, chain_id)
-
-    parser = PDB.PDBParser()
-    structure = parser.get_structure("pdb", pdb_file)
-    model = structure[0]
-    chain = model[chain_id]
-    # pdb files start at a number residue, so remove this bias
-    bias = chain.child_list[0].get_full_id()[3][1] - 1
-
-    # if there was no bias present, then no need to run through this block
-    if bias != 0:
-        for pred in result_dic:
-            if pred not in scored_predictors and pred not in pdb_predictors:
-                for index in enumerate(result_dic[pred]["active"]):
-                    result_dic[pred]["active"][index[0]] += bias
-                for index in enumerate(result_dic[pred]["passive"]):
-                    result_dic[pred]["passive"][index[0]] += bias
-            elif pred in scored_predictors and pred not in pdb_predictors:
-                for index in enumerate(result_dic[pred]["active"]):
-                    result_dic[pred]["active"][index[0]][0] += bias
-                for index in enumerate(result_dic[pred]["passive"]):
-                    result_dic[pred]["passive"][index[0]][0] += bias
-
-    # find any missing items from the residue list in the PDB file
-    missing_list = []
-    for ele in range(reslist[0], reslist[-1] + 1):
-        if ele not in reslist:
-            missing_list.append(ele)
-
-    if missing_list:
-        # dummy addition to keep the iteration working
-        missing_list.append(10000000)
-        for pred in result_dic:
-            # these use sequences and do not see missing items
-            if pred == "predictprotein" or pred == "scriber":
-                item = 0
-                bias = 0
-                new_active = []
-                for index in enumerate(result_dic[pred]["active"]):
-                    if index[1][0] >= missing_list[item]:
-                        new_index = index[1][0] + bias
-                        while (
-                            new_index >= missing_list[item] or new_index in missing_list
-                        ):
-                            bias += 1
-                            new_index += 1
-                            item += 1
-
-                        new_active.append(
-                            [new_index, result_dic[pred]["active"][index[0]][1]]
-                        )
-                    else:
-                        new_active.append(
-                            [
-                                index[1][0] + bias,
-                                result_dic[pred]["active"][index[0]][1],
-                            ]
-                        )
-
-                result_dic[pred]["active"] = new_active
+    result_dic = {pred: as_table(result_dic[pred]) for pred in result_dic}
+    if context is None:
+        context = get_context(pdb_file, chain_id)
+
+    for pred in result_dic:
+        table = result_dic[pred]
+        if pred in sequence_predictors or pred in ungapped_predictors:
+            # these number the positions of the sequence they were given
+            numbers, icodes, found = context.index.to_structure(
+                table.residues, gapped=pred in sequence_predictors
+            )
+            if not found.all():
+                log.warning(
+                    f"{pred} predicted {int((~found).sum())} residues outside "
+                    f"the sequence of chain {chain_id}, ignoring them"
+                )
+            result_dic[pred] = table.renumber(numbers, icodes, keep=found)
+        elif pred not in pdb_predictors and context.bias != 0:
+            # pdb files start at a number residue, so remove this bias
+            result_dic[pred] = table.shift(context.bias)
 
     return result_dic
 
@@ -331,16 +310,11 @@ def get_residue_list(pdb_file, chain_id):
         Path to the file that has to be parsed.
     chain_id : str
         Letter to indicate which chain to use from the file.
+
+    Returns
+    -------
+    residue_list : list
+        The residue numbers, HETATM excluded.
+
     """
-    parser = PDB.PDBParser()
-    structure = parser.get_structure("pdb", pdb_file)
-    model = structure[0]
-    chain = model[chain_id]
-    residue_list = []
-
-    for residue in chain:
-        # prevents HETATM from being added
-        if residue.get_full_id()[3][0] == " ":
-            residue_list.append(residue.get_id()[1])
-
-    return residue_list
+    return list(get_context(pdb_file, chain_id).residues)
@@ -4,14 +4,13 @@ import os
 import re
 import shutil
 import sys
-import time
+import tempfile
 import warnings
 import os
 
 from pathlib import Path
 
 from cport.exceptions import ServerConnectionException
-import mechanicalsoup as ms
 from Bio import AlignIO, BiopythonWarning
 from Bio.Blast import NCBIWWW
 from defusedxml import lxml as ET
@@ -19,6 +18,9 @@ from defusedxml import lxml as ET
 with warnings.catch_warnings():
     warnings.simplefilter("ignore", BiopythonWarning)
 
+from cport.modules.polling import PollPolicy
+from cport.modules.session import fetch_page, get_browser
+from cport.modules.table import PredictionTable
 from cport.modules.utils import get_fasta_from_pdbfile
 from cport.url import WHISCY_URL
 
@@ -27,6 +29,8 @@ log = logging.getLogger("cportlog")
 # Total wait (seconds) = WAIT_INTERVAL * NUM_RETRIES
 WAIT_INTERVAL = os.environ.get("WHISCY_WAIT_INTERVAL") if os.environ.get("WHISCY_WAIT_INTERVAL") is not None else 10 # seconds
 NUM_RETRIES = os.environ.get("WHISCY_NUM_RETRIES") if os.environ.get("WHISCY_NUM_RETRIES") is not None else 24
+# The page of a finished job lists the active residues
+ACTIVE_LIST_PATTERN = re.compile(rb"""id\s*=\s*["']?active_list\b""")
 
 
 class Whiscy:
@@ -46,8 +50,13 @@ class Whiscy:
         """
         self.pdb_file = Path(pdb_file)
         self.chain_id = chain_id
-        self.wait = int(WAIT_INTERVAL)
-        self.tries = int(NUM_RETRIES)
+        self.policy = PollPolicy(
+            "whiscy",
+            int(WAIT_INTERVAL),
+            int(WAIT_INTERVAL) * int(NUM_RETRIES),
+            pdb_file=self.pdb_file,
+            chain_id=self.chain_id,
+        )
 
     def submit(self):
         """
@@ -59,12 +68,24 @@ class Whiscy:
             The url to the processing page.
 
         """
+        # the files of the job live in a directory of their own, the jobs of a
+        #  batch run at the same time and chains of one PDB share its stem
+        work_dir = Path(tempfile.mkdtemp(prefix="cport_whiscy_"))
+        try:
+            return self._submit(work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _submit(self, work_dir):
         # A temporary file needs to be created to avoid WHISCY renaming the input
         # to the entire path name causing the prediction to not run as the name
         # of the input needs to match the hssp name otherwise it will not match
         # A more elegant workaround would be preferable, but eludes me as of yet
-        filename = Path(f"{self.pdb_file.stem}_whiscy.pdb")
+        filename = work_dir / f"{self.pdb_file.stem}_whiscy.pdb"
         shutil.copyfile(self.pdb_file, filename)
+        blast_file = work_dir / "blast_res.xml"
+        temp_align_file = work_dir / "temp_align.fasta"
+        align_file = work_dir / "align.fasta"
 
         blast_seq = get_fasta_from_pdbfile(self.pdb_file, self.chain_id)
         blast_len = len(blast_seq)
@@ -77,12 +98,12 @@ class Whiscy:
         # can be used by WHISCY, so this has to be done manually
 
         log.debug("Finished BLAST")
-        with open("blast_res.xml", "w") as save_output:
+        with open(blast_file, "w") as save_output:
             blast_res = blast_res_handle.read()
             save_output.write(blast_res)
 
         align_string = ">main\n" + blast_seq + "\n"
-        tree = ET.parse("blast_res.xml")
+        tree = ET.parse(str(blast_file))
         root = tree.getroot()
         for hit in root[8][0][4]:
             align_len = hit[5][0][13].text
@@ -97,23 +118,23 @@ class Whiscy:
                 continue
 
         log.debug("Preparing alignment for WHISCY")
-        with open("temp_align.fasta", "w") as temp_align:
+        with open(temp_align_file, "w") as temp_align:
             temp_align.write(align_string)
 
         # prepares proper alignment file for WHISCY
-        alignment = AlignIO.read("temp_align.fasta", "fasta")
+        alignment = AlignIO.read(temp_align_file, "fasta")
 
-        with open("align.fasta", "w") as align:
+        with open(align_file, "w") as align:
             align.write(format(alignment, "fasta"))
 
-        browser = ms.StatefulBrowser()
+        browser = get_browser()
 
         browser.open(WHISCY_URL)
 
         form = browser.select_form(nr=1)
-        form.set(name="pdb_file", value=filename)
+        form.set(name="pdb_file", value=str(filename))
         form.set(name="chain", value=self.chain_id.capitalize())
-        form.set(name="alignment_file", value="align.fasta")
+        form.set(name="alignment_file", value=str(align_file))
         form.set(name="alignment_format", value="FASTA")
 
         # currently the submission does not work due to reCAPTCHA
@@ -126,16 +147,13 @@ class Whiscy:
         new_url = re.findall(r"(https:.*)\"", page_text_list)[0]
 
         browser.close()
-        # remove file in main directory for cleanliness
-        os.unlink(filename)
-        os.unlink("temp_align.fasta")
-        os.unlink("align.fasta")
-        os.unlink("blast_res.xml")
 
         return new_url
 
-    def retrieve_prediction(self, url=None, page_text=None):
-        """Retrieve the results.
+    @staticmethod
+    def poll(url=None, page_text=None):
+        """
+        Check once if the WHISCY prediction is finished.
 
         Parameters
         ----------
@@ -146,36 +164,85 @@ class Whiscy:
 
         Returns
         -------
-        prediction_dict : dict
-            The dictionary containing the parsed prediction results with active
-            and passive sites.
+        url : str or None
+            The url to the results, None if the job is still running.
 
         """
-        prediction_dict = {"active": [], "passive": []}
-        browser = ms.StatefulBrowser()
-
         if page_text:
             # this is used in the testing
-            browser.open_fake_page(page_text=page_text)
+            page = str(page_text).encode()
+            url = page_text
         else:
-            browser.open(url)
+            page = fetch_page(url)
+
+        # Check if there's a list of active reisued in the page
+        match = ACTIVE_LIST_PATTERN.search(page)
+
+        if match:
+            return url
+
+        return None
+
+    def retrieve_prediction(self, url=None, page_text=None):
+        """Retrieve the results.
+
+        Parameters
+        ----------
+        url : str
+            The url to the results.
+        page_text : str
+            The text of the page to parse - used for testing.
 
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
         completed = False
         while not completed:
-            # Check if there's a list of active reisued in the page
-            if browser.page.find_all(id="active_list"):
+            if self.poll(url=url, page_text=page_text):
                 completed = True
+            elif self.policy.expired():
+                # the deadline passed, the server is not responding
+                log.error("WHISCY server is not responding, url was %s", url)
+                raise ServerConnectionException("WHISCY server is not responding, url was %s", url)
             else:
                 # still running, wait a bit
-                log.debug("Waiting for WHISCY to finish... %s", self.tries)
-                time.sleep(self.wait)
-                browser.refresh()
-                self.tries -= 1
+                delay = self.policy.next_delay()
+                log.debug("Waiting for WHISCY to finish... %.0fs", delay)
+                self.policy.wait(delay)
 
-            if self.tries == 0:
-                # if tries is 0, then the server is not responding
-                log.error("WHISCY server is not responding, url was %s", url)
-                raise ServerConnectionException("WHISCY server is not responding, url was %s", url)
+        return self.parse_prediction(url=url, page_text=page_text)
+
+    @staticmethod
+    def parse_prediction(url=None, page_text=None):
+        """
+        Take the results extracts the active and passive residue predictions.
+
+        Parameters
+        ----------
+        url : str
+            The url to the results.
+        page_text : str or bytes
+            The page to parse instead of opening `url`.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        prediction_dict = {"active": [], "passive": []}
+        browser = get_browser()
+
+        if page_text:
+            # a page downloaded by `fetch`, or a test page
+            browser.open_fake_page(page_text=page_text)
+        else:
+            browser.open(url)
 
         active_residues_list = re.split(
             r"\,",
@@ -191,7 +258,64 @@ class Whiscy:
 
         browser.close()
 
-        return prediction_dict
+        return PredictionTable.from_dict(prediction_dict)
+
+    def collect(self, prediction_url):
+        """
+        Download and parse the results of a finished job.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return self.parse(self.fetch(prediction_url))
+
+    @staticmethod
+    def fetch(prediction_url):
+        """
+        Download the results page of a finished job, the download stage.
+
+        Parameters
+        ----------
+        prediction_url : str
+            The url to the results.
+
+        Returns
+        -------
+        page : bytes
+            The content of the results page.
+
+        """
+        return fetch_page(prediction_url)
+
+    @staticmethod
+    def parse(page):
+        """
+        Parse a downloaded results page, the parsing stage.
+
+        Runs in a worker process, so it only takes the content of the page.
+
+        Parameters
+        ----------
+        page : bytes
+            The content of the results page.
+
+        Returns
+        -------
+        prediction_dict : PredictionTable
+            The table containing the parsed prediction results with active
+            and passive sites.
+
+        """
+        return Whiscy.parse_prediction(page_text=page)
 
     def run(self):
         """
@@ -199,11 +323,13 @@ class Whiscy:
 
         Returns
         -------
-        prediction_dict : dict
-            A dictionary containing the raw prediction.
+        prediction_dict : PredictionTable
+            A table containing the raw prediction.
 
         """
         submitted_url = self.submit()
+        self.policy.wait(self.policy.start())
         prediction_dict = self.retrieve_prediction(url=submitted_url)
+        self.policy.finish()
 
         return prediction_dict
@@ -0,0 +1,195 @@
+"""Test the batch mode."""
+import time
+from pathlib import Path
+
+import pytest
+
+from cport import cli
+from cport.modules import batch, planner
+from cport.modules.batch import read_manifest, report_throughput, run_batch
+from cport.modules.pipeline import process_pool
+from cport.modules.polling import PollPolicy
+
+PDB_FILE = Path(Path(__file__).parent, "test_data", "1PPE.pdb")
+
+
+class FakePredictor:
+    def __init__(self, pdb_file, chain_id):
+        self.pdb_file = pdb_file
+        self.chain_id = chain_id
+        self.policy = PollPolicy("fake", interval=0, deadline=5)
+
+    def submit(self):
+        return self.chain_id
+
+    def poll(self, handle):
+        return handle
+
+    def collect(self, link):
+        return {"active": [[1, 0.9]], "passive": [], "chain": link}
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = Path(tmp_path, "manifest.tsv")
+    manifest.write_text(
+        "pdb_file\tchain_id\tpredictors\n"
+        "# comment\n"
+        "\n"
+        "1PPE.pdb\tE\tscriber,ispred4\n"
+        "/data/2OOB.pdb\tA\n"
+        "1PPE.pdb\tE\tscannet\n"
+    )
+    return manifest
+
+
+def test_read_manifest(manifest):
+    entries = read_manifest(manifest, default_pred=["sppider"])
+
+    assert entries == [
+        {
+            "pdb_file": str(Path(manifest.parent, "1PPE.pdb")),
+            "chain_id": "E",
+            "pred": ["scriber", "ispred4", "scannet"],
+        },
+        {"pdb_file": "/data/2OOB.pdb", "chain_id": "A", "pred": ["sppider"]},
+    ]
+
+
+def test_read_manifest_missing_chain(tmp_path):
+    manifest = Path(tmp_path, "manifest.tsv")
+    manifest.write_text("1PPE.pdb\n")
+
+    with pytest.raises(ValueError):
+        read_manifest(manifest, default_pred=["sppider"])
+
+
+def test_run_batch(monkeypatch):
+    def load_predictor(prediction_method, **kwargs):
+        if prediction_method == "unknown":
+            raise ValueError(f"Unknown prediction method: {prediction_method}")
+        return FakePredictor(kwargs["pdb_file"], kwargs["chain_id"])
+
+    monkeypatch.setattr(batch, "load_predictor", load_predictor)
+    entries = [
+        {"pdb_file": PDB_FILE, "chain_id": "E", "pred": ["scriber", "unknown"]},
+        {"pdb_file": PDB_FILE, "chain_id": "I", "pred": ["scriber", "sppider"]},
+    ]
+
+    results = run_batch(entries, limits={"scriber": 1})
+
+    assert [entry["chain_id"] for entry, _ in results] == ["E", "I"]
+    assert list(results[0][1]) == ["scriber"]
+    assert list(results[1][1]) == ["scriber", "sppider"]
+    assert results[1][1]["sppider"]["chain"] == "I"
+
+
+def test_run_batch_dedup(monkeypatch, tmp_path):
+    # a homodimer, chain F is a copy of chain E
+    dimer_pdb = Path(tmp_path, "dimer.pdb")
+    chain_e = [
+        line
+        for line in PDB_FILE.read_text().splitlines(keepends=True)
+        if line.startswith("ATOM") and line[21] == "E"
+    ]
+    dimer_pdb.write_text(
+        "".join(chain_e + [f"{line[:21]}F{line[22:]}" for line in chain_e])
+    )
+    loaded = []
+
+    def load_predictor(prediction_method, **kwargs):
+        loaded.append((prediction_method, kwargs["chain_id"]))
+        return FakePredictor(kwargs["pdb_file"], kwargs["chain_id"])
+
+    monkeypatch.setattr(batch, "load_predictor", load_predictor)
+    entries = [
+        {"pdb_file": dimer_pdb, "chain_id": "E", "pred": ["scriber", "sppider"]},
+        {"pdb_file": dimer_pdb, "chain_id": "F", "pred": ["scriber", "sppider"]},
+        {"pdb_file": PDB_FILE, "chain_id": "E", "pred": ["scriber", "sppider"]},
+    ]
+
+    results = run_batch(entries)
+
+    # the repeated chains share the jobs of the first one
+    assert loaded == [("scriber", "E"), ("sppider", "E")]
+    for _, result_dic in results:
+        assert list(result_dic) == ["scriber", "sppider"]
+        assert result_dic["scriber"]["chain"] == "E"
+    # every member gets its own copy to be remapped
+    assert results[0][1]["scriber"] is not results[1][1]["scriber"]
+
+
+def test_report_throughput():
+    assert report_throughput(10, 1800) == 20.0
+    assert report_throughput(0, 0) == 0.0
+
+
+def test_run_batch_deadline(monkeypatch):
+    class NeverPredictor(FakePredictor):
+        def poll(self, handle):
+            return None
+
+    def load_predictor(prediction_method, **kwargs):
+        if prediction_method == "sppider":
+            return NeverPredictor(kwargs["pdb_file"], kwargs["chain_id"])
+        return FakePredictor(kwargs["pdb_file"], kwargs["chain_id"])
+
+    monkeypatch.setattr(batch, "load_predictor", load_predictor)
+    entries = [{"pdb_file": PDB_FILE, "chain_id": "E", "pred": ["scriber", "sppider"]}]
+
+    ((_, result_dic),) = run_batch(entries, deadline=time.monotonic() + 0.3)
+
+    # only the predictors finished before the deadline are returned
+    assert list(result_dic) == ["scriber"]
+
+
+def test_run_batch_processes(monkeypatch):
+    def load_predictor(prediction_method, **kwargs):
+        return FakePredictor(kwargs["pdb_file"], kwargs["chain_id"])
+
+    monkeypatch.setattr(batch, "load_predictor", load_predictor)
+    entries = [
+        {"pdb_file": PDB_FILE, "chain_id": "E", "pred": ["scriber", "sppider"]},
+        {"pdb_file": PDB_FILE, "chain_id": "I", "pred": ["scriber"]},
+    ]
+    pool = process_pool(2)
+
+    results = run_batch(entries, processes=pool)
+    pool.shutdown()
+
+    # the content keys computed in the pool still tell the chains apart
+    assert list(results[0][1]) == ["scriber", "sppider"]
+    assert results[1][1]["scriber"]["chain"] == "I"
+
+
+def test_batch_main_row_predictors(monkeypatch, tmp_path):
+    manifest = Path(tmp_path, "manifest.tsv")
+    manifest.write_text(f"{PDB_FILE}\tE\tpsiver,scriber\n{PDB_FILE}\tI\n")
+    written = {}
+
+    def load_predictor(prediction_method, **kwargs):
+        return FakePredictor(kwargs["pdb_file"], kwargs["chain_id"])
+
+    def output_results(result_dic, pdb_file, chain_id, output_dir):
+        written[chain_id] = sorted(result_dic)
+
+    monkeypatch.setattr(batch, "load_predictor", load_predictor)
+    monkeypatch.setattr(planner, "run_model", lambda *args: None)
+    monkeypatch.setattr(cli, "output_results", output_results)
+    model = cli.scriber_ispred4_scannet_sppider
+    needed = cli.ML_PREDICTION[model]["needed"]
+
+    cli.batch_main(
+        str(manifest),
+        None,
+        [],
+        None,
+        str(Path(tmp_path, "output")),
+        num_processes=0,
+        model=[model.__name__],
+        no_cache=True,
+    )
+
+    # the row listing predictors keeps them next to the ones of the model
+    assert written["E"] == sorted(needed + ["psiver"])
+    assert written["I"] == sorted(needed)
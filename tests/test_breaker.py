@@ -0,0 +1,227 @@
+"""Test the circuit breakers."""
+import time
+
+import pytest
+
+from cport.exceptions import (
+    ChainException,
+    CircuitOpenException,
+    ServerConnectionException,
+)
+from cport.modules import breaker as breaker_module
+from cport.modules import loader
+from cport.modules.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from cport.modules.polling import PollPolicy
+from cport.modules.scheduler import DONE, FAILED, PollScheduler, PredictionJob
+
+
+class FakePredictor:
+    def __init__(self):
+        self.policy = PollPolicy("fake", interval=0, deadline=5)
+        self.submitted = False
+
+    def submit(self):
+        self.submitted = True
+        return "handle"
+
+    def poll(self, handle):
+        return "link"
+
+    def collect(self, link):
+        return {"active": [], "passive": []}
+
+
+class BrokenPredictor(FakePredictor):
+    def submit(self):
+        self.submitted = True
+        raise ServerConnectionException("server error")
+
+
+class MissingChainPredictor(FakePredictor):
+    def submit(self):
+        self.submitted = True
+        raise ChainException("missing chain")
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    probes = {"count": 0, "healthy": False, "verify": []}
+
+    def probe_url(url, verify=True):
+        probes["count"] += 1
+        probes["verify"].append(verify)
+        return probes["healthy"]
+
+    monkeypatch.setattr(breaker_module, "probe_url", probe_url)
+    return probes
+
+
+def test_open_after_failures(probes):
+    breaker = CircuitBreaker("fake", "http://fake", threshold=2, reset_timeout=60)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    # the server is not probed before the reset timeout
+    assert probes["count"] == 0
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker("fake", threshold=2)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CLOSED
+
+
+def test_cached_probe(probes):
+    breaker = CircuitBreaker(
+        "fake", "http://fake", threshold=1, reset_timeout=0, probe_ttl=60
+    )
+    breaker.record_failure()
+
+    assert not breaker.allow()
+    assert not breaker.allow()
+    assert probes["count"] == 1
+
+
+def test_half_open(probes):
+    breaker = CircuitBreaker(
+        "fake", "http://fake", threshold=1, reset_timeout=0.1, probe_ttl=60
+    )
+    breaker.record_failure()
+    probes["healthy"] = True
+    time.sleep(0.1)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+    # a failure while half-open opens it again straight away
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.1)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert probes["count"] == 2
+
+
+def test_single_trial(probes):
+    breaker = CircuitBreaker(
+        "fake", "http://fake", threshold=1, reset_timeout=0.1, probe_ttl=60
+    )
+    breaker.record_failure()
+    probes["healthy"] = True
+    time.sleep(0.1)
+
+    # only the trial job goes through while half-open
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+    # the server accepting the trial closes it
+    breaker.record_submitted()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_lost_trial(probes):
+    breaker = CircuitBreaker(
+        "fake", "http://fake", threshold=1, reset_timeout=0.1, probe_ttl=60
+    )
+    breaker.record_failure()
+    probes["healthy"] = True
+    time.sleep(0.1)
+    assert breaker.allow()
+
+    # a trial that never reports back lets another one through
+    time.sleep(0.1)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_probe_verify(probes):
+    for name, verify in (("scriber", True), ("sppider", True), ("meta_ppisp", False)):
+        breaker = breaker_module.BREAKERS.pop(name, None)
+        try:
+            probed = breaker_module.get_breaker(name)
+            probed.probe()
+            assert probed.verify == verify
+            assert probes["verify"][-1] == verify
+        finally:
+            if breaker is not None:
+                breaker_module.BREAKERS[name] = breaker
+            else:
+                breaker_module.BREAKERS.pop(name, None)
+
+
+def test_scheduler_fails_fast():
+    breaker = CircuitBreaker("fake", threshold=1, reset_timeout=60)
+    scheduler = PollScheduler(num_workers=1)
+    scheduler.add(PredictionJob("fake", BrokenPredictor(), key=1, breaker=breaker))
+    scheduler.add(PredictionJob("fake", FakePredictor(), key=2, breaker=breaker))
+
+    broken, skipped = scheduler.run()
+
+    assert broken.state == FAILED
+    assert skipped.state == FAILED
+    assert isinstance(skipped.error, CircuitOpenException)
+    assert not skipped.predictor.submitted
+
+
+def test_scheduler_closes():
+    breaker = CircuitBreaker("fake", threshold=2)
+    breaker.record_failure()
+    scheduler = PollScheduler()
+    scheduler.add(PredictionJob("fake", FakePredictor(), breaker=breaker))
+
+    (job,) = scheduler.run()
+
+    assert job.state == DONE
+    assert breaker.failures == 0
+
+
+def test_scheduler_local_errors():
+    # a chain missing from the input is not the fault of the server
+    breaker = CircuitBreaker("fake", threshold=1, reset_timeout=60)
+    scheduler = PollScheduler(num_workers=1)
+    scheduler.add(
+        PredictionJob("fake", MissingChainPredictor(), key=1, breaker=breaker)
+    )
+    scheduler.add(PredictionJob("fake", FakePredictor(), key=2, breaker=breaker))
+
+    missing, job = scheduler.run()
+
+    assert missing.state == FAILED
+    assert job.state == DONE
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.parametrize(
+    "error, failure",
+    [
+        (ServerConnectionException("server error"), True),
+        (ChainException("missing chain"), False),
+        (ValueError("unparsable results"), False),
+    ],
+)
+def test_run_prediction_failures(monkeypatch, error, failure):
+    def predictor(pdb_file, chain_id):
+        raise error
+
+    breaker = CircuitBreaker("scriber", threshold=1, reset_timeout=60)
+    monkeypatch.setitem(loader.PDB_PREDICTORS, "scriber", predictor)
+    monkeypatch.setitem(breaker_module.BREAKERS, "scriber", breaker)
+
+    with pytest.raises(type(error)):
+        loader.run_prediction("scriber", pdb_file="1PPE.pdb", chain_id="E")
+
+    # like in the scheduler, only the errors of the server open the breaker
+    assert (breaker.state == OPEN) == failure
@@ -0,0 +1,165 @@
+"""Test the result cache."""
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from cport import cli
+from cport.modules import batch
+from cport.modules.batch import run_entries
+from cport.modules.cache import ResultCache, cache_key
+from cport.modules.error import CacheMissError
+from cport.modules.loader import run_prediction
+from cport.modules.table import PredictionTable
+
+PDB_FILE = Path(Path(__file__).parent, "test_data", "1PPE.pdb")
+
+PREDICTION = {"active": [[1, 0.9], [2, 0.6]], "passive": [[3, 0.1]]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(tmp_path)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def renamed_pdb(tmp_path):
+    """1PPE with chain E renamed to X and renumbered atom serials."""
+    renamed_pdb = Path(tmp_path, "renamed.pdb")
+    lines = []
+    for line in PDB_FILE.read_text().splitlines(keepends=True):
+        if line.startswith("ATOM") and line[21] == "E":
+            line = f"{line[:6]}{99999:5d}{line[11:21]}X{line[22:]}"
+        lines.append(line)
+    renamed_pdb.write_text("".join(lines))
+    return renamed_pdb
+
+
+def test_get_put(cache):
+    assert cache.get("key") is None
+
+    cache.put("key", "sppider", PREDICTION)
+
+    assert cache.get("key") == PREDICTION
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_ttl(tmp_path):
+    cache = ResultCache(tmp_path, ttl=-1)
+    cache.put("key", "sppider", PREDICTION)
+
+    assert cache.get("key") is None
+    assert cache.size() == 0
+    cache.close()
+
+
+def test_json_entries(cache):
+    # the previous versions stored the predictions as json
+    cache._connection.execute(
+        "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)",
+        ("key", "sppider", json.dumps(PREDICTION), 0, time.time() + 60, 0),
+    )
+
+    assert cache.get("key") == PREDICTION
+
+
+def test_lru_eviction(tmp_path):
+    entry_size = len(PredictionTable.from_dict(PREDICTION).to_bytes())
+    cache = ResultCache(tmp_path, max_bytes=2 * entry_size + 10)
+    cache.put("first", "sppider", PREDICTION)
+    cache.put("second", "sppider", PREDICTION)
+    # reading the first entry makes the second one the least recently used
+    cache.get("first")
+    cache.put("third", "sppider", PREDICTION)
+
+    assert cache.get("second") is None
+    assert cache.get("first") == PREDICTION
+    assert cache.get("third") == PREDICTION
+    assert cache.size() <= cache.max_bytes
+    cache.close()
+
+
+def test_persistence(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.put("key", "sppider", PREDICTION)
+    cache.close()
+
+    cache = ResultCache(tmp_path)
+    assert cache.get("key") == PREDICTION
+    cache.close()
+
+
+def test_cache_key(renamed_pdb):
+    # the chain identifier and atom serials do not change the content
+    assert cache_key("sppider", PDB_FILE, "E") == cache_key(
+        "sppider", renamed_pdb, "X"
+    )
+    assert cache_key("sppider", PDB_FILE, "E") != cache_key("sppider", PDB_FILE, "I")
+    assert cache_key("sppider", PDB_FILE, "E") != cache_key("ispred4", PDB_FILE, "E")
+
+
+def test_cache_key_sequence(tmp_path):
+    moved_pdb = Path(tmp_path, "moved.pdb")
+    lines = []
+    for line in PDB_FILE.read_text().splitlines(keepends=True):
+        if line.startswith("ATOM"):
+            line = f"{line[:30]}{float(line[30:38]) + 1:8.3f}{line[38:]}"
+        lines.append(line)
+    moved_pdb.write_text("".join(lines))
+
+    # sequence-based predictors ignore the coordinates, the others do not
+    assert cache_key("scriber", PDB_FILE, "E") == cache_key("scriber", moved_pdb, "E")
+    assert cache_key("sppider", PDB_FILE, "E") != cache_key("sppider", moved_pdb, "E")
+
+
+def test_run_prediction_cached(cache):
+    cache.put(cache_key("sppider", PDB_FILE, "E"), "sppider", PREDICTION)
+
+    result = run_prediction(
+        "sppider", cache=cache, pdb_file=PDB_FILE, chain_id="E", pdb_id=None
+    )
+
+    assert result == PREDICTION
+
+
+def test_run_prediction_offline(tmp_path):
+    cache = ResultCache(tmp_path, offline=True)
+
+    with pytest.raises(CacheMissError):
+        run_prediction(
+            "sppider", cache=cache, pdb_file=PDB_FILE, chain_id="E", pdb_id=None
+        )
+    cache.close()
+
+
+def test_run_entries_offline(tmp_path, monkeypatch):
+    def load_predictor(prediction_method, **kwargs):
+        raise AssertionError("the servers must not be contacted")
+
+    monkeypatch.setattr(batch, "load_predictor", load_predictor)
+    cache = ResultCache(tmp_path, offline=True)
+    cache.put(cache_key("sppider", PDB_FILE, "E"), "sppider", PREDICTION)
+    entries = [
+        {"pdb_file": str(PDB_FILE), "chain_id": "E", "pred": ["sppider", "ispred4"]}
+    ]
+
+    ((_, result_dic),) = run_entries(entries, cache=cache)
+
+    assert result_dic == {"sppider": PREDICTION}
+    cache.close()
+
+
+@pytest.mark.parametrize("parser", [cli.argument_parser, cli.batch_argument_parser])
+def test_cache_flags_exclusive(parser, capsys):
+    argv = ["1PPE.pdb", "E"] if parser is cli.argument_parser else ["manifest.tsv"]
+
+    with pytest.raises(SystemExit):
+        parser.parse_args(argv + ["--no_cache", "--cache_only"])
+    assert "not allowed with" in capsys.readouterr().err
+
+    with pytest.raises(ValueError):
+        cli.open_cache(None, no_cache=True, cache_only=True)
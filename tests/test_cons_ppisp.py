@@ -1,9 +1,11 @@
 # Test if the cons_ppisp prediction is working
+import shutil
 from pathlib import Path
 
 import pytest
 
 from cport.modules.cons_ppisp import ConsPPISP
+from cport.modules.pipeline import process_pool
 
 
 @pytest.fixture
@@ -43,6 +45,19 @@ def test_parse_prediction(cons_ppisp, precalc_result):
     assert len(observed_result_dic["passive"]) == 120
 
 
+def test_parse_in_process(cons_ppisp, precalc_result, tmp_path):
+    result_file = Path(tmp_path, "result.txt")
+    shutil.copy(precalc_result, result_file)
+    pool = process_pool(1)
+
+    observed_result_dic = pool.submit(ConsPPISP.parse, str(result_file)).result()
+    pool.shutdown()
+
+    assert observed_result_dic == cons_ppisp.parse_prediction(test_file=precalc_result)
+    # the downloaded file is removed once parsed
+    assert not result_file.exists()
+
+
 @pytest.mark.skip("Overlaps with previous")
 def test_run():
     pass
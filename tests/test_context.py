@@ -0,0 +1,131 @@
+"""Test the shared chain contexts."""
+import pickle
+import shutil
+
+import numpy as np
+import pytest
+from Bio import PDB, SeqIO
+
+from cport.exceptions import ChainException
+from cport.modules import context as context_module
+from cport.modules.context import ChainContext, ResidueIndex, get_context
+from cport.modules.utils import format_output, get_fasta_from_pdbfile
+
+PDB_FILE = "tests/test_data/1PPE.pdb"
+
+
+@pytest.fixture
+def pdb_file(tmp_path):
+    path = tmp_path / "1PPE.pdb"
+    shutil.copy(PDB_FILE, path)
+    return path
+
+
+@pytest.mark.parametrize("chain_id", ["E", "I"])
+def test_from_file(chain_id):
+    context = ChainContext.from_file(PDB_FILE, chain_id)
+
+    chain = PDB.PDBParser().get_structure("pdb", PDB_FILE)[0][chain_id]
+    with open(PDB_FILE) as handle:
+        (sequence,) = [
+            str(record.seq)
+            for record in SeqIO.PdbIO.PdbAtomIterator(handle)
+            if record.id[-1] == chain_id
+        ]
+
+    assert context.sequence == sequence
+    assert context.residues == [
+        residue.get_id()[1] for residue in chain if residue.get_id()[0] == " "
+    ]
+    assert context.first_residue == chain.child_list[0].get_id()[1]
+    assert all(
+        item not in context.residues
+        and context.residues[0] < item < context.residues[-1]
+        for item in context.missing
+    )
+
+
+def test_index():
+    index = ResidueIndex.from_residues(
+        [1, 2, 5, 5, 6, 7], [" ", " ", " ", "A", " ", " "], ["ALA"] * 5 + ["HOH"]
+    )
+
+    assert index.sequence == "AAXXAAA"
+    numbers, icodes, found = index.to_structure([1, 3, 6, 8])
+    assert numbers.tolist() == [1, 3, 5, 0]
+    assert icodes.tolist() == [b"", b"", b"A", b""]
+    assert found.tolist() == [True, True, True, False]
+
+    numbers, icodes, found = index.to_structure([3, 4, 5], gapped=False)
+    assert numbers.tolist() == [5, 5, 6]
+    assert icodes.tolist() == [b"", b"A", b""]
+
+    positions, found = index.to_sequence([5, 5, 3, 7], [b"", b"A", b"", b""])
+    assert positions.tolist() == [5, 6, 0, 0]
+    assert found.tolist() == [True, True, False, False]
+    positions, _ = index.to_sequence([5, 5], [b"", b"A"], gapped=False)
+    assert positions.tolist() == [3, 4]
+
+
+def test_index_roundtrip():
+    index = get_context(PDB_FILE, "E").index
+
+    positions = np.arange(1, len(index.sequence.replace("X", "")) + 1)
+    numbers, icodes, found = index.to_structure(positions, gapped=False)
+
+    assert found.all()
+    assert (b"A" == icodes).sum() == 3
+    assert (index.to_sequence(numbers, icodes, gapped=False)[0] == positions).all()
+
+
+def test_chain_bytes():
+    context = ChainContext.from_file(PDB_FILE, "I")
+
+    lines = context.pdb_bytes.splitlines()
+    assert lines[-1] == b"END"
+    assert all(line[21:22] == b"I" for line in lines[:-1])
+    assert sum(line.startswith(b"ATOM") for line in lines) == 222
+    # the digest identifies the chain, not the file
+    assert context.digest != ChainContext.from_file(PDB_FILE, "E").digest
+
+
+def test_missing_chain():
+    with pytest.raises(ChainException):
+        ChainContext.from_file(PDB_FILE, "Z")
+
+
+def test_parsed_once(pdb_file, tmp_path):
+    get_fasta_from_pdbfile(pdb_file, "E")
+    get_fasta_from_pdbfile(pdb_file, "E")
+    format_output(
+        {"ispred4": {"active": [20], "passive": [21]}},
+        tmp_path / "output.csv",
+        pdb_file,
+        "E",
+    )
+
+    assert context_module.PARSES[str(pdb_file)] == 1
+    assert get_context(pdb_file, "E") is get_context(str(pdb_file), "E")
+
+
+def test_edited_file(pdb_file):
+    first = get_context(pdb_file, "E")
+
+    with open(pdb_file) as handle:
+        content = handle.read()
+    with open(pdb_file, "w") as handle:
+        handle.write(content.replace(" E ", " Z "))
+
+    with pytest.raises(ChainException):
+        get_context(pdb_file, "E")
+    assert first.sequence
+
+
+def test_pickle():
+    context = get_context(PDB_FILE, "E")
+
+    copy = pickle.loads(pickle.dumps(context))
+
+    assert copy.sequence == context.sequence
+    assert copy.residues == context.residues
+    assert copy.digest == context.digest
@@ -0,0 +1,131 @@
+"""Test the detached submit and collect workflow."""
+import json
+from pathlib import Path
+
+import pytest
+
+from cport import cli
+from cport.modules import batch
+from cport.modules.detached import RUN_FILE, add_entries, load_run
+from cport.modules.journal import JOURNAL_NAME, JobJournal
+from cport.modules.polling import PollPolicy
+
+PDB_FILE = Path(Path(__file__).parent, "test_data", "1PPE.pdb")
+
+
+class FakePredictor:
+    ready = False
+    submitted = 0
+
+    def __init__(self, pdb_file, chain_id):
+        self.chain_id = chain_id
+        self.policy = PollPolicy("fake", interval=3600, deadline=36000)
+
+    def submit(self):
+        FakePredictor.submitted += 1
+        return {"job_id": self.chain_id}
+
+    def poll(self, handle):
+        return f"http://results/{handle['job_id']}" if FakePredictor.ready else None
+
+    def collect(self, link):
+        return {"active": [[1, 0.9], [2, 0.8]], "passive": [[3, 0.1]]}
+
+
+@pytest.fixture
+def fake_predictor(monkeypatch):
+    FakePredictor.ready = False
+    FakePredictor.submitted = 0
+    monkeypatch.setattr(
+        batch,
+        "load_predictor",
+        lambda prediction_method, **kwargs: FakePredictor(
+            kwargs["pdb_file"], kwargs["chain_id"]
+        ),
+    )
+    return FakePredictor
+
+
+def test_add_entries(tmp_path):
+    run = load_run(tmp_path)
+    entry = {"pdb_file": PDB_FILE, "chain_id": "E", "pred": ["scriber"]}
+
+    add_entries(run, [dict(entry, output_dir="a")])
+    add_entries(run, [dict(entry, output_dir="b", model=["model"])])
+
+    # submitting the same chain again replaces it, with its new options
+    assert len(run["entries"]) == 1
+    assert run["entries"][0]["output_dir"] == str(Path("b").resolve())
+    assert run["entries"][0]["model"] == ["model"]
+    assert Path(run["entries"][0]["pdb_file"]).is_absolute()
+
+
+def test_submit_and_collect(fake_predictor, tmp_path):
+    output_dir = Path(tmp_path, "output")
+    cache_dir = str(Path(tmp_path, "cache"))
+
+    cli.submit_main(
+        str(PDB_FILE),
+        "E",
+        manifest=None,
+        pred=["scriber"],
+        model=None,
+        limit=[],
+        num_workers=None,
+        output_dir=str(output_dir),
+        cache_dir=cache_dir,
+    )
+
+    # submitted without waiting, the handle is in the journal
+    assert fake_predictor.submitted == 1
+    assert not Path(output_dir, "predictors_1PPE.csv").exists()
+    (outstanding,) = JobJournal(Path(output_dir, JOURNAL_NAME)).outstanding()
+    assert outstanding["handle"] == {"job_id": "E"}
+
+    # still running
+    assert cli.collect_run(str(output_dir), cache_dir=cache_dir) == 1
+    assert not Path(output_dir, "predictors_1PPE.csv").exists()
+
+    fake_predictor.ready = True
+    assert cli.collect_run(str(output_dir), cache_dir=cache_dir) == 0
+    assert Path(output_dir, "predictors_1PPE.csv").exists()
+    run = json.loads(Path(output_dir, RUN_FILE).read_text())
+    assert run["entries"][0]["written"]
+
+    # collecting again does nothing
+    assert cli.collect_run(str(output_dir), cache_dir=cache_dir) == 0
+    assert fake_predictor.submitted == 1
+
+
+def test_entries_keep_their_options(monkeypatch, tmp_path):
+    planned = []
+
+    def run_entries(entries, **kwargs):
+        planned[:] = entries
+        return [(dict(entry, pending=entry["pred"]), {}) for entry in entries]
+
+    monkeypatch.setattr(cli, "run_entries", run_entries)
+    model = cli.scriber_ispred4_scannet_sppider
+
+    # two submissions with other options to the same directory
+    submissions = (("E", ["scriber"], None), ("I", None, [model.__name__]))
+    for chain_id, pred, models in submissions:
+        cli.submit_main(
+            str(PDB_FILE),
+            chain_id,
+            manifest=None,
+            pred=pred,
+            model=models,
+            limit=[],
+            num_workers=None,
+            output_dir=str(tmp_path),
+            cache_dir=str(Path(tmp_path, "cache")),
+        )
+
+    first, second = planned
+    assert first["pred"] == ["scriber"]
+    assert first["models"] == cli.ML_PREDICTION
+    assert first["keep_predictors"]
+    assert sorted(second["pred"]) == sorted(cli.ML_PREDICTION[model]["needed"])
+    assert list(second["models"]) == [model]
+    assert not second["keep_predictors"]
@@ -0,0 +1,106 @@
+"""Test the numpy engine of the ML models."""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from cport.modules.engine import DenseNetwork, export_model, npz_path
+from cport.modules.predict import MODEL_OUTPUTS
+
+MODEL_DIR = Path(__file__).parents[1] / "model"
+
+
+@pytest.fixture
+def network():
+    rng = np.random.default_rng(0)
+    return DenseNetwork(
+        [
+            (rng.normal(size=(3, 8)), rng.normal(size=8), "tanh"),
+            (rng.normal(size=(8, 4)), rng.normal(size=4), "relu"),
+            (rng.normal(size=(4, 1)), rng.normal(size=1), "sigmoid"),
+        ]
+    )
+
+
+def features(columns, rows=20000):
+    # scores and labels, like the cells of the predictors tables
+    rng = np.random.default_rng(1)
+    return np.where(
+        rng.random((rows, columns)) < 0.3,
+        rng.choice([0.0, 0.5, 1.0], (rows, columns)),
+        rng.random((rows, columns)),
+    )
+
+
+def test_save_load(network, tmp_path):
+    network.save(tmp_path / "network.npz")
+
+    loaded = DenseNetwork.load(tmp_path / "network.npz")
+
+    values = features(3, rows=100)
+    assert (loaded.predict(values) == network.predict(values)).all()
+    assert [layer[2] for layer in loaded.layers] == ["tanh", "relu", "sigmoid"]
+
+
+def test_predict(network):
+    values = features(3, rows=1000)
+
+    probabilities = network.predict(values)
+
+    assert probabilities.shape == (1000, 1)
+    assert probabilities.dtype == np.float32
+    assert ((probabilities >= 0) & (probabilities <= 1)).all()
+    # the rounding of the products depends on the rows computed together
+    assert np.allclose(
+        network.predict(values, batch_size=7), probabilities, atol=1e-6
+    )
+    assert network.predict(values[0]).shape == (1, 1)
+
+
+def test_sigmoid_overflow():
+    network = DenseNetwork([(np.ones((1, 1)), np.zeros(1), "sigmoid")])
+
+    with np.errstate(over="raise"):
+        probabilities = network.predict([[-1000.0], [0.0], [1000.0]])
+
+    assert probabilities.ravel().tolist() == [0.0, 0.5, 1.0]
+
+
+def test_unsupported_activation():
+    with pytest.raises(ValueError):
+        DenseNetwork([(np.ones((1, 1)), np.zeros(1), "softplus")])
+
+
+@pytest.mark.parametrize("name", list(MODEL_OUTPUTS))
+def test_shipped_export(name):
+    keras = pytest.importorskip("tensorflow").keras
+    model = keras.models.load_model(MODEL_DIR / MODEL_OUTPUTS[name]["model"])
+    network = DenseNetwork.load(npz_path(MODEL_DIR / MODEL_OUTPUTS[name]["model"]))
+
+    values = features(model.input_shape[1])
+    expected = model.predict(values, batch_size=4096, verbose=0)
+
+    assert np.abs(network.predict(values) - expected).max() < 1e-6
+
+
+def test_export(tmp_path):
+    keras = pytest.importorskip("tensorflow").keras
+    model = keras.Sequential(
+        [
+            keras.layers.Dense(4, activation="relu", input_shape=(2,)),
+            keras.layers.Dropout(0.5),
+            keras.layers.Dense(1, activation="sigmoid", use_bias=False),
+        ]
+    )
+    model.save(tmp_path / "model")
+
+    network = DenseNetwork.load(export_model(tmp_path / "model"))
+
+    values = features(2, rows=100)
+    assert np.allclose(
+        network.predict(values), model.predict(values, verbose=0), atol=1e-6
+    )
+
+    model = keras.Sequential([keras.layers.BatchNormalization(input_shape=(2,))])
+    with pytest.raises(ValueError):
+        DenseNetwork.from_keras(model)
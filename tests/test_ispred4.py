@@ -22,6 +22,14 @@ def test_submit(ispred4):
     assert isinstance(summary_url, str)
 
 
+def test_poll(ispred4):
+    page_text = (
+        "https://ispred4.biocomp.unibo.it/ispred/default/"
+        "job_summary?jobid=c789-edt-093c <div>--</div>"
+    )
+    assert ispred4.poll(page_text=page_text) is None
+
+
 def test_retrieve_prediction_link(ispred4):
     page_text = (
         "https://ispred4.biocomp.unibo.it/ispred/default/"
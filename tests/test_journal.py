@@ -0,0 +1,156 @@
+"""Test the job journal."""
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from cport.modules.journal import JobJournal
+from cport.modules.polling import LatencyHistory, PollPolicy
+from cport.modules.scheduler import (
+    COLLECT,
+    DONE,
+    POLL,
+    PollScheduler,
+    PredictionJob,
+)
+
+
+PDB_FILE = "tests/test_data/1PPE.pdb"
+
+
+class FakePredictor:
+    def __init__(self, history=None):
+        self.policy = PollPolicy(
+            "fake",
+            interval=0,
+            deadline=5,
+            pdb_file=PDB_FILE if history is not None else None,
+            chain_id="I",
+            history=history,
+        )
+        self.submitted = False
+
+    def submit(self):
+        self.submitted = True
+        return {"job_id": "abc"}
+
+    def poll(self, handle):
+        return f"http://results/{handle['job_id']}"
+
+    def collect(self, link):
+        return {"active": [], "passive": [], "link": link}
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return Path(tmp_path, "journal.jsonl")
+
+
+def test_record_and_resume(journal_path):
+    journal = JobJournal(journal_path)
+    job = PredictionJob("csm_potential", FakePredictor(), key="1PPE:E:csm_potential")
+    job.state = POLL
+    job.handle = {"job_id": "abc"}
+    journal.record(job)
+    journal.close()
+
+    reopened = JobJournal(journal_path)
+    new_job = PredictionJob("csm_potential", FakePredictor(), key=job.key)
+
+    assert [entry["key"] for entry in reopened.outstanding()] == [job.key]
+    assert reopened.resume(new_job)
+    assert new_job.state == POLL
+    assert new_job.handle == {"job_id": "abc"}
+    reopened.close()
+
+
+def test_finished_jobs_are_dropped(journal_path):
+    journal = JobJournal(journal_path)
+    job = PredictionJob("scriber", FakePredictor(), key="1PPE:E:scriber")
+    job.state = COLLECT
+    job.link = "http://results.csv"
+    journal.record(job)
+    job.state = DONE
+    journal.record(job)
+    journal.close()
+
+    reopened = JobJournal(journal_path)
+
+    assert reopened.outstanding() == []
+    assert not reopened.resume(PredictionJob("scriber", FakePredictor(), key=job.key))
+    assert journal_path.read_text() == ""
+    reopened.close()
+
+
+def test_corrupted_line(journal_path):
+    journal_path.write_text(
+        '{"key": "k", "name": "scriber", "state": "poll", "handle": "h", '
+        '"link": null, "time": 0}\n{"key": "trunc'
+    )
+
+    assert list(JobJournal.load(journal_path)) == ["k"]
+
+
+def test_scheduler_resumes_from_journal(journal_path):
+    journal = JobJournal(journal_path)
+    job = PredictionJob("csm_potential", FakePredictor(), key="1PPE:E:csm_potential")
+    job.state = POLL
+    job.handle = {"job_id": "abc"}
+    journal.record(job)
+
+    predictor = FakePredictor()
+    scheduler = PollScheduler(journal=journal)
+    scheduler.add(PredictionJob("csm_potential", predictor, key=job.key))
+    (resumed,) = scheduler.run()
+    journal.close()
+
+    assert not predictor.submitted
+    assert resumed.state == DONE
+    assert resumed.result["link"] == "http://results/abc"
+    assert JobJournal.load(journal_path)[job.key]["state"] == DONE
+
+
+def test_resumed_latency(journal_path, tmp_path):
+    history = LatencyHistory(tmp_path / "latency.json")
+    journal = JobJournal(journal_path)
+    job = PredictionJob("csm_potential", FakePredictor(), key="1PPE:I:csm_potential")
+    job.state = POLL
+    job.handle = {"job_id": "abc"}
+    journal.record(job)
+    job.state = COLLECT
+    job.link = "http://results/abc"
+    journal.record(job)
+    journal.close()
+    # submitted by a previous run, 100 seconds ago
+    entry = JobJournal.load(journal_path)[job.key]
+    assert entry["submitted"] <= entry["time"]
+    entry.update(state=POLL, link=None, submitted=time.time() - 100)
+    journal_path.write_text(json.dumps(entry) + "\n")
+
+    journal = JobJournal(journal_path)
+    scheduler = PollScheduler(journal=journal)
+    scheduler.add(PredictionJob("csm_potential", FakePredictor(history), key=job.key))
+    (resumed,) = scheduler.run()
+    journal.close()
+
+    assert resumed.state == DONE
+    # the latency runs from the submission, not from the first poll
+    assert history.estimate("fake", 29) == pytest.approx(100, abs=5)
+
+
+def test_resumed_unknown_submission(journal_path, tmp_path):
+    history = LatencyHistory(tmp_path / "latency.json")
+    # written before the submission time was kept, and past the polling
+    journal_path.write_text(
+        '{"key": "k", "name": "fake", "state": "collect", "handle": "h", '
+        '"link": "http://results/h", "time": 0}\n'
+    )
+
+    journal = JobJournal(journal_path)
+    job = PredictionJob("fake", FakePredictor(history), key="k")
+    assert journal.resume(job)
+    journal.close()
+    job.policy.finish()
+
+    assert history.estimate("fake", 29) is None
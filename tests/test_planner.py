@@ -0,0 +1,134 @@
+"""Test the planner of the ML models."""
+import time
+from pathlib import Path
+
+from cport.modules import batch, planner
+from cport.modules.batch import run_entries
+from cport.modules.planner import Planner, minimal_predictors
+from cport.modules.polling import PollPolicy
+
+PDB_FILE = Path(Path(__file__).parent, "test_data", "1PPE.pdb")
+
+
+def model_a(prediction_csv, output_dir="output"):
+    """Fake model."""
+
+
+def model_b(prediction_csv, output_dir="output"):
+    """Fake model."""
+
+
+MODELS = {
+    model_a: {"needed": ["scriber", "ispred4"]},
+    model_b: {"needed": ["scriber", "sppider"]},
+}
+
+
+class FakePredictor:
+    def __init__(self, name, pdb_file, chain_id, polls_needed=1):
+        self.name = name
+        self.polls = 0
+        self.polls_needed = polls_needed
+        self.policy = PollPolicy("fake", interval=0, deadline=60)
+
+    def submit(self):
+        if self.name == "ispred4":
+            raise ValueError("server error")
+        return self.name
+
+    def poll(self, handle):
+        self.polls += 1
+        return handle if self.polls >= self.polls_needed else None
+
+    def collect(self, link):
+        return {"active": [[1, 0.9]], "passive": [], "name": link}
+
+
+def test_minimal_predictors():
+    order = ["scriber", "sppider", "scannet", "ispred4"]
+
+    assert minimal_predictors(MODELS, order) == ["scriber", "sppider", "ispred4"]
+    assert minimal_predictors({model_a: MODELS[model_a]}, order) == [
+        "scriber",
+        "ispred4",
+    ]
+
+
+def test_planner(monkeypatch):
+    runs = []
+    monkeypatch.setattr(
+        planner,
+        "run_model",
+        lambda model, result_dic, *args: runs.append((model, list(result_dic))),
+    )
+    entry = {"pdb_file": PDB_FILE, "chain_id": "E", "pred": ["scriber", "sppider"]}
+    plan = Planner(MODELS, keep_predictors=False)
+
+    plan.add(0, entry)
+    # model_a needs ispred4, which is not run
+    assert not plan.needs(0, "ispred4")
+    assert plan.needs(0, "sppider")
+
+    plan.update(0, "sppider", {"active": [], "passive": []})
+    assert runs == []
+    plan.update(0, "scriber", {"active": [], "passive": []})
+    plan.finish()
+
+    # the features follow the order of the predictors of the entry
+    assert runs == [(model_b, ["scriber", "sppider"])]
+
+
+def test_run_entries_early_model(monkeypatch):
+    runs = []
+
+    def run_model(model, result_dic, pdb_file, chain_id, output_dir, context=None):
+        runs.append((model, sorted(result_dic), time.monotonic()))
+
+    def load_predictor(prediction_method, **kwargs):
+        polls = 10**9 if prediction_method == "scannet" else 1
+        return FakePredictor(
+            prediction_method, kwargs["pdb_file"], kwargs["chain_id"], polls
+        )
+
+    monkeypatch.setattr(planner, "run_model", run_model)
+    monkeypatch.setattr(batch, "load_predictor", load_predictor)
+    models = dict(MODELS)
+    models[model_a] = {"needed": ["scriber", "ispred4", "scannet"]}
+    entries = [
+        {
+            "pdb_file": PDB_FILE,
+            "chain_id": "E",
+            "pred": ["scriber", "sppider", "ispred4", "scannet"],
+        }
+    ]
+
+    start = time.monotonic()
+    ((_, result_dic),) = run_entries(
+        entries, planner=Planner(models, keep_predictors=False)
+    )
+
+    # model_b ran as soon as its predictors finished, ispred4 failed so
+    # nothing needs scannet anymore and it was cancelled
+    assert [(model, names) for model, names, _ in runs] == [
+        (model_b, ["scriber", "sppider"])
+    ]
+    assert time.monotonic() - start < 5
+    assert list(result_dic) == ["scriber", "sppider"]
+
+
+def test_run_entries_keep_predictors(monkeypatch):
+    def load_predictor(prediction_method, **kwargs):
+        return FakePredictor(prediction_method, kwargs["pdb_file"], kwargs["chain_id"])
+
+    monkeypatch.setattr(planner, "run_model", lambda *args: None)
+    monkeypatch.setattr(batch, "load_predictor", load_predictor)
+    entries = [
+        {"pdb_file": PDB_FILE, "chain_id": "E", "pred": ["scriber", "ispred4"]},
+        {"pdb_file": PDB_FILE, "chain_id": "I", "pred": ["scannet"]},
+    ]
+
+    results = run_entries(entries, planner=Planner(MODELS))
+
+    # the predictors table needs every predictor, nothing is cancelled
+    assert list(results[0][1]) == ["scriber"]
+    assert list(results[1][1]) == ["scannet"]
@@ -0,0 +1,111 @@
+"""Test the adaptive polling policy."""
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from cport.exceptions import JobCancelledException
+from cport.modules import polling
+from cport.modules.polling import CancelToken, LatencyHistory, PollPolicy, chain_length
+
+PDB_FILE = Path(Path(__file__).parent, "test_data", "1PPE.pdb")
+
+
+@pytest.fixture
+def history(tmp_path):
+    return LatencyHistory(Path(tmp_path, "latency.json"))
+
+
+def test_chain_length():
+    assert chain_length(PDB_FILE, "I") == 29
+    assert chain_length(PDB_FILE, "Z") is None
+
+
+def test_backoff(history, monkeypatch):
+    monkeypatch.setattr(polling, "JITTER", 0)
+    policy = PollPolicy("fake", interval=40, deadline=3600, history=history)
+
+    assert policy.start() == 0.0
+    delays = [policy.next_delay() for _ in range(6)]
+
+    assert delays == [10.0, 15.0, 22.5, 33.75, 50.625, 75.9375]
+    assert policy.next_delay() == 80.0
+
+
+def test_jitter(history):
+    policy = PollPolicy("fake", interval=40, deadline=3600, history=history)
+    policy.start()
+
+    delays = {policy.next_delay() for _ in range(20)}
+
+    assert len(delays) > 1
+    assert all(8.0 <= delay <= 96.0 for delay in delays)
+
+
+def test_deadline(history):
+    policy = PollPolicy("fake", interval=40, deadline=0.2, history=history)
+    policy.start()
+
+    assert not policy.expired()
+    assert policy.next_delay() <= 0.2
+    time.sleep(0.2)
+    assert policy.expired()
+    assert policy.next_delay() == 0.0
+
+
+def test_first_poll_from_history(history):
+    policy = PollPolicy(
+        "fake",
+        interval=40,
+        deadline=3600,
+        pdb_file=PDB_FILE,
+        chain_id="I",
+        history=history,
+    )
+    history.record("fake", 29, 290.0)
+
+    assert policy.start() == pytest.approx(232.0)
+
+
+def test_history(history):
+    assert history.estimate("fake", 100) is None
+
+    history.record("fake", 100, 100.0)
+    history.record("fake", 100, 200.0)
+
+    # running average, the newest job weighs LATENCY_SMOOTHING
+    assert history.estimate("fake", 100) == pytest.approx(130.0)
+    assert LatencyHistory(history.path).estimate("fake", 10) == pytest.approx(13.0)
+
+
+def test_finish(history):
+    policy = PollPolicy(
+        "fake",
+        interval=40,
+        deadline=3600,
+        pdb_file=PDB_FILE,
+        chain_id="I",
+        history=history,
+    )
+    policy.finish()
+    assert history.estimate("fake", 29) is None
+
+    policy.start()
+    policy.finish()
+    assert history.estimate("fake", 29) < 1.0
+
+
+def test_cancel_token():
+    token = CancelToken()
+    token.check()
+    threading.Timer(0.1, token.cancel).start()
+
+    start = time.monotonic()
+    with pytest.raises(JobCancelledException):
+        token.wait(10)
+
+    assert time.monotonic() - start < 1
+    assert token.cancelled
+    with pytest.raises(JobCancelledException):
+        token.check()
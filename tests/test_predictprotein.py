@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pytest
 
+from cport.modules.pipeline import process_pool
 from cport.modules.predictprotein_api import Predictprotein
 
 
@@ -34,6 +35,19 @@ def test_parse_prediction(predictprotein, precalc_result):
     assert len(observed_result_dic["passive"]) == 194
 
 
+def test_parse_in_process(predictprotein, precalc_result):
+    pool = process_pool(1)
+
+    # the results come with the answer of the poll
+    prediction = predictprotein.fetch(precalc_result.read_text())
+    observed_result_dic = pool.submit(Predictprotein.parse, prediction).result()
+    pool.shutdown()
+
+    assert observed_result_dic == predictprotein.parse_prediction(
+        test_file=precalc_result
+    )
+
+
 @pytest.mark.skip("Overlaps with previous")
 def test_run():
     pass
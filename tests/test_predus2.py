@@ -1,8 +1,10 @@
 # Test if the predus2 prediction is working
+import shutil
 from pathlib import Path
 
 import pytest
 
+from cport.modules.pipeline import process_pool
 from cport.modules.predus2 import Predus2
 
 
@@ -43,6 +45,19 @@ def test_parse_prediction(predus2, precalc_result):
     assert len(observed_result_dic["passive"]) == 193
 
 
+def test_parse_in_process(predus2, precalc_result, tmp_path):
+    result_file = Path(tmp_path, "result.txt")
+    shutil.copy(precalc_result, result_file)
+    pool = process_pool(1)
+
+    observed_result_dic = pool.submit(Predus2.parse, str(result_file)).result()
+    pool.shutdown()
+
+    assert observed_result_dic == predus2.parse_prediction(test_file=precalc_result)
+    # the downloaded file is removed once parsed
+    assert not result_file.exists()
+
+
 @pytest.mark.skip("Overlaps with previous")
 def test_run():
     pass
@@ -1,9 +1,12 @@
 """Test if the meta_ppisp prediction is working."""
 
+import gzip
+import shutil
 from pathlib import Path
 
 import pytest
 
+from cport.modules.pipeline import process_pool
 from cport.modules.psiver import Psiver
 
 
@@ -47,6 +50,20 @@ def test_parse_prediction(psiver, precalc_result):
     assert len(observed_result_dic["passive"]) == 58
 
 
+def test_parse_in_process(psiver, precalc_result, tmp_path):
+    # the server sends the results compressed
+    result_file = Path(tmp_path, "result.gz")
+    with open(precalc_result, "rb") as source, gzip.open(result_file, "wb") as target:
+        shutil.copyfileobj(source, target)
+    pool = process_pool(1)
+
+    observed_result_dic = pool.submit(Psiver.parse, str(result_file)).result()
+    pool.shutdown()
+
+    assert observed_result_dic == psiver.parse_prediction(test_file=precalc_result)
+    assert not result_file.exists()
+
+
 @pytest.mark.skip("PSIVER offline")
 def test_run():
     pass
@@ -0,0 +1,112 @@
+"""Test the registry of the ML models."""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from cport.modules import registry as registry_module
+from cport.modules.engine import DenseNetwork
+from cport.modules.registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, path):
+        self.path = path
+
+    def predict(self, features):
+        return [value * 2 for value in features]
+
+
+@pytest.fixture
+def loads():
+    return []
+
+
+@pytest.fixture
+def registry(tmp_path, loads):
+    for name in ("model_a", "model_b"):
+        (tmp_path / name).mkdir()
+
+    def loader(path):
+        loads.append(path.name)
+        time.sleep(0.05)
+        return FakeModel(path)
+
+    return ModelRegistry(model_dir=tmp_path, loader=loader)
+
+
+def test_loaded_once(registry, loads):
+    assert registry.predict("model_a", [1, 2]) == [2, 4]
+    assert registry.predict("model_a", [3]) == [6]
+
+    assert loads == ["model_a"]
+    stats = registry.stats()["model_a"]
+    assert stats["loads"] == 1
+    assert stats["calls"] == 2
+    assert stats["load_seconds"] >= 0.05
+
+
+def test_concurrent_loads(registry, loads):
+    models = []
+    threads = [
+        threading.Thread(target=lambda: models.append(registry.get("model_b")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ["model_b"]
+    assert all(model is models[0] for model in models)
+
+
+def test_warm_up(registry, loads):
+    registry.warm_up()
+
+    assert sorted(loads) == ["model_a", "model_b"]
+    registry.predict("model_a", [1])
+    assert sorted(loads) == ["model_a", "model_b"]
+
+
+def test_warm_up_failure(tmp_path):
+    def loader(path):
+        raise OSError("no model")
+
+    registry = ModelRegistry(model_dir=tmp_path, loader=loader)
+    registry.warm_up(["missing"])
+
+    with pytest.raises(OSError):
+        registry.get("missing")
+
+
+def test_configured_warm_up(registry, loads, monkeypatch):
+    monkeypatch.setattr(registry_module, "REGISTRY", registry)
+
+    registry_module.warm_up()
+    assert loads == []
+
+    monkeypatch.setattr(registry_module, "WARM_MODELS", "model_b, model_a")
+    registry_module.warm_up()
+    assert loads == ["model_b", "model_a"]
+
+
+def test_numpy_engine(tmp_path, monkeypatch):
+    network = DenseNetwork([(np.ones((2, 1)), np.zeros(1), "linear")])
+    network.save(tmp_path / "model_c.npz")
+    (tmp_path / "model_d").mkdir()
+    keras_loads = []
+    monkeypatch.setattr(registry_module, "load_keras_model", keras_loads.append)
+
+    registry = ModelRegistry(model_dir=tmp_path)
+
+    assert registry.available() == ["model_c", "model_d"]
+    assert registry.predict("model_c", [[1.0, 2.0]]).tolist() == [[3.0]]
+    registry.get("model_d")
+    assert keras_loads == [tmp_path / "model_d"]
+
+    monkeypatch.setattr(registry_module, "MODEL_ENGINE", "keras")
+    registry.clear()
+    registry.get("model_c")
+    assert keras_loads == [tmp_path / "model_d", tmp_path / "model_c"]
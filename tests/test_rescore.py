@@ -0,0 +1,156 @@
+"""Test the rescoring of the predictors tables."""
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cport.modules import rescore as rescore_module
+from cport.modules.predict import (
+    format_predictions,
+    read_pred,
+    scriber_ispred4_scannet_sppider,
+)
+from cport.modules.registry import ModelRegistry
+from cport.modules.rescore import (
+    Rescorer,
+    find_tables,
+    read_features,
+    rescore_tables,
+    split_csv,
+)
+
+DATA_DIR = Path(__file__).parents[1] / "tests/test_data"
+PREDICTORS = ["scriber", "sppider", "scannet", "ispred4"]
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, features, **kwargs):
+        self.calls.append(len(features))
+        return np.asarray(features, dtype=np.float32).mean(axis=1, keepdims=True)
+
+
+@pytest.fixture
+def model(monkeypatch, tmp_path):
+    fake = FakeModel()
+    registry = ModelRegistry(model_dir=tmp_path, loader=lambda path: fake)
+    monkeypatch.setattr(rescore_module, "REGISTRY", registry)
+    return fake
+
+
+@pytest.fixture
+def tables(tmp_path):
+    paths = []
+    for name in ("1PPE", "2OOB", "3CPH"):
+        path = tmp_path / "runs" / name / f"predictors_{name}.csv"
+        path.parent.mkdir(parents=True)
+        shutil.copy(DATA_DIR / "predictors_1PPE.csv", path)
+        paths.append(path)
+    return paths
+
+
+def test_read_features(tmp_path):
+    path = tmp_path / "predictors_test.csv"
+    path.write_text(
+        "predictor,1,2,3,4,5,6\n"
+        "ispred4,P,P,AP,0,-,1.7\n"
+        "scriber,A,-,0.25,P,AP,0.1\n"
+    )
+
+    residues, features = read_features(path, ["scriber", "ispred4"])
+
+    expected = format_predictions(read_pred(path))
+    assert residues.tolist() == [int(item) for item in expected["predictor"]]
+    assert features[:, 0].tolist() == expected["scriber"]
+    assert features[:, 1].tolist() == expected["ispred4"]
+
+    with pytest.raises(KeyError):
+        read_features(path, ["scannet"])
+
+
+def test_split_csv():
+    out_csv = pd.DataFrame(
+        {"residue": [1, 2, 3, 7, 8], "score": [0.5, 0.25, 1.0, 0.0, 0.1]}
+    )
+
+    texts = split_csv(out_csv, [3, 2])
+
+    assert texts[0] == out_csv.iloc[:3].to_csv()
+    assert texts[1] == out_csv.iloc[3:].reset_index(drop=True).to_csv()
+
+
+def test_batches(model, tables):
+    rescorer = Rescorer(
+        "scriber_ispred4_scannet_sppider", PREDICTORS, batch_residues=1500
+    )
+
+    batches = list(rescorer.rescore(tables))
+
+    # the tables are read until the batch is full
+    assert [paths for paths, _, _ in batches] == [tables[:2], tables[2:]]
+    assert model.calls == [1968, 984]
+    assert rescorer.stats == {
+        "tables": 3,
+        "skipped": 0,
+        "residues": 2952,
+        "batches": 2,
+    }
+
+
+def test_skipped(model, tables, tmp_path):
+    broken = tmp_path / "predictors_broken.csv"
+    broken.write_text("predictor,1,2\nscriber,A,P\n")
+
+    stats = rescore_tables(
+        [tables[0], broken, tmp_path / "missing.csv"],
+        "scriber_ispred4_scannet_sppider",
+        PREDICTORS,
+    )
+
+    assert stats["tables"] == 1
+    assert stats["skipped"] == 2
+
+
+def test_output_dir(model, tables, tmp_path):
+    rescore_tables(
+        find_tables([tmp_path / "runs"]),
+        "scriber_ispred4_scannet_sppider",
+        PREDICTORS,
+        output_dir=tmp_path / "rescored",
+    )
+
+    for path in tables:
+        assert Path(
+            tmp_path,
+            "rescored",
+            path.parent.name,
+            "cport_ML_scriber_ispred4_scannet_sppider.csv",
+        ).exists()
+        assert not Path(
+            path.parent, "cport_ML_scriber_ispred4_scannet_sppider.csv"
+        ).exists()
+
+
+def test_same_as_predict(tables, tmp_path):
+    # the real model, the rescored tables are the ones of a run
+    rescore_tables(
+        tables, "scriber_ispred4_scannet_sppider", PREDICTORS, batch_residues=2000
+    )
+    scriber_ispred4_scannet_sppider(tables[0], output_dir=tmp_path / "expected")
+
+    expected = pd.read_csv(
+        tmp_path / "expected" / "cport_ML_scriber_ispred4_scannet_sppider.csv"
+    )
+    for path in tables:
+        observed = pd.read_csv(
+            path.parent / "cport_ML_scriber_ispred4_scannet_sppider.csv"
+        )
+        assert observed.columns.tolist() == expected.columns.tolist()
+        assert (observed["residue"] == expected["residue"]).all()
+        assert (observed["threshold_pred"] == expected["threshold_pred"]).all()
+        assert (observed["mean_scores"] == expected["mean_scores"]).all()
+        assert np.allclose(observed["cport_scores"], expected["cport_scores"])
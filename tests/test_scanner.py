@@ -0,0 +1,91 @@
+"""Test the scanner of the PDB records."""
+import warnings
+
+import numpy as np
+import pytest
+from Bio import PDB
+
+from cport.modules.scanner import (
+    chain_records,
+    parse_atoms,
+    residue_bounds,
+    scan_chain,
+)
+
+PDB_FILE = "tests/test_data/1PPE.pdb"
+
+
+@pytest.fixture(scope="module")
+def structure():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return PDB.PDBParser().get_structure("pdb", PDB_FILE)
+
+
+@pytest.mark.parametrize("chain_id", ["E", "I"])
+def test_against_biopython(structure, chain_id):
+    chain = structure[0][chain_id]
+
+    atoms, _ = scan_chain(PDB_FILE, chain_id)
+    first, last = residue_bounds(atoms)
+
+    expected = list(chain.get_atoms())
+    assert len(atoms) == len(expected)
+    assert atoms["name"].astype(str).tolist() == [
+        atom.get_fullname() for atom in expected
+    ]
+    assert np.allclose(atoms["bfactor"], [atom.get_bfactor() for atom in expected])
+
+    residues = list(chain)
+    assert len(first) == len(residues)
+    assert [
+        (bool(atoms["het"][item]), int(atoms["resseq"][item]), atoms["icode"][item])
+        for item in first
+    ] == [
+        (hetflag != " ", number, icode.strip().encode())
+        for hetflag, number, icode in (residue.get_id() for residue in residues)
+    ]
+    assert atoms["resname"][first].astype(str).tolist() == [
+        residue.get_resname() for residue in residues
+    ]
+    assert (last - first + 1).tolist() == [len(residue) for residue in residues]
+
+
+def test_mmap():
+    atoms, lines = scan_chain(PDB_FILE, "I", use_mmap=True)
+
+    with open(PDB_FILE, "rb") as handle:
+        expected_atoms, expected_lines = scan_chain(handle.read(), "I")
+
+    assert lines == expected_lines
+    assert (atoms == expected_atoms).all()
+
+
+def test_first_model():
+    content = (
+        b"MODEL        1\n"
+        b"ATOM      1  CA  ALA A   1       0.000   0.000   0.000  1.00 10.00\n"
+        b"ATOM      2  CA  GLY B   1       0.000   0.000   0.000  1.00 20.00\n"
+        b"TER       3      GLY B   1\n"
+        b"ENDMDL\n"
+        b"MODEL        2\n"
+        b"ATOM      1  CA  ALA A   1       0.000   0.000   0.000  1.00 30.00\n"
+        b"ENDMDL\n"
+    )
+
+    assert chain_records(content, "B") == [
+        b"ATOM      2  CA  GLY B   1       0.000   0.000   0.000  1.00 20.00",
+        b"TER       3      GLY B   1",
+    ]
+    atoms, _ = scan_chain(content, "A")
+    assert atoms["bfactor"].tolist() == [10.0]
+
+
+def test_short_lines():
+    atoms = parse_atoms([b"HETATM    1  O   HOH A  12A      0.000   0.000   0.000"])
+
+    assert atoms["het"].tolist() == [True]
+    assert atoms["resname"].tolist() == [b"HOH"]
+    assert atoms["resseq"].tolist() == [12]
+    assert atoms["icode"].tolist() == [b"A"]
+    assert atoms["bfactor"].tolist() == [0.0]
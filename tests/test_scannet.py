@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pytest
 
+from cport.modules.pipeline import process_pool
 from cport.modules.scannet import ScanNet
 
 
@@ -44,6 +45,21 @@ def test_parse_prediction(scannet, precalc_result):
     assert len(observed_result_dic["passive"]) == 204
 
 
+def test_parse_in_process(scannet, precalc_result):
+    # the page holds the PDB file in a variable
+    page = (
+        b"<script>var stringContainingTheWholePdbFile = `"
+        + precalc_result.read_bytes()
+        + b"`;</script>"
+    )
+    pool = process_pool(1)
+
+    observed_result_dic = pool.submit(ScanNet.parse, ("A", page)).result()
+    pool.shutdown()
+
+    assert observed_result_dic == scannet.parse_prediction(test_file=precalc_result)
+
+
 @pytest.mark.skip("Overlaps with previous")
 def test_run():
     pass
@@ -0,0 +1,254 @@
+"""Test the poll scheduler."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from cport.exceptions import (
+    DeadlineException,
+    JobCancelledException,
+    ServerConnectionException,
+)
+from cport.modules.journal import JobJournal
+from cport.modules.polling import PollPolicy
+from cport.modules.scheduler import DONE, FAILED, PollScheduler, PredictionJob
+
+
+class FakePredictor:
+    """Predictor that finishes after a number of polls."""
+
+    def __init__(self, polls_needed, deadline=5):
+        self.polls_needed = polls_needed
+        self.polls = 0
+        self.policy = PollPolicy("fake", interval=0, deadline=deadline)
+
+    def submit(self):
+        return "handle"
+
+    def poll(self, handle):
+        assert handle == "handle"
+        self.polls += 1
+        if self.polls >= self.polls_needed:
+            return "link"
+        return None
+
+    def collect(self, link):
+        return {"active": [[1, 0.9]], "passive": [[2, 0.1]], "link": link}
+
+
+class BrokenPredictor(FakePredictor):
+    def submit(self):
+        raise ServerConnectionException("submission failed")
+
+
+@pytest.fixture
+def scheduler():
+    return PollScheduler(num_workers=2)
+
+
+def test_run(scheduler):
+    scheduler.add(PredictionJob("fast", FakePredictor(1)))
+    scheduler.add(PredictionJob("slow", FakePredictor(3)))
+
+    jobs = scheduler.run()
+
+    assert [job.name for job in jobs] == ["fast", "slow"]
+    assert all(job.state == DONE for job in jobs)
+    assert jobs[1].predictor.polls == 3
+    assert jobs[1].result["link"] == "link"
+
+
+def test_run_many_jobs(scheduler):
+    for index in range(500):
+        scheduler.add(PredictionJob("fake", FakePredictor(2), key=index))
+
+    jobs = scheduler.run()
+
+    assert len(jobs) == 500
+    assert all(job.state == DONE for job in jobs)
+
+
+def test_run_no_response(scheduler):
+    scheduler.add(PredictionJob("never", FakePredictor(10, deadline=0)))
+
+    (job,) = scheduler.run()
+
+    assert job.state == FAILED
+    assert isinstance(job.error, ServerConnectionException)
+    assert job.predictor.polls == 1
+
+
+def test_run_failed_submission(scheduler):
+    scheduler.add(PredictionJob("broken", BrokenPredictor(1)))
+    scheduler.add(PredictionJob("fine", FakePredictor(1)))
+
+    broken, fine = scheduler.run()
+
+    assert broken.state == FAILED
+    assert str(broken.error) == "submission failed"
+    assert fine.state == DONE
+
+
+def test_run_limits():
+    inflight = {"count": 0, "max": 0}
+
+    class CountingPredictor(FakePredictor):
+        def submit(self):
+            inflight["count"] += 1
+            inflight["max"] = max(inflight["max"], inflight["count"])
+            return super().submit()
+
+        def collect(self, link):
+            inflight["count"] -= 1
+            return super().collect(link)
+
+    scheduler = PollScheduler(num_workers=4, limits={"limited": 2})
+    for index in range(10):
+        scheduler.add(PredictionJob("limited", CountingPredictor(2), key=index))
+
+    jobs = scheduler.run()
+
+    assert all(job.state == DONE for job in jobs)
+    assert inflight["max"] == 2
+
+
+def test_run_watchdog(scheduler):
+    class StuckPredictor(FakePredictor):
+        def poll(self, handle):
+            time.sleep(2)
+            return super().poll(handle)
+
+    scheduler.add(PredictionJob("stuck", StuckPredictor(1), budget=0.2))
+    scheduler.add(PredictionJob("fine", FakePredictor(1)))
+
+    start = time.monotonic()
+    stuck, fine = scheduler.run()
+
+    assert time.monotonic() - start < 1.5
+    assert stuck.state == FAILED
+    assert isinstance(stuck.error, ServerConnectionException)
+    assert fine.state == DONE
+
+
+def test_run_deadline(tmp_path):
+    journal = JobJournal(Path(tmp_path, "journal.jsonl"))
+    scheduler = PollScheduler(journal=journal, deadline=time.monotonic() + 0.3)
+    scheduler.add(PredictionJob("fast", FakePredictor(1)))
+    scheduler.add(PredictionJob("never", FakePredictor(10**9, deadline=60)))
+
+    start = time.monotonic()
+    fast, never = scheduler.run()
+    journal.close()
+
+    assert time.monotonic() - start < 1.5
+    assert fast.state == DONE
+    assert never.state == FAILED
+    assert isinstance(never.error, DeadlineException)
+    # the abandoned job can still be resumed by the next run
+    assert sorted(
+        entry["key"] for entry in JobJournal.load(journal.path).values()
+    ) == ["fast", "never"]
+    assert JobJournal(journal.path).outstanding()[0]["key"] == "never"
+
+
+def test_run_cancel():
+    finished = []
+    scheduler = PollScheduler(num_workers=2)
+
+    def on_finish(job):
+        finished.append(job.key)
+        # the first job to finish makes the other one useless
+        scheduler.cancel(never)
+
+    scheduler.on_finish = on_finish
+    scheduler.add(PredictionJob("fast", FakePredictor(1)))
+    never = PredictionJob("never", FakePredictor(10**9, deadline=60))
+    scheduler.add(never)
+
+    start = time.monotonic()
+    fast, never = scheduler.run()
+
+    assert time.monotonic() - start < 1.5
+    assert fast.state == DONE
+    assert never.state == FAILED
+    assert isinstance(never.error, JobCancelledException)
+    assert finished == ["fast"]
+
+
+def test_cancel_parked():
+    scheduler = PollScheduler(num_workers=2, limits={"limited": 1})
+    jobs = [
+        PredictionJob("limited", FakePredictor(2), key=index) for index in range(3)
+    ]
+    for job in jobs:
+        scheduler.add(job)
+    scheduler.on_finish = lambda job: scheduler.cancel(jobs[1])
+
+    first, cancelled, last = scheduler.run()
+
+    assert first.state == DONE
+    assert isinstance(cancelled.error, JobCancelledException)
+    # the slot freed by the first job goes to the next job still waiting
+    assert last.state == DONE
+
+
+def test_cancel_running_step():
+    stopped = threading.Event()
+
+    class LoopingPredictor(FakePredictor):
+        def submit(self):
+            # a submission polling the server on its own, like PredictProtein
+            try:
+                while True:
+                    self.policy.wait(0.05)
+            finally:
+                stopped.set()
+
+    scheduler = PollScheduler(num_workers=2)
+    looping = PredictionJob("looping", LoopingPredictor(1))
+    scheduler.on_finish = lambda job: scheduler.cancel(looping)
+    scheduler.add(looping)
+    scheduler.add(PredictionJob("fast", FakePredictor(1)), delay=0.1)
+
+    looping, fast = scheduler.run()
+
+    # the worker thread stops within one poll tick
+    assert stopped.wait(1)
+    assert isinstance(looping.error, JobCancelledException)
+    assert fast.state == DONE
+
+
+def test_run_staged():
+    parsing = {"count": 0, "max": 0}
+    lock = threading.Lock()
+
+    class StagedPredictor(FakePredictor):
+        def fetch(self, link):
+            return {"active": [[1, 0.9]], "passive": [], "link": link}
+
+        @staticmethod
+        def parse(payload):
+            with lock:
+                parsing["count"] += 1
+                parsing["max"] = max(parsing["max"], parsing["count"])
+            time.sleep(0.05)
+            with lock:
+                parsing["count"] -= 1
+            return dict(payload, parsed=True)
+
+    parser = ThreadPoolExecutor(max_workers=4)
+    scheduler = PollScheduler(num_workers=4, parser=parser, max_parsing=2)
+    for index in range(8):
+        scheduler.add(PredictionJob("staged", StagedPredictor(1), key=index))
+    scheduler.add(PredictionJob("plain", FakePredictor(1)))
+
+    jobs = scheduler.run()
+    parser.shutdown()
+
+    assert all(job.state == DONE for job in jobs)
+    assert all(job.result["parsed"] for job in jobs[:8])
+    assert jobs[8].result["link"] == "link"
+    # no more than max_parsing results wait for the parser
+    assert parsing["max"] <= 2
@@ -1,8 +1,10 @@
 # Test if the scriber prediction is working
+import shutil
 from pathlib import Path
 
 import pytest
 
+from cport.modules.pipeline import process_pool
 from cport.modules.scriber import Scriber
 
 
@@ -21,6 +23,13 @@ def test_submit(scriber):
     assert isinstance(summary_url, str)
 
 
+def test_poll(scriber):
+    assert scriber.poll(page_text="still running") is None
+    assert scriber.poll(page_text="http://thisisthetest.csv") == (
+        "http://thisisthetest.csv"
+    )
+
+
 def test_retrieve_prediction_link(scriber):
     page_text = "http://thisisthetest.csv"
     observed_link = scriber.retrieve_prediction_link(page_text=page_text)
@@ -43,6 +52,19 @@ def test_parse_prediction(scriber, precalc_result):
     assert len(observed_result_dic["passive"]) == 219
 
 
+def test_parse_in_process(precalc_result, tmp_path):
+    result_file = Path(tmp_path, "result.csv")
+    shutil.copy(precalc_result, result_file)
+    pool = process_pool(1)
+
+    observed_result_dic = pool.submit(Scriber.parse, str(result_file)).result()
+    pool.shutdown()
+
+    assert observed_result_dic == Scriber.parse_prediction(precalc_result)
+    # the downloaded file is removed once parsed
+    assert not result_file.exists()
+
+
 @pytest.mark.skip("Overlaps with previous")
 def test_run():
     pass
@@ -0,0 +1,242 @@
+"""Test the pooled HTTP sessions."""
+import base64
+import gzip
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from cport.exceptions import JobCancelledException, ServerConnectionException
+from cport.modules.polling import CancelToken
+from cport.modules import session as session_module
+from cport.modules.session import SessionPool, TimeoutSession, download, fetch_page
+
+BODY = b"<html><body><a href='results.csv'>results</a></body></html>"
+LARGE_BODY = bytes(range(256)) * 1024
+# hardly compressible, so half of its encoding is half of the transfer
+RANDOM_BODY = b"".join(
+    hashlib.sha256(str(item).encode()).digest() for item in range(8192)
+)
+GZIP_BODY = gzip.compress(RANDOM_BODY, mtime=0)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the Range or If-None-Match headers of the requests
+    request_headers = []
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(1)
+        if self.path == "/flaky":
+            self.send_flaky()
+            return
+        if self.path in ("/gzip", "/gzip-always"):
+            self.send_gzip(honour_identity=self.path == "/gzip")
+            return
+        if self.path == "/status":
+            self.request_headers.append(self.headers.get("If-None-Match"))
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.send_header("ETag", '"v1"')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(BODY)
+            return
+        if self.path == "/corrupt":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.send_header(
+                "Digest", "sha-256=" + base64.b64encode(b"0" * 32).decode()
+            )
+            self.end_headers()
+            self.wfile.write(BODY)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def send_flaky(self):
+        self.request_headers.append(self.headers.get("Range"))
+        if self.headers.get("Range") is None:
+            # the connection drops halfway through the body
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(LARGE_BODY)))
+            digest = hashlib.sha256(LARGE_BODY).digest()
+            self.send_header("Digest", "sha-256=" + base64.b64encode(digest).decode())
+            self.end_headers()
+            self.wfile.write(LARGE_BODY[: len(LARGE_BODY) // 2])
+            self.close_connection = True
+            return
+
+        start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(LARGE_BODY) - start))
+        self.send_header(
+            "Content-Range", f"bytes {start}-{len(LARGE_BODY) - 1}/{len(LARGE_BODY)}"
+        )
+        self.end_headers()
+        self.wfile.write(LARGE_BODY[start:])
+
+    def send_gzip(self, honour_identity):
+        self.request_headers.append(
+            (self.headers.get("Accept-Encoding"), self.headers.get("Range"))
+        )
+        identity = self.headers.get("Accept-Encoding") == "identity"
+        body = RANDOM_BODY if honour_identity and identity else GZIP_BODY
+
+        start = 0
+        if self.headers.get("Range") is not None:
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"
+            )
+        else:
+            self.send_response(200)
+            digest = hashlib.sha256(body).digest()
+            self.send_header("Digest", "sha-256=" + base64.b64encode(digest).decode())
+        if body is GZIP_BODY:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        if len(self.request_headers) == 1:
+            # the connection drops halfway through the body
+            self.wfile.write(body[start : len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.request_headers = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_reuse(server):
+    pool = SessionPool()
+
+    for _ in range(3):
+        session = pool.session()
+        assert session.get(server).content == BODY
+        # closing the session keeps the connection in the pool
+        session.close()
+    browser = pool.browser()
+    browser.open(server)
+    assert browser.links()[0]["href"] == "results.csv"
+    browser.close()
+
+    assert pool.stats() == {
+        "127.0.0.1": {"requests": 4, "connections": 1, "reused": 3}
+    }
+    pool.close()
+
+
+def test_download(server, tmp_path):
+    file_name = Path(tmp_path, "page.html")
+
+    sha256 = download(server, file_name)
+
+    assert file_name.read_bytes() == BODY
+    assert sha256 == hashlib.sha256(BODY).hexdigest()
+
+
+def test_download_resumed(server, tmp_path):
+    file_name = Path(tmp_path, "results.bin")
+
+    download(f"{server}flaky", file_name)
+
+    assert file_name.read_bytes() == LARGE_BODY
+    # the second request only asks for the missing half
+    assert Handler.request_headers == [None, f"bytes={len(LARGE_BODY) // 2}-"]
+    assert not Path(f"{file_name}.part").exists()
+
+
+def test_download_identity(server, tmp_path):
+    file_name = Path(tmp_path, "results.bin")
+
+    download(f"{server}gzip", file_name)
+
+    # asked without encoding, the range counts the bytes of the file
+    assert file_name.read_bytes() == RANDOM_BODY
+    assert Handler.request_headers == [
+        ("identity", None),
+        ("identity", f"bytes={len(RANDOM_BODY) // 2}-"),
+    ]
+
+
+def test_download_encoded(server, tmp_path):
+    file_name = Path(tmp_path, "results.bin")
+
+    download(f"{server}gzip-always", file_name)
+
+    # encoded anyway, the interrupted transfer starts over rather than asking
+    #  for a range of the encoded body, whose digest is not checked
+    assert file_name.read_bytes() == RANDOM_BODY
+    assert [headers[1] for headers in Handler.request_headers] == [None, None]
+    assert not Path(f"{file_name}.part").exists()
+
+
+def test_download_corrupted(server, tmp_path):
+    file_name = Path(tmp_path, "page.html")
+
+    with pytest.raises(ServerConnectionException):
+        download(f"{server}corrupt", file_name)
+    with pytest.raises(ServerConnectionException):
+        download(server, file_name, checksum="0" * 64)
+
+    assert not file_name.exists()
+    assert not Path(f"{file_name}.part").exists()
+
+
+def test_download_cancelled(server, tmp_path):
+    file_name = Path(tmp_path, "page.html")
+    token = CancelToken()
+    token.cancel()
+
+    with pytest.raises(JobCancelledException):
+        download(server, file_name, token=token)
+
+    # the partial file is removed
+    assert not file_name.exists()
+
+
+def test_fetch_page(server, monkeypatch):
+    monkeypatch.setattr(session_module, "PAGES", session_module.OrderedDict())
+    monkeypatch.setattr(session_module, "PAGE_CACHE_SIZE", 1)
+
+    assert fetch_page(f"{server}status") == BODY
+    # not modified, the content of the last poll is used
+    assert fetch_page(f"{server}status") == BODY
+    assert Handler.request_headers == [None, '"v1"']
+
+    # pages without validators are not kept
+    assert fetch_page(server) == BODY
+    assert list(session_module.PAGES) == [f"{server}status"]
+
+
+def test_timeout(server):
+    session = TimeoutSession(timeout=(1, 0.2))
+
+    with pytest.raises(ServerConnectionException):
+        session.get(f"{server}slow")
+
+    assert session.get(server).content == BODY
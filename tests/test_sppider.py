@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pytest
 
+from cport.modules.pipeline import process_pool
 from cport.modules.sppider import Sppider
 
 
@@ -47,6 +48,19 @@ def test_parse_prediction(sppider, precalc_result):
     assert len(observed_result_dic["passive"]) == 0
 
 
+def test_parse_in_process(sppider, precalc_result):
+    pool = process_pool(1)
+
+    observed_result_dic = pool.submit(
+        Sppider.parse, precalc_result.read_bytes()
+    ).result()
+    pool.shutdown()
+
+    assert observed_result_dic == sppider.parse_prediction(
+        page_text=precalc_result.read_text()
+    )
+
+
 @pytest.mark.skip("Overlaps with previous")
 def test_run():
     pass
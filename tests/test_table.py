@@ -0,0 +1,82 @@
+"""Test the prediction tables."""
+import copy
+import pickle
+
+import numpy as np
+
+from cport.modules.table import ACTIVE, DTYPE, PASSIVE, PredictionTable, as_table
+
+PREDICTION = {"active": [[1, 0.9], [3, 0.05]], "passive": [[2, 0.1], [3, 0.2]]}
+
+
+def test_from_masks():
+    residues = np.array([1, 2, 3, 4])
+    scores = np.array([0.9, 0.1, 0.7, np.nan])
+    active = scores >= 0.5
+
+    table = PredictionTable.from_masks(residues, scores, active, residues == 2)
+    assert table.to_dict() == {"active": [[1, 0.9], [3, 0.7]], "passive": [[2, 0.1]]}
+    # python scalars, the predictions are saved as json
+    assert type(table["active"][0][0]) is int
+
+    table = PredictionTable.from_masks(
+        residues, scores, active, ~active, passive_scores=False
+    )
+    assert table["passive"] == [2, 4]
+
+
+def test_from_dict():
+    table = PredictionTable.from_dict(PREDICTION)
+
+    assert table.data.dtype == DTYPE
+    assert table.labels.tolist() == [ACTIVE, ACTIVE, PASSIVE, PASSIVE]
+    # float32 scores, given back as the decimals they were read from
+    assert table.scores.dtype == np.float32
+    assert table == PREDICTION
+    assert "active" in table
+
+    unscored = {"active": [5, 6], "passive": []}
+    assert as_table(unscored).to_dict() == unscored
+
+
+def test_serialize():
+    table = PredictionTable.from_dict(PREDICTION)
+
+    assert len(table.to_bytes()) == 4 * DTYPE.itemsize
+    assert PredictionTable.from_bytes(table.to_bytes()) == table
+    assert pickle.loads(pickle.dumps(table)) == table
+    assert copy.deepcopy(table) == table
+
+
+def test_merge():
+    first = PredictionTable.from_dict({"active": [1], "passive": []})
+    second = PredictionTable.from_dict({"active": [], "passive": [2]})
+
+    assert PredictionTable.merge([first, second]) == {"active": [1], "passive": [2]}
+    assert PredictionTable.merge([]).size == 0
+
+
+def test_remap():
+    table = PredictionTable.from_dict(PREDICTION)
+
+    assert table.shift(10)["active"] == [[11, 0.9], [13, 0.05]]
+    assert table.remap([3, 1], [30, 10]) == {
+        "active": [[10, 0.9], [30, 0.05]],
+        "passive": [[2, 0.1], [30, 0.2]],
+    }
+    # only the active residue 3 is renumbered
+    assert table.remap([3], [30], label=ACTIVE)["passive"] == [[2, 0.1], [3, 0.2]]
+    # the table itself is not modified
+    assert table == PREDICTION
+
+
+def test_renumber():
+    table = PredictionTable.from_dict({"active": [1, 2], "passive": [3]})
+
+    renumbered = table.renumber(
+        np.array([10, 11, 11]), np.array([b"", b"", b"A"]), keep=[True, False, True]
+    )
+
+    assert renumbered.residues.tolist() == [10, 11]
+    assert renumbered.icodes.tolist() == [b"", b"A"]
+    assert renumbered.labels.tolist() == [ACTIVE, PASSIVE]
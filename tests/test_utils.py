@@ -11,6 +11,8 @@ from cport.modules.utils import (
     get_fasta_from_pdbid,
     get_pdb_from_pdbid,
     get_residue_range,
+    prediction_matrix,
+    standardize_residues,
 )
 
 
@@ -58,6 +60,23 @@ def test_format_output(test_result_dic, pdb_file = "tests/test_data/1PPE.pdb", c
     os.unlink(output_f)
 
 
+def test_prediction_matrix(pdb_file="tests/test_data/1PPE.pdb", chain_id="E"):
+    result_dic = {
+        "ispred4": {"active": [[17, 0.9]], "passive": [[16, 0.1], [17, 0.2]]},
+        "cons_ppisp": {"active": [[18, 0.5]], "passive": [16]},
+        "sppider": {"active": [16, 18], "passive": [16]},
+    }
+
+    output_df = prediction_matrix(result_dic, pdb_file, chain_id)
+
+    assert list(output_df.columns) == ["predictor", 16, 17, 18]
+    assert output_df.values.tolist() == [
+        ["ispred4", "0.1", "0.9", "-"],
+        ["cons_ppisp", "P", "-", "0.5"],
+        ["sppider", "AP", "-", "A"],
+    ]
+
+
 def test_get_residue_range(test_result_dic):
 
     observed_residue_list = get_residue_range(test_result_dic)
@@ -65,3 +84,23 @@ def test_get_residue_range(test_result_dic):
 
     assert isinstance(observed_residue_list, list)
     assert observed_residue_list == expected_residue_list
+
+
+def test_standardize_residues(pdb_file="tests/test_data/1PPE.pdb", chain_id="E"):
+    result_dic = {
+        # the 20th amino acid follows the gap at 35-36, the 164th is 184A
+        "scriber": {"active": [[20, 0.9], [164, 0.8]], "passive": [[1, 0.1]]},
+        # psiver numbers the sequence with its gaps
+        "psiver": {"active": [[20, 0.9]], "passive": [[500, 0.1]]},
+        "ispred4": {"active": [[20, 0.9]], "passive": []},
+        "something": {"active": [1], "passive": []},
+    }
+
+    standardized_dic = standardize_residues(result_dic, chain_id, pdb_file)
+
+    assert standardized_dic["scriber"].residues.tolist() == [37, 184, 16]
+    assert standardized_dic["scriber"].icodes.tolist() == [b"", b"A", b""]
+    # the residues outside the sequence are left out
+    assert standardized_dic["psiver"] == {"active": [[35, 0.9]], "passive": []}
+    assert standardized_dic["ispred4"] == {"active": [[20, 0.9]], "passive": []}
+    assert standardized_dic["something"] == {"active": [16], "passive": []}
@@ -1,9 +1,17 @@
 # Test if the whiscy prediction is working
+import tempfile
+from pathlib import Path
+
 import pytest
 
+from cport.modules import whiscy as whiscy_module
+from cport.modules.pipeline import process_pool
 from cport.modules.whiscy import Whiscy
 
 
+PDB_FILE = Path("tests/test_data/1PPE.pdb").resolve()
+
+
 @pytest.fixture
 def whiscy():
     yield Whiscy("tests/test_data/1PPE.pdb", "E")
@@ -15,6 +23,32 @@ def test_submit(whiscy):
     assert isinstance(summary_url, str)
 
 
+def test_submit_files(monkeypatch, tmp_path):
+    (tmp_path / "work").mkdir()
+    (tmp_path / "temp").mkdir()
+    monkeypatch.chdir(tmp_path / "work")
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "temp"))
+    copies = []
+
+    def qblast(*args, **kwargs):
+        (copy,) = (tmp_path / "temp").glob("cport_whiscy_*/*")
+        copies.append(copy)
+        raise OSError("no BLAST")
+
+    monkeypatch.setattr(whiscy_module.NCBIWWW, "qblast", qblast)
+
+    for chain_id in ("E", "I"):
+        with pytest.raises(OSError):
+            Whiscy(PDB_FILE, chain_id).submit()
+
+    # each job works in its own directory, removed when it is done
+    assert [copy.name for copy in copies] == ["1PPE_whiscy.pdb"] * 2
+    assert copies[0].parent != copies[1].parent
+    assert not any(copy.parent.exists() for copy in copies)
+    assert list((tmp_path / "temp").iterdir()) == []
+    assert list((tmp_path / "work").iterdir()) == []
+
+
 def test_retrieve_prediction(whiscy):
     page_text = (
         '<textarea class="form-control" cols="100" id="active_list" name="active_list"'
@@ -36,6 +70,20 @@ def test_retrieve_prediction(whiscy):
     assert len(observed_prediction["passive"]) == 66
 
 
+def test_parse_in_process():
+    page = (
+        b'<p id="active_list">10,12,15</p>'
+        b'<p id="passive_list">11,13</p>'
+    )
+    pool = process_pool(1)
+
+    observed_result_dic = pool.submit(Whiscy.parse, page).result()
+    pool.shutdown()
+
+    assert observed_result_dic["active"] == [10, 12, 15]
+    assert observed_result_dic["passive"] == [11, 13]
+
+
 @pytest.mark.skip("Overlaps with previous")
 def test_run(whiscy):
     pass